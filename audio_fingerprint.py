@@ -0,0 +1,166 @@
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# ================= 配置区 =================
+SAMPLE_RATE = 16000
+FRAME_SIZE = 2048       # 128ms 分析窗
+HOP_SIZE = 256          # 16ms 步长，切片边界对不齐时也能找到对应帧
+NUM_BANDS = 33          # 33 个频带 -> 每帧 32 bit 子指纹
+BAND_LOW_HZ = 300
+BAND_HIGH_HZ = 3000
+INDEX_STRIDE = 4        # 入库时每 4 帧建一次倒排，查询时用全部帧，内存减为 1/4
+MIN_RMS = 0.003         # 低于此能量视为静音，不做指纹 (交给 VAD)
+
+
+# ================= 指纹提取 =================
+
+def _band_edges():
+    """对数间隔的频带边界 (FFT bin 下标)"""
+    hz = np.geomspace(BAND_LOW_HZ, BAND_HIGH_HZ, NUM_BANDS + 1)
+    return np.round(hz * FRAME_SIZE / SAMPLE_RATE).astype(np.int64)
+
+
+_EDGES = _band_edges()
+_WINDOW = np.hanning(FRAME_SIZE).astype(np.float32)
+_BIT_WEIGHTS = (1 << np.arange(NUM_BANDS - 1, dtype=np.uint64)).astype(np.uint64)
+
+
+def fingerprint(audio):
+    """
+    Haitsma-Kalker 风格的频谱指纹：每帧比较相邻频带能量差在时间上的变化，得到 32 bit。
+    返回 uint32 数组；音频过短或几乎静音时返回 None。
+    """
+    if len(audio) < FRAME_SIZE * 2:
+        return None
+    if float(np.sqrt(np.mean(audio * audio))) < MIN_RMS:
+        return None
+
+    n_frames = 1 + (len(audio) - FRAME_SIZE) // HOP_SIZE
+    frames = np.lib.stride_tricks.as_strided(
+        audio, shape=(n_frames, FRAME_SIZE),
+        strides=(audio.strides[0] * HOP_SIZE, audio.strides[0])
+    )
+    spec = np.abs(np.fft.rfft(frames * _WINDOW, axis=1)) ** 2
+    energy = np.add.reduceat(spec[:, _EDGES[0]:_EDGES[-1]], _EDGES[:-1] - _EDGES[0], axis=1)[:, :NUM_BANDS]
+
+    band_diff = energy[:, :-1] - energy[:, 1:]
+    bits = (band_diff[1:] - band_diff[:-1]) > 0
+    return (bits.astype(np.uint64) @ _BIT_WEIGHTS).astype(np.uint32)
+
+
+def bit_error_rate(a, b):
+    """两段等长指纹的误码率"""
+    xor = np.bitwise_xor(a, b)
+    return float(np.unpackbits(xor.view(np.uint8)).sum()) / (len(a) * 32)
+
+
+# ================= 指纹缓存 =================
+
+class FingerprintEntry:
+    __slots__ = ("fp", "text", "room", "created", "last_hit", "hits")
+
+    def __init__(self, fp, text, room):
+        self.fp = fp
+        self.text = text            # None 表示已知的非语音 (BGM / 音效)
+        self.room = room
+        self.created = time.time()
+        self.last_hit = self.created
+        self.hits = 0
+
+
+class FingerprintCache:
+    """
+    最近音频的指纹索引：命中后直接复用转写结果，或按已知非语音跳过 VAD 和 Whisper。
+    按最近命中时间做 LRU 淘汰，同时超过 ttl 没被命中的条目也会过期。
+    线程安全，可以在多个直播间的转写线程之间共享 (联动时同一段声音只转一次)。
+    """
+
+    def __init__(self, max_entries=1000, ttl=3600, ber_threshold=0.2, min_coverage=0.8):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.ber_threshold = ber_threshold
+        self.min_coverage = min_coverage
+        self.entries = OrderedDict()    # entry_id -> FingerprintEntry，按最近使用排序
+        self.index = {}                 # 子指纹 -> [(entry_id, 帧下标), ...]
+        self.next_id = 0
+        self.lock = threading.Lock()
+        self.stats = {"lookups": 0, "speech_hits": 0, "nonspeech_hits": 0, "cross_room_hits": 0, "evicted": 0}
+
+    def add(self, fp, text, room):
+        if fp is None:
+            return
+        with self.lock:
+            entry_id = self.next_id
+            self.next_id += 1
+            self.entries[entry_id] = FingerprintEntry(fp, text, room)
+            for i in range(0, len(fp), INDEX_STRIDE):
+                self.index.setdefault(int(fp[i]), []).append((entry_id, i))
+            self._evict()
+
+    def lookup(self, fp, room):
+        """返回命中的 FingerprintEntry，没有命中返回 None"""
+        if fp is None:
+            return None
+        with self.lock:
+            self.stats["lookups"] += 1
+            self._evict()
+
+            # 1. 子指纹精确命中投票，得到 (条目, 对齐偏移) 候选
+            votes = {}
+            for qi, value in enumerate(fp.tolist()):
+                for entry_id, ei in self.index.get(value, ()):
+                    key = (entry_id, ei - qi)
+                    votes[key] = votes.get(key, 0) + 1
+            if not votes:
+                return None
+
+            # 2. 对票数最高的几个候选做整段误码率校验
+            for (entry_id, offset), _ in sorted(votes.items(), key=lambda kv: -kv[1])[:3]:
+                entry = self.entries[entry_id]
+                q_start = max(0, -offset)
+                e_start = q_start + offset
+                length = min(len(fp) - q_start, len(entry.fp) - e_start)
+                if length <= 0 or length < self.min_coverage * len(fp):
+                    continue
+                if bit_error_rate(fp[q_start:q_start + length], entry.fp[e_start:e_start + length]) > self.ber_threshold:
+                    continue
+
+                entry.hits += 1
+                entry.last_hit = time.time()
+                self.entries.move_to_end(entry_id)
+                self.stats["nonspeech_hits" if entry.text is None else "speech_hits"] += 1
+                if entry.room != room:
+                    self.stats["cross_room_hits"] += 1
+                return entry
+            return None
+
+    def _evict(self):
+        """先淘汰过期条目，再按 LRU 把数量压到上限以内 (调用方已持锁)"""
+        now = time.time()
+        while self.entries:
+            entry_id, entry = next(iter(self.entries.items()))
+            if len(self.entries) <= self.max_entries and now - entry.last_hit <= self.ttl:
+                break
+            self.entries.popitem(last=False)
+            for i in range(0, len(entry.fp), INDEX_STRIDE):
+                bucket = self.index.get(int(entry.fp[i]))
+                if bucket:
+                    bucket[:] = [x for x in bucket if x[0] != entry_id]
+                    if not bucket:
+                        del self.index[int(entry.fp[i])]
+            self.stats["evicted"] += 1
+
+    def report(self):
+        s = self.stats
+        hits = s["speech_hits"] + s["nonspeech_hits"]
+        rate = hits / s["lookups"] * 100 if s["lookups"] else 0.0
+        return (f"🔁 [指纹] 命中率 {rate:.1f}% ({hits}/{s['lookups']}) | "
+                f"复用转写 {s['speech_hits']} | 跳过非语音 {s['nonspeech_hits']} | "
+                f"跨房间 {s['cross_room_hits']} | 缓存 {len(self.entries)} 条 | 已淘汰 {s['evicted']}")
+
+
+# 进程内共享的默认缓存
+shared_cache = FingerprintCache()
@@ -0,0 +1,353 @@
+import os
+import re
+import glob
+import json
+import time
+import argparse
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+import hw_probe
+import model_store
+import keyword_matcher
+import hallucination_detector
+import segment_record
+import speech_archive
+
+# ================= 配置区 =================
+# 模型大小与精度：默认读取 hw_probe.py 为本机 CPU 缓存的最佳配置
+MODEL_SIZE = None
+COMPUTE_TYPE = None
+THREADS_PER_WORKER = 2        # 每个进程的 CTranslate2 线程数；进程数默认 = CPU 核数 / 它
+BEAM_SIZE = 5
+SAMPLE_RATE = 16000
+MAX_SPAN_SECONDS = 28         # 送给 Whisper 的一段最长多少秒 (模型窗口 30 秒)
+MAX_GAP_SECONDS = 1.5         # 相邻两段语音间隔不超过这么多就并进同一段
+MIN_SPEECH_SECONDS = 0.5      # 太短的语音段不送 Whisper
+READ_BLOCK_SECONDS = 120      # 每次从 ffmpeg 读多少秒做 VAD，整场录像不用一次读进内存
+BOUNDARY_GUARD_SECONDS = 3.0  # 块末尾这么多秒内结束的段留到下一块 (可能被块边界截断)
+IN_FLIGHT_PER_WORKER = 4      # 每个进程最多排队的段数 (限制内存)
+PROGRESS_EVERY = 30           # 秒：打印一次进度
+CHECKPOINT_SUFFIX = ".batch.ckpt"   # 断点：每写完一段追加一行 (已完成到的直播流秒 + 两个输出文件的长度)
+
+# 过滤词 (与 GUI 脚本一致)
+IGNORE_KEYWORDS = [
+    "by bwd6", "字幕by", "Amara.org", "优优独播剧场", "compared compared",
+    "YoYo Television", "不吝点赞", "订阅我的频道", "Copyright", "The following content"
+]
+
+RECORD_NAME_RE = re.compile(r"^live_record_(?P<room>\d+)_(?P<ts>\d+)")
+
+
+# ================= 工作进程 =================
+
+_worker_model = None
+
+
+def _init_worker(model_path, compute_type, threads):
+    """每个工作进程只加载一次模型"""
+    global _worker_model
+    from faster_whisper import WhisperModel
+    _worker_model = WhisperModel(model_path, device="cpu", compute_type=compute_type, cpu_threads=threads)
+
+
+def _transcribe_span(index, offset, pcm):
+    """在工作进程里转写一段 (int16 字节)，segment 转成 dict 传回主进程"""
+    audio = np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+    t0 = time.time()
+    segments, info = _worker_model.transcribe(
+        audio,
+        beam_size=BEAM_SIZE,
+        language="zh",
+        vad_filter=False,
+        condition_on_previous_text=False,   # 各段独立，乱序执行也不影响结果
+        no_speech_threshold=0.4,
+        log_prob_threshold=-0.8,
+    )
+    segs = [{"start": s.start, "end": s.end, "text": s.text, "avg_logprob": s.avg_logprob,
+             "compression_ratio": s.compression_ratio, "no_speech_prob": s.no_speech_prob} for s in segments]
+    return index, offset, len(audio) / SAMPLE_RATE, segs, time.time() - t0
+
+
+# ================= 切分 =================
+
+def group_spans(timestamps, max_span=MAX_SPAN_SECONDS, max_gap=MAX_GAP_SECONDS, min_speech=MIN_SPEECH_SECONDS):
+    """VAD 区间 (采样点) -> 送给 Whisper 的段 [(start, end)]：间隔短的合并，单段不超过 max_span 秒"""
+    max_len, gap = int(max_span * SAMPLE_RATE), int(max_gap * SAMPLE_RATE)
+    groups = []
+    for ts in timestamps:
+        start, end = ts["start"], ts["end"]
+        if groups and start - groups[-1][1] <= gap and end - groups[-1][0] <= max_len:
+            groups[-1][1] = end
+            continue
+        # 连续说很久的单个区间按 max_span 硬切
+        while end - start > max_len:
+            groups.append([start, start + max_len])
+            start += max_len
+        groups.append([start, end])
+    return [(s, e) for s, e in groups if e - s >= min_speech * SAMPLE_RATE]
+
+
+def iter_media_spans(path, start=0.0):
+    """解码录像音轨，边读边做 VAD，按顺序产出 (直播流秒, int16 音频)"""
+    from faster_whisper.vad import get_speech_timestamps, VadOptions
+    options = VadOptions(min_silence_duration_ms=500, speech_pad_ms=200)
+    cmd = ["ffmpeg", "-v", "error", "-ss", str(start), "-i", path,
+           "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "-"]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    block = READ_BLOCK_SECONDS * SAMPLE_RATE * 2
+    guard = int(BOUNDARY_GUARD_SECONDS * SAMPLE_RATE)
+    buf = np.zeros(0, np.int16)
+    buf_offset = start          # buf[0] 在直播流里的秒数
+    try:
+        while True:
+            data = proc.stdout.read(block)
+            eof = len(data) < block
+            if data:
+                buf = np.concatenate([buf, np.frombuffer(data[:len(data) - len(data) % 2], np.int16)])
+            if len(buf) == 0:
+                break
+            groups = group_spans(get_speech_timestamps(buf.astype(np.float32) / 32768.0, options))
+            cut = len(buf)
+            for s, e in groups:
+                if not eof and e > len(buf) - guard:
+                    cut = s     # 可能被块边界截断，连同后面的音频留到下一块重新 VAD
+                    break
+                yield buf_offset + s / SAMPLE_RATE, buf[s:e]
+            if eof:
+                break
+            cut = min(cut, len(buf) - guard)
+            buf = buf[cut:]
+            buf_offset += cut / SAMPLE_RATE
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+def iter_archive_spans(path, start=0.0):
+    """
+    语音归档已经只剩语音：按直播流时间重新分组，间隔短的用静音补齐后合并。
+    断点 start 落在某段语音中间时只取断点之后的部分，已经转写过的不再送进 Whisper。
+    """
+    archive = speech_archive.SpeechArchive(path)
+    max_len = int(MAX_SPAN_SECONDS * SAMPLE_RATE)
+    group, group_offset, group_end = [], 0.0, 0.0
+    for offset, audio in archive.iter_spans(start=start):
+        if offset < start:
+            skip = int(round((start - offset) * SAMPLE_RATE))
+            audio, offset = audio[skip:], offset + skip / SAMPLE_RATE
+            if not len(audio):
+                continue
+        pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+        for i in range(0, len(pcm), max_len):
+            piece, piece_offset = pcm[i:i + max_len], offset + i / SAMPLE_RATE
+            gap = piece_offset - group_end
+            if group and gap <= MAX_GAP_SECONDS and piece_offset + len(piece) / SAMPLE_RATE - group_offset <= MAX_SPAN_SECONDS:
+                group += [np.zeros(max(0, int(gap * SAMPLE_RATE)), np.int16), piece]
+            else:
+                if group:
+                    yield group_offset, np.concatenate(group)
+                group, group_offset = [piece], piece_offset
+            group_end = piece_offset + len(piece) / SAMPLE_RATE
+    if group:
+        yield group_offset, np.concatenate(group)
+
+
+# ================= 会话信息与断点 =================
+
+def session_info(path, streamer=None):
+    """主播名、房间号、开录时间：优先读对应的会话清单，其次从文件名推断"""
+    name = os.path.basename(path)
+    stem = name.split(".")[0]
+    for manifest_path in glob.glob(os.path.join(os.path.dirname(path) or ".", "*.manifest.json")):
+        try:
+            m = segment_record.read_manifest(manifest_path)
+        except (OSError, ValueError):
+            continue
+        if m.get("batch"):
+            continue
+        record = os.path.basename(m.get("record_file") or "").split(".")[0]
+        if record == stem or os.path.basename(m.get("speech_archive") or "") == name:
+            return streamer or m.get("streamer") or "unknown", str(m.get("room")), int(m.get("started_at")), \
+                m.get("record_start_time") or m.get("started_at")
+    m = RECORD_NAME_RE.match(name)
+    if m:
+        return streamer or "unknown", m.group("room"), int(m.group("ts")), float(m.group("ts"))
+    if name.endswith(speech_archive.ARCHIVE_SUFFIX):
+        meta = segment_record.parse_log_name(name[:-len(speech_archive.ARCHIVE_SUFFIX)] + ".txt")
+        if meta:
+            return streamer or meta[0], meta[1], meta[2], float(meta[2])
+    ts = int(os.path.getmtime(path))
+    return streamer or "unknown", "0", ts, float(ts)
+
+
+def load_checkpoint(path):
+    """最后一行完整的断点 (崩溃时最后一行可能只写了一半)"""
+    state = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    state = json.loads(line)
+                except ValueError:
+                    break
+    return state
+
+
+def truncate(path, size):
+    """把输出截回断点记录的长度：断点之后写了一半的内容丢掉重做，保证不重复不缺行"""
+    if os.path.exists(path):
+        with open(path, "r+b") as f:
+            f.truncate(size)
+
+
+# ================= 批量转写 =================
+
+def transcribe_file(path, pool, workers, model_name, matcher, streamer=None, out_dir=None):
+    streamer, room, session_ts, start_wall = session_info(path, streamer)
+    session_id = f"{room}_{session_ts}"
+    log_base = os.path.join(out_dir or os.path.dirname(path) or ".", f"{streamer}_{room}_batch_log_{session_ts}")
+    log_file, records_file = log_base + ".txt", log_base + ".jsonl"
+    ckpt_path = log_base + CHECKPOINT_SUFFIX
+
+    ckpt = load_checkpoint(ckpt_path)
+    if ckpt.get("finished"):
+        print(f"✅ 已转写过，跳过: {path} -> {log_file}")
+        return
+    done_until = ckpt.get("done_until", 0.0)
+    if ckpt:
+        truncate(log_file, ckpt["log_size"])
+        truncate(records_file, ckpt["records_size"])
+        print(f"⏯️ 从断点继续: {path} ({done_until:.0f}s 之后)")
+    else:
+        for p in (log_file, records_file):
+            truncate(p, 0)
+    print(f"📝 {path} -> {log_file}")
+
+    is_archive = path.endswith(speech_archive.ARCHIVE_SUFFIX)
+    spans = iter_archive_spans(path, done_until) if is_archive else iter_media_spans(path, done_until)
+    log_f = open(log_file, "a", encoding="utf-8")
+    rec_f = open(records_file, "a", encoding="utf-8")
+    ckpt_f = open(ckpt_path, "a", encoding="utf-8")
+    t0 = last_report = time.time()
+    audio_done = speech_done = 0.0
+    lines = 0
+    results = {}
+    inflight = set()
+    next_index = 0
+
+    def write_ready():
+        """按顺序写出已经转写完的段，每写完一段追加一行断点"""
+        nonlocal next_index, audio_done, speech_done, lines
+        while next_index in results:
+            index, offset, duration, segs, latency = results.pop(next_index)
+            next_index += 1
+            # 每个 segment 单独一行，时间轴比整段更细 (过滤规则与实时转写相同)
+            for seg in segs:
+                verdict = hallucination_detector.judge_segment(seg)
+                seg_text = verdict.text
+                if verdict.action == "drop" or len(seg_text) <= 1:
+                    continue
+                if any(e.kind == "ignore" for e in matcher.match(seg_text)):
+                    continue
+                record = segment_record.SegmentRecord.from_segments(room, session_id, offset, model_name, seg_text, [seg], [verdict], latency)
+                record.wall_time = start_wall + record.stream_offset
+                hms = time.strftime("%H:%M:%S", time.localtime(record.wall_time))
+                log_f.write(f"[{hms}] (🚀{latency:.2f}s) {seg_text}\n")
+                rec_f.write(record.to_json() + "\n")
+                lines += 1
+            log_f.flush()
+            rec_f.flush()
+            audio_done = offset + duration - done_until
+            speech_done += duration
+            ckpt_f.write(json.dumps({"done_until": round(offset + duration, 3), "log_size": log_f.tell(),
+                                     "records_size": rec_f.tell()}) + "\n")
+            ckpt_f.flush()
+
+    def collect(block):
+        nonlocal inflight, last_report
+        if block:
+            done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+        else:
+            done = {f for f in inflight if f.done()}
+            inflight -= done
+        for fut in done:
+            result = fut.result()
+            results[result[0]] = result
+        write_ready()
+        if time.time() - last_report >= PROGRESS_EVERY:
+            last_report = time.time()
+            elapsed = last_report - t0
+            print(f"⏱️ {os.path.basename(path)}: 已完成到 {done_until + audio_done:.0f}s，{lines} 行，"
+                  f"{audio_done / elapsed:.1f} 倍实时 (语音 {speech_done / elapsed:.1f} 倍)")
+
+    try:
+        for index, (offset, pcm) in enumerate(spans):
+            while len(inflight) >= workers * IN_FLIGHT_PER_WORKER:
+                collect(block=True)
+            inflight.add(pool.submit(_transcribe_span, index, offset, pcm.tobytes()))
+            collect(block=False)
+        while inflight:
+            collect(block=True)
+        ckpt_f.write(json.dumps({"done_until": round(done_until + audio_done, 3), "log_size": log_f.tell(),
+                                 "records_size": rec_f.tell(), "finished": True}) + "\n")
+    finally:
+        log_f.close()
+        rec_f.close()
+        ckpt_f.close()
+    segment_record.update_manifest(
+        log_base + ".manifest.json",
+        session=session_id,
+        room=room,
+        streamer=streamer,
+        model=model_name,
+        started_at=session_ts,
+        record_start_time=start_wall,
+        **({"speech_archive": path} if is_archive else {"record_file": path}),
+        log_file=log_file,
+        records_file=records_file,
+        batch=True,
+    )
+    elapsed = time.time() - t0
+    print(f"✅ {path}: {lines} 行，{audio_done / 60:.1f} 分钟音频用时 {elapsed / 60:.1f} 分钟 "
+          f"({audio_done / max(elapsed, 1e-6):.1f} 倍实时)")
+
+
+# ================= 命令行 =================
+
+def main():
+    parser = argparse.ArgumentParser(description="离线批量转写录像 / 语音归档 (多进程，可断点续跑)")
+    parser.add_argument("paths", nargs="+", help="录像 (live_record_*.mp4 等) 或语音归档 (*.speech.opus)，支持通配符")
+    parser.add_argument("--workers", type=int, default=0, help="工作进程数，默认 CPU 核数 / 每进程线程数")
+    parser.add_argument("--threads", type=int, default=THREADS_PER_WORKER, help="每个进程的线程数")
+    parser.add_argument("--model", default=MODEL_SIZE, help="模型大小，默认用 hw_probe 的 CPU 配置")
+    parser.add_argument("--compute-type", default=COMPUTE_TYPE)
+    parser.add_argument("--streamer", default=None, help="主播名 (没有会话清单时用于日志文件名)")
+    parser.add_argument("--out-dir", default=None, help="输出目录，默认与输入文件相同")
+    args = parser.parse_args()
+
+    paths = sorted({p for pattern in args.paths for p in (glob.glob(pattern) or [pattern])})
+    paths = [p for p in paths if os.path.isfile(p) and not p.endswith(speech_archive.INDEX_SUFFIX)]
+    if not paths:
+        print("⚠️ 没有找到要转写的文件")
+        return
+
+    model_size, compute_type = args.model, args.compute_type
+    if not model_size or not compute_type:
+        probed_size, probed_type = hw_probe.get_profile("cpu")
+        model_size, compute_type = model_size or probed_size, compute_type or probed_type
+    workers = args.workers or max(1, (os.cpu_count() or 2) // args.threads)
+    model_name = f"faster-whisper/{model_size}/{compute_type}"
+    matcher = keyword_matcher.KeywordMatcher({"ignore": IGNORE_KEYWORDS}, fuzzy_kinds=())
+    print(f"🛠 {len(paths)} 个文件，{workers} 个进程 x {args.threads} 线程，模型 {model_size} / {compute_type}")
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(model_store.resolve_faster_whisper(model_size), compute_type, args.threads)) as pool:
+        for path in paths:
+            transcribe_file(path, pool, workers, model_name, matcher, args.streamer, args.out_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import os
+import sys
+import time
+import threading
+import subprocess
+from collections import deque
+
+# ================= 配置区 =================
+DEFAULT_WORKERS = 1           # 同时进行的切片数 (切片只是流复制，一个就够，多了会和转写抢磁盘)
+MERGE_GAP = 10.0              # 秒：两个触发的区间相隔不超过这么多就合并成一个加长切片
+MAX_CLIP_SECONDS = 900        # 合并后切片的最长时长，超过就另起一个
+READY_DELAY = 5.0             # 秒：录像写到结束点之后再多等一会儿 (等下一个关键帧落盘)
+CLIP_NICE = 10                # 切片 ffmpeg 的 nice 值 (macOS / Linux)
+DVR_WAIT_SECONDS = 30.0       # 内存缓冲还没收到结束点的画面时最多再等这么久
+
+# Windows：切片 ffmpeg 以“低于正常”优先级运行
+LOW_PRIORITY_FLAGS = subprocess.BELOW_NORMAL_PRIORITY_CLASS if sys.platform == "win32" else 0
+
+
+def lower_priority(proc, nice=CLIP_NICE):
+    """把已启动的子进程调到低优先级 (Windows 用 LOW_PRIORITY_FLAGS 在创建时指定)"""
+    if nice and hasattr(os, "setpriority"):
+        try:
+            os.setpriority(os.PRIO_PROCESS, proc.pid, nice)
+        except OSError:
+            pass
+
+
+def run_low_priority(cmd, creationflags=0):
+    """以低优先级运行一条命令并等待结束，返回退出码"""
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            creationflags=creationflags | LOW_PRIORITY_FLAGS)
+    lower_priority(proc)
+    return proc.wait()
+
+
+class ClipJob:
+    __slots__ = ("id", "streamer", "start", "end", "source", "created", "ready_at", "triggers", "status", "result", "error")
+
+    def __init__(self, job_id, streamer, start, end, ready_at, source=None):
+        self.id = job_id
+        self.streamer = streamer
+        self.start = start
+        self.end = end
+        self.source = source        # 登记时的录像来源 (录像文件 / 分段索引 / 内存缓冲 / 字幕)，执行时只从这里切
+        self.created = time.time()
+        self.ready_at = ready_at
+        self.triggers = 1
+        self.status = "queued"      # queued / running / done / failed
+        self.result = None
+        self.error = None
+
+    def overlaps(self, start, end, gap):
+        return start - gap <= self.end and end + gap >= self.start
+
+    def describe(self):
+        return f"#{self.id} {self.start:.0f}s ~ {self.end:.0f}s" + (f" (合并 {self.triggers} 次触发)" if self.triggers > 1 else "")
+
+
+class ClipScheduler:
+    """
+    切片任务队列：触发只是登记一个任务，等录像写到结束点才由有界的工作线程执行。
+    排队期间同一主播、区间重叠 (或相隔不超过 merge_gap) 的触发合并成一个加长切片，
+    所以一分钟里喊三次“切片飞来”只会切一次；已在执行或刚切完的切片完全覆盖的触发直接忽略。
+    只有来源 (source) 相同的任务才会合并：停止后马上开始下一场时，上一场排队的任务仍然切上一场的录像。
+    run_job(job) 在工作线程里执行切片，返回 (文件名, 实际开始秒, 实际结束秒)，失败时抛异常或返回 None。
+    """
+
+    def __init__(self, run_job, workers=DEFAULT_WORKERS, merge_gap=MERGE_GAP, max_seconds=MAX_CLIP_SECONDS, ui_queue=None):
+        self.run_job = run_job
+        self.merge_gap = merge_gap
+        self.max_seconds = max_seconds
+        self.ui_queue = ui_queue
+        self.jobs = []              # 排队中的任务
+        self.running = []
+        self.finished = deque(maxlen=20)   # 最近切完的任务，用来忽略被完全覆盖的触发
+        self.stats = {"triggers": 0, "merged": 0, "done": 0, "failed": 0}
+        self._next_id = 1
+        self._cond = threading.Condition()
+        self._threads = [threading.Thread(target=self._worker, name=f"clip-worker-{i}", daemon=True) for i in range(workers)]
+        for t in self._threads:
+            t.start()
+
+    def _notify(self, msg):
+        if self.ui_queue is not None:
+            self.ui_queue.put(msg)
+        print(msg)
+
+    def submit(self, streamer, start, end, ready_at=None, source=None):
+        """登记一次触发；返回承接它的任务 (可能是合并进去的已有任务)"""
+        ready_at = ready_at or time.time()
+        with self._cond:
+            self.stats["triggers"] += 1
+            for job in [*self.running, *self.finished]:
+                if (job.streamer == streamer and job.source == source and job.status != "failed"
+                        and job.start <= start and end <= job.end):
+                    self.stats["merged"] += 1
+                    self._notify(f"🔁 [切片] 已包含在切片 #{job.id} 里")
+                    return job
+            for job in self.jobs:
+                if (job.streamer == streamer and job.source == source and job.overlaps(start, end, self.merge_gap)
+                        and max(end, job.end) - min(start, job.start) <= self.max_seconds):
+                    job.start = min(start, job.start)
+                    job.end = max(end, job.end)
+                    job.ready_at = max(ready_at, job.ready_at)
+                    job.triggers += 1
+                    self.stats["merged"] += 1
+                    self._notify(f"🔁 [切片] 合并进 {job.describe()}")
+                    return job
+            job = ClipJob(self._next_id, streamer, start, end, ready_at, source)
+            self._next_id += 1
+            self.jobs.append(job)
+            self._cond.notify()
+        self._notify(f"✂️ [切片排队] {job.describe()}，录像写到结束点后开始切")
+        return job
+
+    def _take(self):
+        """取出最早就绪的任务；没有就等到最近一个任务就绪"""
+        with self._cond:
+            while True:
+                now = time.time()
+                ready = [j for j in self.jobs if j.ready_at <= now]
+                if ready:
+                    job = min(ready, key=lambda j: j.ready_at)
+                    self.jobs.remove(job)
+                    job.status = "running"
+                    self.running.append(job)
+                    return job
+                timeout = min((j.ready_at for j in self.jobs), default=now + 1.0) - now
+                self._cond.wait(max(0.05, timeout))
+
+    def _worker(self):
+        while True:
+            job = self._take()
+            t0 = time.time()
+            try:
+                job.result = self.run_job(job)
+                if job.result is None:
+                    raise RuntimeError("没有可用的录像数据")
+                job.status = "done"
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+            with self._cond:
+                self.running.remove(job)
+                self.finished.append(job)
+                self.stats[job.status] += 1
+                self._cond.notify_all()
+            if job.status == "done":
+                name, actual_start, actual_end = job.result
+                self._notify(f"✅ [切片完成] #{job.id} {name} ({actual_start:.1f}s ~ {actual_end:.1f}s，用时 {time.time() - t0:.1f}s)")
+            else:
+                self._notify(f"⚠️ [切片失败] #{job.id}: {job.error}")
+
+    def new_session(self):
+        """新的录像开始：时间轴从 0 重新算，旧录像切完的区间不能再拿来忽略触发"""
+        with self._cond:
+            self.finished.clear()
+
+    def pending(self):
+        with self._cond:
+            return len(self.jobs) + len(self.running)
+
+    def flush(self):
+        """录制结束时调用：录像不会再变长，排队的任务不再等待，立即可以执行 (不阻塞)"""
+        now = time.time()
+        with self._cond:
+            for job in self.jobs:
+                job.ready_at = min(job.ready_at, now)
+            self._cond.notify_all()
+
+    def wait_idle(self, timeout=120):
+        """等排队和正在执行的任务全部结束，最多等 timeout 秒"""
+        deadline = time.time() + timeout
+        with self._cond:
+            while (self.jobs or self.running) and time.time() < deadline:
+                self._cond.wait(max(0.05, deadline - time.time()))
+
+    def wait_record(self, record_file, timeout=120):
+        """
+        只等还要读 record_file 这份录像的切片 (排队 + 正在切)，别的录像的任务不管。
+        返回是否都已结束；超时返回 False，调用方不能删这份录像。
+        """
+        def busy():
+            return any(j.source and j.source.get("record_file") == record_file
+                       for j in self.jobs + self.running)
+
+        deadline = time.time() + timeout
+        with self._cond:
+            while busy():
+                if time.time() >= deadline:
+                    return False
+                self._cond.wait(max(0.05, deadline - time.time()))
+            return True
+
+    def report(self):
+        s = self.stats
+        return (f"✂️ [切片] 触发 {s['triggers']} 次 | 合并 {s['merged']} | 完成 {s['done']} | "
+                f"失败 {s['failed']} | 排队 {self.pending()}")
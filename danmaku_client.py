@@ -0,0 +1,588 @@
+import re
+import sys
+import json
+import time
+import zlib
+import queue
+import random
+import socket
+import struct
+import argparse
+import threading
+import urllib.request
+
+import transcript_writer
+
+# ================= 可选依赖 =================
+# 装了 brotli 就让服务器发 brotli 压缩包 (比 zlib 小一截)，没装就退回 zlib
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# ================= 配置区 =================
+DEFAULT_HOST = "broadcastlv.chat.bilibili.com"   # 拿不到服务器列表时用的默认弹幕服务器
+DEFAULT_PORT = 2243
+HEARTBEAT_INTERVAL = 30       # 秒：服务器 60 秒收不到心跳就断开
+RECONNECT_DELAY = 2.0         # 秒：断线重连的初始等待，每次翻倍
+MAX_RECONNECT_DELAY = 60.0
+RECV_SIZE = 1 << 16
+QUEUE_SIZE = 20000            # 等待解码的原始包上限 (满了丢最旧的，网络线程永远不阻塞)
+DECODE_BATCH = 512            # 解码线程每次最多取多少个原始包
+KEEP_KINDS = ("danmu", "superchat", "gift", "guard")   # 要保存的消息类型 (进场 / 点赞量太大，默认不存)
+RECORD_SUFFIX = ".danmaku.jsonl"
+RAW_SUFFIX = ".danmaku.raw"   # 原始包录制 (用 replay 子命令回放)
+
+ROOM_INIT_URL = "https://api.live.bilibili.com/room/v1/Room/room_init?id="
+DANMU_INFO_URL = "https://api.live.bilibili.com/xlive/web-room/v1/index/getDanmuInfo?type=0&id="
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+
+# ================= 协议 =================
+# 每个包：16 字节头 (包长 u32, 头长 u16, 协议版本 u16, 操作码 u32, 序号 u32，大端) + 正文
+HEADER = struct.Struct(">IHHII")
+OP_HEARTBEAT = 2
+OP_HEARTBEAT_REPLY = 3        # 正文是 4 字节人气值
+OP_MESSAGE = 5
+OP_AUTH = 7
+OP_AUTH_REPLY = 8
+PROTO_JSON = 0
+PROTO_INT = 1
+PROTO_ZLIB = 2                # 正文是 zlib 压缩的若干个完整包
+PROTO_BROTLI = 3
+
+# cmd -> 记录类型；DANMU_MSG 会带后缀 (DANMU_MSG:4:0:2:2:2:0)，按冒号前的部分查
+CMD_KINDS = {
+    "DANMU_MSG": "danmu",
+    "SEND_GIFT": "gift",
+    "SUPER_CHAT_MESSAGE": "superchat",
+    "GUARD_BUY": "guard",
+    "INTERACT_WORD": "enter",
+    "LIKE_INFO_V3_CLICK": "like",
+}
+_CMD_RE = re.compile(rb'"cmd"\s*:\s*"([^":]+)')
+
+RAW_ENTRY = struct.Struct(">dI")   # 原始包录制：接收时间 + 包长，后面跟整个包
+
+
+def pack(op, body=b"", proto=PROTO_INT):
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return HEADER.pack(HEADER.size + len(body), HEADER.size, proto, op, 1) + body
+
+
+def split_packets(data):
+    """把一段首尾完整的字节拆成 (协议版本, 操作码, 正文)"""
+    pos, n = 0, len(data)
+    view = memoryview(data)
+    while pos + HEADER.size <= n:
+        length, header_len, proto, op, _ = HEADER.unpack_from(data, pos)
+        if length < header_len:
+            break
+        yield proto, op, view[pos + header_len:pos + length]
+        pos += length
+
+
+class PacketReader:
+    """TCP 流 -> 完整的外层包 (一次 recv 可能有半个包，也可能有几十个)"""
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    def feed(self, data):
+        self.buf += data
+        packets = []
+        pos = 0
+        while len(self.buf) - pos >= HEADER.size:
+            length = HEADER.unpack_from(self.buf, pos)[0]
+            if length < HEADER.size:
+                raise ValueError(f"包长异常: {length}")
+            if len(self.buf) - pos < length:
+                break
+            packets.append(bytes(self.buf[pos:pos + length]))
+            pos += length
+        del self.buf[:pos]
+        return packets
+
+
+# ================= 解码 =================
+
+class DanmakuRecord:
+    """一条弹幕 / 礼物 / SC，stream_offset 和转写记录 (SegmentRecord) 用同一条录像时间轴"""
+    __slots__ = ("stream_offset", "wall_time", "kind", "uid", "user", "text", "value")
+
+    def __init__(self, stream_offset, wall_time, kind, uid=None, user=None, text=None, value=None):
+        self.stream_offset = stream_offset
+        self.wall_time = wall_time
+        self.kind = kind
+        self.uid = uid
+        self.user = user
+        self.text = text
+        self.value = value          # 礼物 / SC / 上舰的金额 (元)
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def to_json(self):
+        d = {k: v for k, v in self.to_dict().items() if v is not None}
+        d["stream_offset"] = round(self.stream_offset, 3)
+        d["wall_time"] = round(self.wall_time, 3)
+        return json.dumps(d, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**{k: d.get(k) for k in cls.__slots__})
+
+
+def parse_message(kind, msg):
+    """一条 JSON 消息 -> (uid, 用户名, 文本, 金额)"""
+    if kind == "danmu":
+        info = msg["info"]
+        return info[2][0], info[2][1], info[1], None
+    data = msg.get("data") or {}
+    if kind == "gift":
+        # total_coin 是金瓜子 (1000 = 1 元)，免费的银瓜子礼物不算钱
+        value = data.get("total_coin", 0) / 1000 if data.get("coin_type") == "gold" else 0.0
+        return data.get("uid"), data.get("uname"), f"{data.get('giftName')}x{data.get('num', 1)}", value
+    if kind == "superchat":
+        return data.get("uid"), (data.get("user_info") or {}).get("uname"), data.get("message"), data.get("price")
+    if kind == "guard":
+        return data.get("uid"), data.get("username"), data.get("gift_name"), data.get("price", 0) / 1000
+    return data.get("uid"), data.get("uname"), None, None
+
+
+def iter_messages(proto, body):
+    """一个外层消息包 -> 若干条 JSON 正文 (bytes)，压缩包解压后再拆"""
+    if proto == PROTO_ZLIB:
+        inner = zlib.decompress(body)
+    elif proto == PROTO_BROTLI:
+        if brotli is None:
+            raise ValueError("收到 brotli 压缩包但没有安装 brotli")
+        inner = brotli.decompress(bytes(body))
+    else:
+        yield body
+        return
+    for p, op, b in split_packets(inner):
+        if op == OP_MESSAGE:
+            yield b
+
+
+def decode_batch(batch, clock, keep=KEEP_KINDS, stats=None):
+    """
+    一批原始包 [(接收时间, 协议版本, 正文), ...] -> [DanmakuRecord, ...]。
+    先用正则从字节里取 cmd，不需要的类型 (进场、点赞、排行榜刷新……) 不做 JSON 解析。
+    """
+    keep = set(keep)
+    records = []
+    for wall, proto, body in batch:
+        offset = clock(wall)
+        try:
+            messages = list(iter_messages(proto, body))
+        except (zlib.error, ValueError, OSError) as e:
+            if stats is not None:
+                stats["errors"] += 1
+            print(f"⚠️ [弹幕] 解压失败: {e}")
+            continue
+        for raw in messages:
+            m = _CMD_RE.search(raw)
+            kind = CMD_KINDS.get(m.group(1).decode("ascii", "replace")) if m else None
+            if stats is not None:
+                stats["messages"] += 1
+            if kind not in keep:
+                continue
+            try:
+                uid, user, text, value = parse_message(kind, json.loads(bytes(raw)))
+            except (ValueError, KeyError, IndexError, TypeError):
+                if stats is not None:
+                    stats["errors"] += 1
+                continue
+            if stats is not None:
+                stats[kind] = stats.get(kind, 0) + 1
+            records.append(DanmakuRecord(offset, wall, kind, uid, user, text, value))
+    return records
+
+
+# ================= 时间轴 =================
+
+class StreamClock:
+    """
+    接收时间 -> 录像秒，锚定在最近读到的一块音频上。
+    转写的录像秒按音频采样数算，直播卡顿、缓冲时会比墙钟 (接收时间 - 开录时间) 越落越多；
+    采集线程每读到一块音频调用 mark(这块结束处的录像秒)，弹幕按 锚点录像秒 + (接收时间 - 锚点时间) 换算，
+    误差不超过一块音频内的抖动，也不会随直播时长累积。还没读到音频时按开录时间推算。
+    """
+
+    def __init__(self, start_wall):
+        self._anchor = (0.0, start_wall)
+
+    def mark(self, stream_offset, wall=None):
+        # 整个元组一次替换，解码线程读到的锚点总是成对的
+        self._anchor = (stream_offset, time.time() if wall is None else wall)
+
+    def __call__(self, wall):
+        offset, at = self._anchor
+        return offset + (wall - at)
+
+
+# ================= 连接 =================
+
+def _get_json(url, timeout=5):
+    req = urllib.request.Request(url, headers={"User-Agent": USER_AGENT, "Referer": "https://live.bilibili.com/"})
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read().decode("utf-8"))
+
+
+def fetch_danmu_info(room_id):
+    """(真实房间号, 服务器, 端口, token)；接口失败时用默认服务器匿名连接 (用户名可能被打码)"""
+    try:
+        real_id = int(_get_json(ROOM_INIT_URL + str(room_id))["data"]["room_id"])
+    except Exception:
+        real_id = int(room_id)
+    try:
+        data = _get_json(DANMU_INFO_URL + str(real_id))["data"]
+        host = data["host_list"][0]
+        return real_id, host["host"], int(host["port"]), data["token"]
+    except Exception:
+        return real_id, DEFAULT_HOST, DEFAULT_PORT, ""
+
+
+class DanmakuClient:
+    """
+    直播间弹幕接收：网络线程只收包、回心跳、把原始包放进有界队列；
+    解码线程成批解压 + 解析，写成 .jsonl 记录 (stream_offset 与转写同一时间轴)。
+    礼物刷屏时每秒几千条也只在解码线程里排队，不会占用音频采集 / 转写线程；
+    解码跟不上时丢最旧的原始包并计数。断线按指数退避自动重连。
+    clock(接收时间) -> 录像秒；delay 为观众的反应时间，对齐时从接收时间里减掉。
+    """
+
+    def __init__(self, room_id, out_path=None, clock=None, ui_queue=None, keep=KEEP_KINDS,
+                 server=None, raw_path=None, delay=0.0, on_records=None):
+        self.room_id = room_id
+        self.out_path = out_path
+        self.keep = keep
+        self.server = server        # (host, port)，指定时跳过房间信息接口 (例如连本地回放服务器)
+        self.ui_queue = ui_queue
+        self.on_records = on_records
+        started = time.time()
+        base_clock = clock or (lambda wall: wall - started)
+        self.clock = lambda wall: base_clock(wall - delay)
+        self.stats = {"packets": 0, "messages": 0, "records": 0, "dropped": 0, "errors": 0, "reconnects": 0, "peak_rate": 0}
+        self.popularity = 0
+        self._writer = transcript_writer.TranscriptWriter(
+            out_path, on_error=ui_queue.put if ui_queue is not None else None) if out_path else None
+        self._raw = open(raw_path, "ab") if raw_path else None
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._stop = threading.Event()
+        self._sock = None
+        self._rate_second = 0
+        self._rate_count = 0
+        self._threads = [threading.Thread(target=self._net_loop, name="danmaku-net", daemon=True),
+                         threading.Thread(target=self._decode_loop, name="danmaku-decode", daemon=True)]
+
+    def _notify(self, msg):
+        if self.ui_queue is not None:
+            self.ui_queue.put(msg)
+        print(msg)
+
+    def start(self):
+        for t in self._threads:
+            t.start()
+        return self
+
+    def close(self, timeout=5):
+        """断开连接，把已收到的包解码写完"""
+        self._stop.set()
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        for t in self._threads:
+            t.join(timeout)
+        if self._writer:
+            self._writer.close()
+        if self._raw:
+            self._raw.close()
+
+    # ---------- 网络线程 ----------
+
+    def _connect(self):
+        if self.server:
+            real_id, (host, port), token = int(self.room_id), self.server, ""
+        else:
+            real_id, host, port, token = fetch_danmu_info(self.room_id)
+        sock = socket.create_connection((host, port), timeout=10)
+        auth = {"uid": 0, "roomid": real_id, "protover": PROTO_BROTLI if brotli else PROTO_ZLIB,
+                "platform": "web", "type": 2, "key": token}
+        sock.sendall(pack(OP_AUTH, json.dumps(auth)))
+        return sock, host, port
+
+    def _net_loop(self):
+        delay = RECONNECT_DELAY
+        while not self._stop.is_set():
+            try:
+                self._sock, host, port = self._connect()
+                delay = RECONNECT_DELAY
+                self._pump(self._sock, host, port)
+            except (OSError, ValueError) as e:
+                if self._stop.is_set():
+                    break
+                self.stats["reconnects"] += 1
+                self._notify(f"⚠️ [弹幕] 连接断开 ({e})，{delay:.0f}s 后重连")
+                self._stop.wait(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+            finally:
+                if self._sock is not None:
+                    try:
+                        self._sock.close()
+                    except OSError:
+                        pass
+                    self._sock = None
+
+    def _pump(self, sock, host, port):
+        sock.settimeout(1.0)
+        reader = PacketReader()
+        next_heartbeat = 0.0
+        while not self._stop.is_set():
+            now = time.time()
+            if now >= next_heartbeat:
+                sock.sendall(pack(OP_HEARTBEAT, "[object Object]"))
+                next_heartbeat = now + HEARTBEAT_INTERVAL
+            try:
+                data = sock.recv(RECV_SIZE)
+            except socket.timeout:
+                continue
+            if not data:
+                raise ConnectionError("服务器关闭了连接")
+            now = time.time()
+            for packet in reader.feed(data):
+                length, header_len, proto, op, _ = HEADER.unpack_from(packet)
+                if op == OP_MESSAGE:
+                    self._offer((now, proto, packet[header_len:]))
+                    if self._raw:
+                        self._raw.write(RAW_ENTRY.pack(now, len(packet)) + packet)
+                elif op == OP_HEARTBEAT_REPLY:
+                    self.popularity = int.from_bytes(packet[header_len:header_len + 4], "big")
+                elif op == OP_AUTH_REPLY:
+                    reply = json.loads(packet[header_len:] or b"{}")
+                    if reply.get("code", 0) != 0:
+                        raise ValueError(f"认证失败: {reply}")
+                    self._notify(f"💬 [弹幕] 已连接 {host}:{port} (房间 {self.room_id})")
+
+    def _offer(self, item):
+        self.stats["packets"] += 1
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._queue.put_nowait(item)
+            self.stats["dropped"] += 1
+
+    # ---------- 解码线程 ----------
+
+    def _decode_loop(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                if self._stop.is_set() and not self._threads[0].is_alive():
+                    break
+                continue
+            while len(batch) < DECODE_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = decode_batch(batch, self.clock, self.keep, self.stats)
+            if not records:
+                continue
+            self.stats["records"] += len(records)
+            self._count_rate(batch[-1][0], len(records))
+            if self._writer:
+                self._writer.write("".join(r.to_json() + "\n" for r in records))
+            if self.on_records:
+                self.on_records(records)
+
+    def _count_rate(self, wall, n):
+        second = int(wall)
+        if second != self._rate_second:
+            self._rate_second, self._rate_count = second, 0
+        self._rate_count += n
+        self.stats["peak_rate"] = max(self.stats["peak_rate"], self._rate_count)
+
+    def report(self):
+        s = self.stats
+        kinds = " / ".join(f"{label} {s.get(kind, 0)}" for kind, label in
+                           (("danmu", "弹幕"), ("gift", "礼物"), ("superchat", "SC"), ("guard", "上舰")) if kind in self.keep)
+        return (f"💬 [弹幕] 保存 {s['records']} 条 ({kinds}) | 峰值 {s['peak_rate']} 条/秒 | "
+                f"丢弃 {s['dropped']} 包 | 解析失败 {s['errors']} | 重连 {s['reconnects']} 次")
+
+
+# ================= 录制与回放 =================
+
+def read_raw(path):
+    """读取原始包录制：产出 (接收时间, 整个包)"""
+    with open(path, "rb") as f:
+        while True:
+            head = f.read(RAW_ENTRY.size)
+            if len(head) < RAW_ENTRY.size:
+                return
+            wall, length = RAW_ENTRY.unpack(head)
+            packet = f.read(length)
+            if len(packet) < length:
+                return
+            yield wall, packet
+
+
+def synth_raw(path, seconds=10, rate=3000, burst=50, proto=PROTO_ZLIB):
+    """生成一段模拟礼物刷屏的原始包录制：每个压缩包装 burst 条消息 (弹幕 / 礼物 / 进场混合)"""
+    compress = brotli.compress if proto == PROTO_BROTLI else zlib.compress
+    t0 = time.time()
+    total = 0
+    with open(path, "wb") as f:
+        for i in range(int(seconds * rate / burst)):
+            inner = []
+            for _ in range(burst):
+                uid = random.randint(1, 10 ** 8)
+                r = random.random()
+                if r < 0.5:
+                    msg = {"cmd": "SEND_GIFT", "data": {"uid": uid, "uname": f"用户{uid}", "giftName": "小心心",
+                                                        "num": 1, "coin_type": "silver", "total_coin": 0}}
+                elif r < 0.8:
+                    msg = {"cmd": "DANMU_MSG:4:0:2:2:2:0", "info": [[0, 1, 25, 16777215, int(time.time() * 1000)],
+                                                                     random.choice(["哈哈哈哈", "切片飞来", "666", "？？？"]),
+                                                                     [uid, f"用户{uid}", 0, 0, 0, 10000, 1, ""]]}
+                else:
+                    msg = {"cmd": "INTERACT_WORD", "data": {"uid": uid, "uname": f"用户{uid}", "msg_type": 1}}
+                inner.append(pack(OP_MESSAGE, json.dumps(msg, ensure_ascii=False), PROTO_JSON))
+            packet = pack(OP_MESSAGE, compress(b"".join(inner)), proto)
+            f.write(RAW_ENTRY.pack(t0 + i * burst / rate, len(packet)) + packet)
+            total += burst
+    return total
+
+
+def serve_replay(path, port, speed=1.0, on_listen=None):
+    """
+    本地回放服务器：接受一个客户端，回认证与心跳，按录制时的间隔 (除以 speed，0 表示不等) 把原始包原样发出去。
+    同一时刻收到的包合在一次 sendall 里，还原真实的突发。
+    port 传 0 时由系统分配空闲端口；开始监听后用实际端口调用 on_listen (测试里拿来连接)。
+    """
+    server = socket.create_server(("127.0.0.1", port))
+    port = server.getsockname()[1]
+    print(f"📡 回放服务器监听 127.0.0.1:{port} ...")
+    if on_listen:
+        on_listen(port)
+    conn, addr = server.accept()
+    server.close()
+    reader = PacketReader()
+    while True:
+        data = conn.recv(RECV_SIZE)
+        if not data:
+            conn.close()
+            return
+        packets = reader.feed(data)
+        if any(HEADER.unpack_from(p)[3] == OP_AUTH for p in packets):
+            break
+    conn.sendall(pack(OP_AUTH_REPLY, '{"code":0}'))
+
+    def answer_heartbeats():
+        r = PacketReader()
+        try:
+            while True:
+                data = conn.recv(RECV_SIZE)
+                if not data:
+                    return
+                for p in r.feed(data):
+                    if HEADER.unpack_from(p)[3] == OP_HEARTBEAT:
+                        conn.sendall(pack(OP_HEARTBEAT_REPLY, (1).to_bytes(4, "big")))
+        except OSError:
+            return
+
+    threading.Thread(target=answer_heartbeats, daemon=True).start()
+    first = prev = None
+    burst = []
+    sent = 0
+    t0 = time.time()
+    for wall, packet in read_raw(path):
+        if prev is not None and wall != prev:
+            conn.sendall(b"".join(burst))
+            sent += len(burst)
+            burst = []
+            if speed > 0:
+                time.sleep(max(0.0, (wall - first) / speed - (time.time() - t0)))
+        first = wall if first is None else first
+        prev = wall
+        burst.append(packet)
+    if burst:
+        conn.sendall(b"".join(burst))
+        sent += len(burst)
+    print(f"✅ 已回放 {sent} 个包，用时 {time.time() - t0:.1f}s")
+    # 先 shutdown：回心跳的线程还阻塞在 recv 上，只 close 不会真正断开，客户端收不到断开
+    try:
+        conn.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    conn.close()
+
+
+# ================= 命令行 =================
+
+def main():
+    parser = argparse.ArgumentParser(description="B 站直播间弹幕接收 / 录制 / 本地回放")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_listen = sub.add_parser("listen", help="连接直播间 (或本地回放服务器)，解码保存弹幕")
+    p_listen.add_argument("room")
+    p_listen.add_argument("--out", default=None, help="保存为 .jsonl 记录")
+    p_listen.add_argument("--raw", default=None, help="同时录制原始包 (回放用)")
+    p_listen.add_argument("--server", default=None, help="host:port，例如 127.0.0.1:22430 (本地回放服务器)")
+    p_listen.add_argument("--seconds", type=float, default=0, help="接收多久后退出，0 表示直到 Ctrl+C")
+    p_listen.add_argument("--all", action="store_true", help="进场 / 点赞也保存")
+    p_listen.add_argument("--quiet", action="store_true", help="不逐条打印")
+    p_replay = sub.add_parser("replay", help="本地回放服务器 (把录制的原始包按原节奏发给客户端)")
+    p_replay.add_argument("raw")
+    p_replay.add_argument("--port", type=int, default=22430, help="0 表示由系统分配 (实际端口会打印出来)")
+    p_replay.add_argument("--speed", type=float, default=1.0, help="回放倍速，0 表示不等待 (压测解码吞吐)")
+    p_synth = sub.add_parser("synth", help="生成模拟礼物刷屏的原始包录制")
+    p_synth.add_argument("raw")
+    p_synth.add_argument("--seconds", type=float, default=10)
+    p_synth.add_argument("--rate", type=int, default=3000, help="每秒消息数")
+    p_synth.add_argument("--brotli", action="store_true")
+    args = parser.parse_args()
+
+    if args.cmd == "synth":
+        if args.brotli and brotli is None:
+            print("⚠️ 没有安装 brotli (pip install brotli)")
+            sys.exit(1)
+        total = synth_raw(args.raw, args.seconds, args.rate, proto=PROTO_BROTLI if args.brotli else PROTO_ZLIB)
+        print(f"✅ 已生成 {total} 条消息 -> {args.raw}")
+    elif args.cmd == "replay":
+        serve_replay(args.raw, args.port, args.speed)
+    elif args.cmd == "listen":
+        server = None
+        if args.server:
+            host, port = args.server.rsplit(":", 1)
+            server = (host, int(port))
+        keep = tuple(CMD_KINDS.values()) if args.all else KEEP_KINDS
+        on_records = None
+        if not args.quiet:
+            on_records = lambda records: print("\n".join(f"[{r.stream_offset:8.1f}s] {r.kind:<9} {r.user}: {r.text}" for r in records))
+        client = DanmakuClient(args.room, args.out, keep=keep, server=server, raw_path=args.raw, on_records=on_records).start()
+        t0 = time.time()
+        try:
+            while not args.seconds or time.time() - t0 < args.seconds:
+                time.sleep(0.2)
+                if server and client.stats["reconnects"]:
+                    break       # 回放服务器放完就断开
+        except KeyboardInterrupt:
+            pass
+        client.close()
+        elapsed = time.time() - t0
+        print(client.report())
+        print(f"⏱️ 解析 {client.stats['messages']} 条消息，{client.stats['messages'] / max(elapsed, 1e-6):.0f} 条/秒 (含等待)")
+
+
+if __name__ == "__main__":
+    main()
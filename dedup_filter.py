@@ -0,0 +1,114 @@
+import re
+import time
+import zlib
+from collections import deque
+
+# ================= 配置区 =================
+SHINGLE_SIZE = 2         # 中文短句用 2 字 shingle 最稳
+MIN_OVERLAP_CHARS = 4    # 与上一句首尾重叠至少这么多字才做拼接去重
+MIN_CONTAIN_SHINGLES = 4 # 较短的一句少于这么多个 shingle 时不按包含度判断 ("谢谢" 不算 "谢谢大家的礼物" 的重复)
+
+_PUNCT_RE = re.compile(r"[\s\.,!?;:'\"，。！？、；：“”‘’…~～（）()\[\]【】-]+")
+
+
+def shingles(text, n=SHINGLE_SIZE):
+    """去掉标点空白后的字符 n-gram，用 crc32 哈希成整数集合，比较时只做整数集合运算"""
+    text = _PUNCT_RE.sub("", text.lower())
+    if len(text) < n:
+        return {zlib.crc32(text.encode("utf-8"))} if text else set()
+    return {zlib.crc32(text[i:i + n].encode("utf-8")) for i in range(len(text) - n + 1)}
+
+
+def strip_overlap(prev, text, min_chars=MIN_OVERLAP_CHARS):
+    """上一句的结尾与这一句的开头重叠时 (切片边界的重复)，去掉这一句开头的重叠部分"""
+    for k in range(min(len(prev), len(text)), min_chars - 1, -1):
+        if prev.endswith(text[:k]):
+            return text[k:]
+    return text
+
+
+class NearDuplicateFilter:
+    """
+    滑动时间窗内的近似重复过滤，替代只能识别“与上一句完全相同”的 text != last_text。
+    - 与窗口内任一句的 shingle 包含度 >= threshold：视为重复，丢弃
+      (较短的一句太短时改用 共有数 / 较长一句 的相似度，短句不会因为是长句的子串就被吞掉)
+    - 新句明显更长且包含旧句：视为扩写，去掉与旧句的首尾重叠后保留；去掉后只剩不到两个字的按重复丢弃，单独计数
+    """
+
+    def __init__(self, window_seconds=120, threshold=0.8, max_lines=200):
+        self.window_seconds = window_seconds
+        self.threshold = threshold
+        self.max_lines = max_lines
+        self.recent = deque()    # (时间, 行号, shingle 集合, 原文)
+        self.index = {}          # shingle 哈希 -> {行号, ...}
+        self.next_id = 0
+        self.stats = {"checked": 0, "suppressed": 0, "merged": 0, "absorbed": 0}
+
+    def _expire(self, now):
+        while self.recent and (now - self.recent[0][0] > self.window_seconds or len(self.recent) > self.max_lines):
+            _, line_id, sh, _ = self.recent.popleft()
+            for h in sh:
+                bucket = self.index.get(h)
+                if bucket is not None:
+                    bucket.discard(line_id)
+                    if not bucket:
+                        del self.index[h]
+
+    def check(self, text, now=None):
+        """返回 (动作, 文本)：动作为 new / merge / duplicate，merge 时返回去掉重叠后的文本"""
+        now = time.time() if now is None else now
+        self._expire(now)
+        self.stats["checked"] += 1
+
+        sh = shingles(text)
+        if not sh:
+            return "new", text
+
+        # 倒排索引统计与窗口内每一句的共有 shingle 数，只和有交集的句子比较
+        common = {}
+        for h in sh:
+            for line_id in self.index.get(h, ()):
+                common[line_id] = common.get(line_id, 0) + 1
+
+        action = "new"
+        merged_with = None
+        for _, line_id, other, other_text in self.recent:
+            n_common = common.get(line_id)
+            if not n_common:
+                continue
+            shorter, longer = sorted((len(sh), len(other)))
+            containment = n_common / (shorter if shorter >= MIN_CONTAIN_SHINGLES else longer)
+            if containment < self.threshold:
+                continue
+            if len(sh) > len(other) * 1.5:
+                action = "merge"
+                merged_with = other_text
+            else:
+                action = "duplicate"
+                break
+
+        if action == "duplicate":
+            self.stats["suppressed"] += 1
+            return action, text
+
+        if action == "merge":
+            stripped = strip_overlap(merged_with, text)
+            if len(stripped.strip()) <= 1:
+                # 扩写部分只剩标点或一个字：整句其实就是旧句，按重复丢弃
+                self.stats["absorbed"] += 1
+                return "duplicate", text
+            self.stats["merged"] += 1
+            text = stripped
+
+        line_id = self.next_id
+        self.next_id += 1
+        self.recent.append((now, line_id, sh, text))
+        for h in sh:
+            self.index.setdefault(h, set()).add(line_id)
+        return action, text
+
+    def report(self):
+        s = self.stats
+        rate = s["suppressed"] / s["checked"] * 100 if s["checked"] else 0.0
+        return (f"♻️ [去重] 已过滤近似重复 {s['suppressed']}/{s['checked']} 句 ({rate:.1f}%)，拼接扩写 {s['merged']} 句，"
+                f"扩写去重叠后为空而丢弃 {s['absorbed']} 句")
@@ -0,0 +1,183 @@
+import bisect
+import threading
+import subprocess
+from collections import deque
+
+import segment_recorder
+
+# ================= 配置区 =================
+DEFAULT_SECONDS = 240         # 内存里保留最近多少秒 (切片往前 3 分钟 + 余量)
+DEFAULT_MAX_MB = 256          # 字节上限，码率再高也不会超过
+READ_SIZE = segment_recorder.TS_PACKET * 512   # 每次从 ffmpeg 读约 94 KB
+
+
+class DvrBuffer:
+    """
+    最近几分钟直播画面的内存环形缓冲。
+    直播流原始字节由 tee() 同时送给录像 ffmpeg 和这里的 ffmpeg (流复制成 MPEG-TS)，
+    TS 分块按到达顺序存进 deque，同时记录关键帧 (录像秒 -> 全局字节位置)；
+    超过时长或字节上限就从最旧的一块开始丢。切片直接从内存取字节，不碰磁盘上正在增长的录像，
+    没有录像文件 (只监听音频) 时也能切。
+    """
+
+    def __init__(self, seconds=DEFAULT_SECONDS, max_mb=DEFAULT_MAX_MB, creationflags=0):
+        self.seconds = seconds
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.creationflags = creationflags
+        self.chunks = deque()       # (全局起始位置, bytes)
+        self.keyframes = deque()    # (录像秒, 全局位置)
+        self.start_pos = 0          # 最旧一块的全局位置
+        self.end_pos = 0
+        self.base_pts = None        # 第一个关键帧的 PTS = 录像时间 0
+        self.pat = b""              # 最新的 PAT / PMT 包，切片开头补上
+        self.pmt = b""
+        self.lock = threading.Lock()
+        self._pmt_pid = None
+        self._proc = None
+        self._reader = None
+
+    # ---------- 写入 ----------
+
+    def start(self):
+        cmd = ["ffmpeg", "-v", "error", "-i", "pipe:0", "-c", "copy", "-f", "mpegts", "-flush_packets", "1", "pipe:1"]
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                      stderr=subprocess.DEVNULL, creationflags=self.creationflags)
+        self._reader = threading.Thread(target=self._read_loop, name="dvr-reader", daemon=True)
+        self._reader.start()
+
+    def tee(self, src, dst):
+        """把 streamlink 的输出原样转给录像 ffmpeg (dst)，同时喂给缓冲；任意一端断开就结束"""
+        try:
+            while True:
+                data = src.read1(READ_SIZE)
+                if not data:
+                    break
+                dst.write(data)
+                dst.flush()
+                self.feed(data)
+        except (BrokenPipeError, OSError, ValueError):
+            pass
+        finally:
+            for f in (dst, self._proc.stdin if self._proc else None):
+                try:
+                    if f:
+                        f.close()
+                except OSError:
+                    pass
+
+    def feed(self, data):
+        if self._proc is None:
+            return
+        try:
+            self._proc.stdin.write(data)
+            self._proc.stdin.flush()
+        except (BrokenPipeError, OSError, ValueError):
+            # 缓冲进程挂了只影响内存切片，录像照常
+            self._proc = None
+
+    def _read_loop(self):
+        pending = b""
+        while True:
+            data = self._proc.stdout.read1(READ_SIZE) if self._proc else b""
+            if not data:
+                break
+            data = pending + data
+            cut = len(data) - len(data) % segment_recorder.TS_PACKET
+            pending = data[cut:]
+            if cut:
+                self._append(data[:cut])
+
+    def _append(self, data):
+        info = {"pat": None, "pmt": None, "keyframes": []}
+        self._pmt_pid = segment_recorder.scan_ts(data, info, self._pmt_pid)
+        with self.lock:
+            pos = self.end_pos
+            self.chunks.append((pos, data))
+            self.end_pos += len(data)
+            if info["pat"] is not None:
+                self.pat = data[info["pat"]:info["pat"] + segment_recorder.TS_PACKET]
+            if info["pmt"] is not None:
+                self.pmt = data[info["pmt"]:info["pmt"] + segment_recorder.TS_PACKET]
+            for pts, off in info["keyframes"]:
+                if self.base_pts is None:
+                    self.base_pts = pts
+                sec = ((pts - self.base_pts) % segment_recorder.PTS_WRAP) / segment_recorder.PTS_HZ
+                self.keyframes.append((sec, pos + off))
+            self._evict()
+
+    def _evict(self):
+        while len(self.chunks) > 1 and (
+                self.end_pos - self.start_pos > self.max_bytes
+                or (len(self.keyframes) > 1 and self.keyframes[-1][0] - self.keyframes[0][0] > self.seconds)):
+            pos, data = self.chunks.popleft()
+            self.start_pos = pos + len(data)
+            while self.keyframes and self.keyframes[0][1] < self.start_pos:
+                self.keyframes.popleft()
+
+    def close(self):
+        """停掉缓冲进程；已缓冲的内容保留，停播后仍可切片"""
+        proc, self._proc = self._proc, None
+        if proc:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+            try:
+                proc.wait(timeout=3)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    def is_live(self):
+        """还在接收直播数据 (close 之前)"""
+        return self._proc is not None
+
+    # ---------- 切片 ----------
+
+    def span(self):
+        """缓冲覆盖的录像时间 (最旧关键帧秒, 最新关键帧秒)，没有数据时返回 None"""
+        with self.lock:
+            if not self.keyframes:
+                return None
+            return self.keyframes[0][0], self.keyframes[-1][0]
+
+    def covers(self, start):
+        span = self.span()
+        return span is not None and span[0] <= start
+
+    def duration(self):
+        span = self.span()
+        return span[1] if span else 0.0
+
+    def clip(self, start, end, out_path, cues=(), creationflags=0, nice=0):
+        """
+        从内存切出 [start, end] (按关键帧取整)。缓冲里已经没有 start 时返回 None，由调用方改从录像切。
+        返回 (实际开始秒, 实际结束秒)；ffmpeg 失败时抛 RuntimeError。
+        """
+        with self.lock:
+            times = [k[0] for k in self.keyframes]
+            if not times or times[0] > start:
+                return None
+            first = bisect.bisect_right(times, start) - 1
+            last = bisect.bisect_left(times, end)
+            actual_start, s_pos = self.keyframes[first]
+            if last < len(times):
+                actual_end, e_pos = self.keyframes[last]
+            else:
+                actual_end, e_pos = times[-1], self.end_pos
+            # bytes 不可变，只取切片引用，锁外再慢慢写给 ffmpeg
+            parts = [self.pat + self.pmt]
+            for pos, data in self.chunks:
+                if pos + len(data) <= s_pos:
+                    continue
+                if pos >= e_pos:
+                    break
+                parts.append(memoryview(data)[max(0, s_pos - pos):min(len(data), e_pos - pos)])
+        rc = segment_recorder.write_clip(parts, actual_start, actual_end, out_path, cues, creationflags or self.creationflags, nice)
+        if rc != 0:
+            raise RuntimeError(f"ffmpeg 切片失败 (退出码 {rc}): {out_path}")
+        return actual_start, actual_end
+
+    def report(self):
+        span = self.span()
+        held = (span[1] - span[0]) if span else 0.0
+        return f"📼 [DVR] 内存缓冲最近 {held:.0f}s / {(self.end_pos - self.start_pos) / 1024 / 1024:.1f} MB"
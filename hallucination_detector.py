@@ -0,0 +1,209 @@
+import re
+import json
+import math
+import argparse
+from collections import namedtuple
+
+from segment_record import parse_log_line
+
+# ================= 配置区 =================
+# 综合得分 >= DROP_SCORE 直接丢弃，>= FLAG_SCORE 保留但在控制台标记
+DROP_SCORE = 0.8
+FLAG_SCORE = 0.5
+
+# 各信号的权重 (噪声或合成：任一信号很强就足以判定)
+WEIGHTS = {
+    "logprob": 0.6,        # 解码置信度低
+    "compression": 0.9,    # 压缩比高 = 文本高度重复
+    "no_speech": 0.9,      # 模型自己认为没人说话，且置信度也不高
+    "repetition": 0.85,    # 字符 n-gram 大量重复
+    "speech_rate": 0.7,    # 长时间音频只吐出几个字 (典型的 "字幕by" 片尾幻觉)
+}
+
+# 循环短语：2~12 个字的片段连续出现 3 次以上
+LOOP_RE = re.compile(r"(.{2,12}?)\1{2,}")
+# 同一个字连续出现 (笑声 "哈哈哈哈"、拖长音 "啊啊啊")，属于正常口语，不算复读
+CHAR_RUN_RE = re.compile(r"(.)\1{2,}")
+
+Verdict = namedtuple("Verdict", ["action", "score", "reasons", "text"])
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + math.exp(-x))
+
+
+# ================= 文本信号 =================
+
+def repetition_ratio(text, n=3):
+    """重复的字符 n-gram 占比：正常口语一般在 0.2 以下，复读循环接近 1"""
+    text = CHAR_RUN_RE.sub(r"\1\1", re.sub(r"\s+", "", text))
+    if len(text) < n * 3:
+        return 0.0
+    grams = [text[i:i + n] for i in range(len(text) - n + 1)]
+    return 1.0 - len(set(grams)) / len(grams)
+
+
+def collapse_loops(text):
+    """把连续复读的短语收敛成一次，例如 "谢谢大家谢谢大家谢谢大家" -> "谢谢大家" """
+    def _collapse(m):
+        unit = m.group(1)
+        return m.group(0) if len(set(unit)) == 1 else unit
+    return LOOP_RE.sub(_collapse, text)
+
+
+# ================= 打分 =================
+
+def segment_signals(segment):
+    """同时兼容 faster-whisper 的 Segment 对象和 mlx_whisper 返回的 dict"""
+    get = segment.get if isinstance(segment, dict) else (lambda k, d=None: getattr(segment, k, d))
+    return {
+        "text": get("text", "") or "",
+        "avg_logprob": get("avg_logprob"),
+        "compression_ratio": get("compression_ratio"),
+        "no_speech_prob": get("no_speech_prob"),
+        "start": get("start"),
+        "end": get("end"),
+    }
+
+
+def score_segment(text, avg_logprob=None, compression_ratio=None, no_speech_prob=None, start=None, end=None):
+    """返回 (得分 0~1, 触发的信号列表)，得分越高越像幻觉；缺失的信号不参与计算"""
+    features = {}
+    if avg_logprob is not None:
+        features["logprob"] = _sigmoid((-avg_logprob - 0.8) / 0.15)
+    if compression_ratio is not None:
+        features["compression"] = _sigmoid((compression_ratio - 2.4) / 0.2)
+    if no_speech_prob is not None:
+        confidence_low = _sigmoid((-(avg_logprob if avg_logprob is not None else -1.0) - 0.5) / 0.2)
+        features["no_speech"] = no_speech_prob * confidence_low
+    features["repetition"] = _sigmoid((repetition_ratio(text) - 0.5) / 0.08)
+    if start is not None and end is not None and end - start > 2.0:
+        chars_per_sec = len(text.strip()) / (end - start)
+        features["speech_rate"] = _sigmoid((1.0 - chars_per_sec) / 0.25)
+
+    keep_prob = 1.0
+    reasons = []
+    for name, value in features.items():
+        keep_prob *= 1.0 - WEIGHTS[name] * value
+        if value > 0.5:
+            reasons.append(name)
+    return 1.0 - keep_prob, reasons
+
+
+def judge_segment(segment):
+    """对单个 segment 给出 keep / flag / drop 结论，并顺手收敛复读循环"""
+    sig = segment_signals(segment)
+    text = sig.pop("text").strip()
+    score, reasons = score_segment(text, **sig)
+    cleaned = collapse_loops(text)
+    if cleaned != text:
+        reasons.append("loop")
+    if score >= DROP_SCORE:
+        action = "drop"
+    elif score >= FLAG_SCORE or cleaned != text:
+        action = "flag"
+    else:
+        action = "keep"
+    return Verdict(action, score, reasons, cleaned)
+
+
+def filter_segments(segments):
+    """过滤一组 segment，返回 (拼接后的文本, 每个 segment 的 Verdict 列表)"""
+    verdicts = [judge_segment(seg) for seg in segments]
+    text = "".join(v.text for v in verdicts if v.action != "drop").strip()
+    return text, verdicts
+
+
+# ================= 离线评估 =================
+
+def evaluate(log_files, labels_file=None):
+    """
+    在历史日志上统计误判率。历史日志已经过旧的关键词过滤，绝大多数是真实发言，
+    所以被判 drop 的比例可以看作误杀率的上界；若提供人工标注的幻觉行文件，则精确计算。
+    历史日志没有解码器信号，这里只评估文本侧的信号。
+    """
+    known_bad = set()
+    if labels_file:
+        with open(labels_file, "r", encoding="utf-8") as f:
+            known_bad = {line.strip() for line in f if line.strip()}
+
+    total = dropped = flagged = false_pos = true_pos = bad_seen = 0
+    samples = []
+    for path in log_files:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                parsed = parse_log_line(line)
+                if not parsed:
+                    continue
+                text = parsed[2]
+                total += 1
+                verdict = judge_segment({"text": text})
+                is_bad = text in known_bad
+                bad_seen += is_bad
+                if verdict.action == "drop":
+                    dropped += 1
+                    if is_bad:
+                        true_pos += 1
+                    else:
+                        false_pos += 1
+                        if len(samples) < 20:
+                            samples.append((verdict.score, text))
+                elif verdict.action == "flag":
+                    flagged += 1
+
+    if not total:
+        print("⚠️ 没有解析到任何日志行")
+        return
+    good = total - bad_seen
+    print(f"📊 共 {total} 行 | drop {dropped} ({dropped / total * 100:.2f}%) | flag {flagged} ({flagged / total * 100:.2f}%)")
+    print(f"📊 误杀率: {false_pos / max(good, 1) * 100:.2f}% ({false_pos}/{good})")
+    if known_bad:
+        print(f"📊 标注幻觉召回: {true_pos}/{bad_seen}")
+    for score, text in samples:
+        print(f"   [{score:.2f}] {text}")
+
+
+def evaluate_labelled(path):
+    """
+    在带解码器信号的标注集上评估 (.jsonl，每行 label 为 good / bad，其余字段同 segment_signals)。
+    返回统计字典：误杀率 = 被 drop 的 good / good 总数，召回率 = 被 drop 的 bad / bad 总数。
+    """
+    stats = {"good": 0, "bad": 0, "false_drop": 0, "false_flag": 0, "true_drop": 0, "true_flag": 0}
+    misses = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            label = row.pop("label")
+            verdict = judge_segment(row)
+            stats[label] += 1
+            prefix = "true" if label == "bad" else "false"
+            if verdict.action in ("drop", "flag"):
+                stats[f"{prefix}_{verdict.action}"] += 1
+            if (verdict.action == "drop") != (label == "bad"):
+                misses.append((label, verdict.action, verdict.score, row["text"]))
+    stats["false_positive_rate"] = stats["false_drop"] / max(stats["good"], 1)
+    stats["recall"] = stats["true_drop"] / max(stats["bad"], 1)
+    stats["misses"] = misses
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用历史日志或标注集评估幻觉检测器的误判率")
+    parser.add_argument("logs", nargs="*", help="历史日志 .txt 文件")
+    parser.add_argument("--labels", default=None, help="人工标注的幻觉行 (每行一句)")
+    parser.add_argument("--labelled", default=None, help="带解码器信号的标注集 .jsonl (例如 tests/fixtures/hallucination_labelled.jsonl)")
+    args = parser.parse_args()
+    if args.labelled:
+        st = evaluate_labelled(args.labelled)
+        print(f"📊 正常 {st['good']} 句 | 误杀 {st['false_drop']} ({st['false_positive_rate'] * 100:.2f}%) | 误标记 {st['false_flag']}")
+        print(f"📊 幻觉 {st['bad']} 句 | 丢弃 {st['true_drop']} (召回 {st['recall'] * 100:.1f}%) | 仅标记 {st['true_flag']}")
+        for label, action, score, text in st["misses"]:
+            print(f"   [{label} -> {action} {score:.2f}] {text}")
+    if args.logs:
+        evaluate(args.logs, args.labels)
+
+
+if __name__ == "__main__":
+    main()
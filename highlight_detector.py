@@ -0,0 +1,236 @@
+import os
+import re
+import json
+import math
+import argparse
+from collections import deque
+
+import segment_record
+import term_analytics
+
+# ================= 配置区 =================
+STATE_FILE = "highlight_baseline.json"   # 各房间的基线 (跨场累计，下一场不用重新热身)
+BASELINE_HALF_LIFE = 600.0    # 秒：基线的半衰期，十分钟前的状态权重减半
+WARMUP_SECONDS = 300.0        # 基线至少积累这么久 (直播流秒) 才开始报高光
+THRESHOLD = 4.0               # 平滑后得分超过它就开始一段高光
+END_RATIO = 0.5               # 得分跌到 THRESHOLD * END_RATIO 以下才算结束 (滞回，避免抖动)
+SMOOTH_CHUNKS = 3             # 得分按最近几段取平均
+Z_CAP = 4.0                   # 单项信号最多贡献这么多个标准差，防止一项异常值独占得分
+KEYWORD_BONUS = 6.0           # 每命中一个高光关键词直接加分 (不和基线比较)
+PRE_ROLL_SECONDS = 30         # 切片从高光开始前多少秒切起
+POST_ROLL_SECONDS = 5
+MAX_HIGHLIGHT_SECONDS = 120   # 高光持续超过这么久就先切一段，后面接着算下一段 (不冷却)
+COOLDOWN_SECONDS = 60         # 一段高光结束后至少隔这么久才报下一段
+
+# 各项信号的权重与标准差下限 (基线几乎不变时，一点波动不至于被放大成很多个标准差)
+SIGNALS = {
+    "speech": {"weight": 1.0, "min_std": 0.10, "label": "语音密度"},
+    "chars": {"weight": 1.0, "min_std": 0.50, "label": "语速"},
+    "excite": {"weight": 1.5, "min_std": 0.50, "label": "笑声/感叹"},
+    "trend": {"weight": 1.0, "min_std": 0.50, "label": "热词"},
+}
+
+# 笑声与感叹 (按出现次数计，同一处连续的只算一次)
+EXCITE_RE = re.compile(r"哈{3,}|[嘿呵嘻]{3,}|笑死|绷不住|卧槽|我靠|我去|天哪|牛逼|666+|啊{3,}|[!！?？]{2,}")
+
+
+def count_excite(text):
+    return len(EXCITE_RE.findall(text)) if text else 0
+
+
+class Highlight:
+    __slots__ = ("start", "end", "peak", "reasons")
+
+    def __init__(self, start, end, peak, reasons):
+        self.start = start          # 直播流秒 (已含 PRE_ROLL / POST_ROLL)
+        self.end = end
+        self.peak = peak
+        self.reasons = reasons      # 贡献最大的信号 (中文标签)
+
+    def describe(self):
+        return f"{self.start:.0f}s ~ {self.end:.0f}s (峰值 {self.peak:.1f}，{'/'.join(self.reasons)})"
+
+
+class RoomBaseline:
+    """一个房间的滚动基线：每项信号的指数加权均值 / 方差，外加当前一场的高光状态"""
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.mean = {k: state.get("mean", {}).get(k, 0.0) for k in SIGNALS}
+        self.var = {k: state.get("var", {}).get(k, 0.0) for k in SIGNALS}
+        self.seconds = state.get("seconds", 0.0)    # 基线累计看过的直播流秒数
+        self.reset()
+
+    def reset(self):
+        """新的一场：基线保留，平滑窗口与进行中的高光清空"""
+        self.recent = deque(maxlen=SMOOTH_CHUNKS)
+        self.recent_sum = 0.0
+        self.episode = None         # [开始秒, 结束秒, 峰值, {信号: 累计贡献}]
+        self.cooldown_until = -1.0
+
+    def score(self, features):
+        """各项信号相对基线的标准分 (只计高于均值的部分)"""
+        parts = {}
+        for k, cfg in SIGNALS.items():
+            std = max(math.sqrt(self.var[k]), cfg["min_std"])
+            parts[k] = cfg["weight"] * min(Z_CAP, max(0.0, (features[k] - self.mean[k]) / std))
+        return parts
+
+    def update(self, features, duration):
+        """指数加权更新均值与方差；alpha 按这段的时长换算，段长不一也保持同样的半衰期"""
+        alpha = 1.0 - 0.5 ** (duration / BASELINE_HALF_LIFE)
+        for k in SIGNALS:
+            diff = features[k] - self.mean[k]
+            incr = alpha * diff
+            self.mean[k] += incr
+            self.var[k] = (1.0 - alpha) * (self.var[k] + diff * incr)
+        self.seconds += duration
+
+    def to_state(self):
+        return {"mean": self.mean, "var": self.var, "seconds": self.seconds}
+
+
+class HighlightDetector:
+    """
+    流式高光检测：每段音频 (约 8 秒) 调用一次 observe()，按语音密度、语速、笑声 / 感叹、
+    热词命中和高光关键词打分，和房间的滚动基线比较；得分持续偏高的一段时间作为候选高光返回。
+    每段的开销固定 (几个浮点运算 + 一次正则扫描)，与已直播的时长无关。
+    热词集合由调用方定期用 set_trending() 更新 (TermAnalytics.trending 的结果)。
+    """
+
+    def __init__(self, threshold=THRESHOLD):
+        self.threshold = threshold
+        self.rooms = {}
+        self.trending = {}          # 房间 -> 当前趋势词集合
+        self.stats = {"chunks": 0, "highlights": 0}
+
+    def room(self, room):
+        room = str(room)
+        base = self.rooms.get(room)
+        if base is None:
+            base = self.rooms[room] = RoomBaseline()
+        return base
+
+    def new_session(self, room):
+        self.room(room).reset()
+        self.stats = {"chunks": 0, "highlights": 0}
+
+    def set_trending(self, room, items):
+        """items: TermAnalytics.trending() 的结果或词列表"""
+        self.trending[str(room)] = {t[0] if isinstance(t, tuple) else t for t in items}
+
+    def observe(self, room, offset, duration, speech_seconds, text="", keyword_hits=0):
+        """
+        登记一段音频：offset / duration 为直播流秒，speech_seconds 为 VAD 判出的语音时长，
+        text 为这段最终保留的转写 (没有就传空)。有高光结束时返回 Highlight，否则返回 None。
+        """
+        base = self.room(room)
+        duration = max(duration, 1e-3)
+        trending = self.trending.get(str(room))
+        features = {
+            "speech": min(1.0, speech_seconds / duration),
+            "chars": len(text) / duration,
+            "excite": count_excite(text),
+            "trend": len(term_analytics.extract_terms(text) & trending) if text and trending else 0,
+        }
+        parts = base.score(features)
+        raw = sum(parts.values()) + KEYWORD_BONUS * keyword_hits
+        if keyword_hits:
+            parts["keyword"] = KEYWORD_BONUS * keyword_hits
+        warm = base.seconds >= WARMUP_SECONDS
+        base.update(features, duration)
+        self.stats["chunks"] += 1
+
+        # 最近几段的滑动平均 (固定长度窗口，维护累加和)
+        if len(base.recent) == base.recent.maxlen:
+            base.recent_sum -= base.recent[0]
+        base.recent.append(raw)
+        base.recent_sum += raw
+        smoothed = base.recent_sum / len(base.recent)
+        end = offset + duration
+
+        ep = base.episode
+        if ep is None:
+            if warm and smoothed >= self.threshold and offset >= base.cooldown_until:
+                base.episode = [offset, end, smoothed, dict(parts)]
+            return None
+        ep[1] = end
+        ep[2] = max(ep[2], smoothed)
+        for k, v in parts.items():
+            ep[3][k] = ep[3].get(k, 0.0) + v
+        if smoothed < self.threshold * END_RATIO:
+            return self._close(base)
+        if end - ep[0] < MAX_HIGHLIGHT_SECONDS:
+            return None
+        # 太长先切一段；得分还高说明高光没结束，下一段从这里无缝接上，不进冷却
+        highlight = self._close(base, cooldown=False)
+        base.episode = [end, end, smoothed, {}]
+        return highlight
+
+    def _close(self, base, cooldown=True):
+        start, end, peak, contrib = base.episode
+        base.episode = None
+        base.cooldown_until = end + COOLDOWN_SECONDS if cooldown else end
+        labels = {**{k: v["label"] for k, v in SIGNALS.items()}, "keyword": "关键词"}
+        reasons = [labels[k] for k, v in sorted(contrib.items(), key=lambda kv: -kv[1]) if v > 0][:2]
+        self.stats["highlights"] += 1
+        return Highlight(max(0.0, start - PRE_ROLL_SECONDS), end + POST_ROLL_SECONDS, peak, reasons)
+
+    def report(self):
+        return f"🌟 [高光] 检测 {self.stats['chunks']} 段 | 候选高光 {self.stats['highlights']} 段"
+
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({room: base.to_state() for room, base in self.rooms.items()}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, threshold=THRESHOLD):
+        obj = cls(threshold)
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    obj.rooms = {room: RoomBaseline(state) for room, state in json.load(f).items()}
+            except (OSError, ValueError):
+                print(f"⚠️ [高光] 基线文件损坏，重新积累: {path}")
+        return obj
+
+
+# ================= 命令行 =================
+
+def main():
+    parser = argparse.ArgumentParser(description="用已有的 .jsonl 记录回放高光检测 (调阈值用，不切片)")
+    parser.add_argument("records", nargs="+", help=".jsonl 结构化记录，按时间顺序传入")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--keywords", nargs="*", default=[], help="高光关键词")
+    parser.add_argument("--state", default=None, help="从这个基线文件开始 (不会写回)")
+    args = parser.parse_args()
+
+    detector = HighlightDetector.load(args.state, args.threshold) if args.state else HighlightDetector(args.threshold)
+    terms = term_analytics.TermAnalytics()
+    for path in args.records:
+        session = None
+        last_end = None
+        for rec in segment_record.read_jsonl(path):
+            if rec.session != session:
+                session = rec.session
+                detector.new_session(rec.room)
+                last_end = None
+            # 记录只覆盖有转写的段：与上一条之间的空档按一段静音计入
+            if last_end is not None and rec.stream_offset - last_end > 1.0:
+                detector.observe(rec.room, last_end, rec.stream_offset - last_end, 0.0)
+            duration = rec.duration or 1.0
+            terms.add(rec.room, rec.session, rec.text, rec.wall_time)
+            if detector.stats["chunks"] % 20 == 0:
+                detector.set_trending(rec.room, terms.trending(rec.room, key=rec.session))
+            hits = sum(rec.text.count(k) for k in args.keywords)
+            hl = detector.observe(rec.room, rec.stream_offset, duration, duration, rec.text, hits)
+            last_end = rec.stream_offset + duration
+            if hl:
+                print(f"🌟 {os.path.basename(path)}: {hl.describe()}")
+    print(detector.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import os
+import sys
+import json
+import time
+import glob
+import platform
+import argparse
+import subprocess
+
+import numpy as np
+
+import model_store
+
+# ================= 配置区 =================
+# 探测结果缓存 (按机器区分，多台节点可以共用同一个文件)
+PROFILE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hw_profile.json")
+
+# 候选模型，从大到小：优先保证精度，跑不动再降级
+CANDIDATE_MODELS = ["large-v3", "medium", "small", "base"]
+
+# 各设备上值得一试的精度
+CANDIDATE_COMPUTE_TYPES = {
+    "cuda": ["float16", "int8_float16", "int8", "int8_float32", "float32"],
+    "cpu": ["int8", "int8_float32", "float32"],
+}
+
+# 实时率目标：转写 1 秒音频最多花 0.5 秒，给 VAD 和排队留足余量
+TARGET_RTF = 0.5
+
+# 参考音频时长 (秒)，与直播切片长度一致
+REF_CLIP_SECONDS = 8
+
+# 没有探测结果时的兜底配置 (与原先手调的一致)
+DEFAULT_PROFILE = {
+    "cuda": ("large-v3", "int8_float16"),
+    "cpu": ("small", "int8"),
+}
+
+
+# ================= 机器识别 =================
+
+def machine_key(device):
+    """生成当前机器的唯一标识 (主机名 + CPU + GPU)"""
+    gpu_name = ""
+    if device == "cuda":
+        try:
+            import torch
+            gpu_name = torch.cuda.get_device_name(0)
+        except Exception:
+            gpu_name = "cuda"
+    return f"{platform.node()}|{platform.machine()}|{os.cpu_count()}|{device}|{gpu_name}"
+
+
+def supported_compute_types(device):
+    """过滤掉当前硬件不支持的精度 (例如老 N 卡不支持 float16)"""
+    candidates = CANDIDATE_COMPUTE_TYPES.get(device, CANDIDATE_COMPUTE_TYPES["cpu"])
+    try:
+        import ctranslate2
+        supported = ctranslate2.get_supported_compute_types(device)
+        return [c for c in candidates if c in supported]
+    except Exception:
+        return candidates
+
+
+# ================= 参考音频 =================
+
+def decode_audio(path, seconds=REF_CLIP_SECONDS, offset=0):
+    """用 FFmpeg 把任意音视频文件解码为 16k 单声道 float32"""
+    cmd = [
+        "ffmpeg", "-v", "error", "-ss", str(offset), "-t", str(seconds),
+        "-i", path, "-vn", "-ac", "1", "-ar", "16000", "-f", "s16le", "-"
+    ]
+    out = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+
+
+def synthetic_clip(seconds=REF_CLIP_SECONDS):
+    """没有真实录音时的兜底：带音节包络的谐波信号，大致模拟人声负载"""
+    t = np.arange(int(16000 * seconds)) / 16000.0
+    f0 = 180 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / 16000.0
+    voice = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 4 * t)) * (np.sin(2 * np.pi * 0.25 * t) > -0.3)
+    return (0.1 * voice * envelope).astype(np.float32)
+
+
+def load_reference_clip(path=None):
+    """优先用指定文件，其次用目录里最新的录像，最后才用合成信号"""
+    if not path:
+        records = sorted(glob.glob("live_record_*.*"), key=os.path.getmtime, reverse=True)
+        if records:
+            path = records[0]
+    if path and os.path.exists(path):
+        # 跳过开头 60 秒，避开开场音乐
+        audio = decode_audio(path, offset=60)
+        if len(audio) < 16000 * REF_CLIP_SECONDS:
+            audio = decode_audio(path)
+        if len(audio) >= 16000:
+            print(f"🎧 [探测] 参考音频: {path}")
+            return audio
+    print("⚠️ [探测] 未找到参考录音，使用合成信号 (结果仅供参考)")
+    return synthetic_clip()
+
+
+# ================= 基准测试 =================
+
+def benchmark_config(model_size, device, compute_type, audio, repeats=2):
+    """加载一次模型，预热后取多次推理的最快一次，返回实时率 (RTF)"""
+    from faster_whisper import WhisperModel
+
+    load_t = time.time()
+    model = WhisperModel(model_store.resolve_faster_whisper(model_size), device=device, compute_type=compute_type)
+    load_cost = time.time() - load_t
+
+    def run_once(model):
+        start_t = time.time()
+        # transcribe 返回生成器，必须遍历完才算真正跑完
+        segments, info = model.transcribe(audio, beam_size=5, language="zh", vad_filter=False)
+        for _ in segments:
+            pass
+        return time.time() - start_t
+
+    run_once(model)  # 预热
+    best = min(run_once(model) for _ in range(repeats))
+    # 模型在函数返回后释放，下一个配置加载前不会同时占两份内存 / 显存
+    return {
+        "model_size": model_size,
+        "compute_type": compute_type,
+        "device": device,
+        "rtf": round(best / (len(audio) / 16000.0), 4),
+        "load_seconds": round(load_cost, 2),
+    }
+
+
+def select_best(results, target_rtf=TARGET_RTF):
+    """
+    在满足实时率目标的前提下挑配置：
+    先选最大的模型 (精度优先)，同一模型内再选最快的精度。
+    """
+    ok = [r for r in results if r["rtf"] <= target_rtf]
+    if not ok:
+        return min(results, key=lambda r: r["rtf"]) if results else None
+    for model_size in CANDIDATE_MODELS:
+        same_model = [r for r in ok if r["model_size"] == model_size]
+        if same_model:
+            return min(same_model, key=lambda r: r["rtf"])
+    return min(ok, key=lambda r: r["rtf"])
+
+
+def run_probe(device, models=None, clip_path=None, target_rtf=TARGET_RTF):
+    """依次测试所有候选组合，找到能跑进目标实时率的最大模型后即可提前停止"""
+    audio = load_reference_clip(clip_path)
+    compute_types = supported_compute_types(device)
+    results = []
+
+    for model_size in models or CANDIDATE_MODELS:
+        for compute_type in compute_types:
+            print(f"⏱️ [探测] {model_size} / {compute_type} ...")
+            try:
+                r = benchmark_config(model_size, device, compute_type, audio)
+            except Exception as e:
+                print(f"❌ [探测] {model_size} / {compute_type} 失败: {e}")
+                continue
+            print(f"   RTF={r['rtf']:.3f} (加载 {r['load_seconds']}s)")
+            results.append(r)
+        if any(r["model_size"] == model_size and r["rtf"] <= target_rtf for r in results):
+            break
+
+    best = select_best(results, target_rtf)
+    if best:
+        save_profile(device, best, results, target_rtf)
+    return best
+
+
+# ================= 缓存读写 =================
+
+def _read_profiles():
+    if not os.path.exists(PROFILE_FILE):
+        return {}
+    try:
+        with open(PROFILE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"⚠️ [探测] 缓存文件损坏，忽略: {e}")
+        return {}
+
+
+def save_profile(device, best, results, target_rtf):
+    profiles = _read_profiles()
+    profiles[machine_key(device)] = {
+        "model_size": best["model_size"],
+        "compute_type": best["compute_type"],
+        "rtf": best["rtf"],
+        "target_rtf": target_rtf,
+        "probed_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "results": results,
+    }
+    with open(PROFILE_FILE, "w", encoding="utf-8") as f:
+        json.dump(profiles, f, ensure_ascii=False, indent=2)
+    print(f"✅ [探测] 已缓存本机最佳配置: {best['model_size']} / {best['compute_type']} (RTF={best['rtf']:.3f})")
+
+
+def get_profile(device, auto_probe=False):
+    """
+    返回 (model_size, compute_type)。
+    有缓存直接用；没有缓存时按 auto_probe 决定是现场探测还是先用兜底配置。
+    """
+    cached = _read_profiles().get(machine_key(device))
+    if cached:
+        print(f"🧭 [探测] 使用本机缓存配置: {cached['model_size']} / {cached['compute_type']} (RTF={cached['rtf']:.3f})")
+        return cached["model_size"], cached["compute_type"]
+
+    if auto_probe:
+        best = run_probe(device)
+        if best:
+            return best["model_size"], best["compute_type"]
+
+    fallback = DEFAULT_PROFILE.get(device, DEFAULT_PROFILE["cpu"])
+    print(f"⚠️ [探测] 本机尚未探测，使用默认配置 {fallback[0]} / {fallback[1]}，可运行 python hw_probe.py 进行探测")
+    return fallback
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测试本机可用的 Whisper 模型与精度组合，并缓存最佳配置")
+    parser.add_argument("--device", default=None, help="cuda / cpu，默认自动检测")
+    parser.add_argument("--clip", default=None, help="参考音频/视频文件，默认取最新的 live_record_*")
+    parser.add_argument("--models", default=None, help="逗号分隔的候选模型，例如 large-v3,medium")
+    parser.add_argument("--target-rtf", type=float, default=TARGET_RTF, help="实时率上限")
+    args = parser.parse_args()
+
+    device = args.device
+    if not device:
+        try:
+            import torch
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        except ImportError:
+            device = "cpu"
+
+    models = args.models.split(",") if args.models else None
+    print(f"🖥️ [探测] 设备: {device} | 机器: {machine_key(device)}")
+    best = run_probe(device, models=models, clip_path=args.clip, target_rtf=args.target_rtf)
+    if not best:
+        print("❌ [探测] 没有任何配置可以运行")
+        sys.exit(1)
+    if best["rtf"] > args.target_rtf:
+        print(f"⚠️ [探测] 没有配置能达到 RTF<={args.target_rtf}，已选最快的一项")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+from collections import namedtuple
+
+# ================= 可选依赖 =================
+# 繁简转换优先用 OpenCC，拼音用 pypinyin；都没装时退化为内置小字表 / 关闭拼音模糊匹配
+try:
+    import opencc
+    _t2s = opencc.OpenCC("t2s")
+except Exception:
+    _t2s = None
+
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:
+    lazy_pinyin = None
+
+# 内置的常用繁体 -> 简体字表 (没有 OpenCC 时使用)，每两个字一组
+_BUILTIN_T2S_PAIRS = (
+    "這这個个們们說说話话來来時时會会為为對对開开關关還还點点愛爱聽听讓让過过後后"
+    "見见覺觉東东車车長长門门問问間间現现發发頭头動动國国學学實实當当樣样麼么沒没"
+    "給给應应電电氣气書书寫写錢钱買买賣卖飛飞貼贴萊莱機机場场與与邊边歡欢樂乐號号"
+    "請请謝谢親亲讀读體体戲戏網网紅红禮礼幣币擊击驚惊嚇吓罵骂憐怜滿满願愿靈灵夢梦"
+    "難难熱热簡简單单錄录視视頻频節节員员條条兩两萬万億亿從从無无壞坏準准備备認认"
+    "識识記记憶忆寶宝貝贝戀恋誰谁嗎吗隊队終终級级線线經经結结蘭兰雞鸡魚鱼鳥鸟"
+    "龍龙獎奖選选舉举辦办報报傳传統统義义裡里麵面髮发鬆松臺台週周闆板幫帮觀观"
+    "貓猫豬猪聲声響响彈弹奮奋鬥斗爭争戰战勝胜敗败輸输贏赢頁页題题標标籤签"
+)
+_BUILTIN_T2S = {_BUILTIN_T2S_PAIRS[i]: _BUILTIN_T2S_PAIRS[i + 1] for i in range(0, len(_BUILTIN_T2S_PAIRS), 2)}
+
+# 拼音模糊音：平翘舌、前后鼻音、n/l 不分，ASR 也经常在这些地方听岔
+_FUZZY_INITIALS = (("zh", "z"), ("ch", "c"), ("sh", "s"), ("n", "l"))
+_FUZZY_FINALS = (("ing", "in"), ("eng", "en"), ("ang", "an"))
+
+MatchEvent = namedtuple("MatchEvent", ["kind", "phrase", "start", "end", "text", "distance"])
+
+
+# ================= 归一化 =================
+
+def normalize_text(text):
+    """繁体转简体 + 小写，保证与原文逐字对齐 (匹配偏移可以直接映射回原文)"""
+    if _t2s is not None:
+        converted = _t2s.convert(text)
+        if len(converted) == len(text):
+            return converted.lower()
+    return "".join(_BUILTIN_T2S.get(ch, ch) for ch in text).lower()
+
+
+def _is_cjk(ch):
+    return "一" <= ch <= "鿿"
+
+
+def fuzzy_syllable(syl):
+    for a, b in _FUZZY_INITIALS:
+        if syl.startswith(a):
+            syl = b + syl[len(a):]
+            break
+    for a, b in _FUZZY_FINALS:
+        if syl.endswith(a):
+            syl = syl[:-len(a)] + b
+            break
+    return syl
+
+
+def to_syllables(text):
+    """返回 (模糊拼音音节列表, 每个音节对应的原文下标)，非汉字字符跳过"""
+    if lazy_pinyin is None:
+        return [], []
+    idx = [i for i, ch in enumerate(text) if _is_cjk(ch)]
+    if not idx:
+        return [], []
+    syls = lazy_pinyin("".join(text[i] for i in idx), style=Style.NORMAL, errors="ignore")
+    if len(syls) != len(idx):
+        return [], []
+    return [fuzzy_syllable(s) for s in syls], idx
+
+
+# ================= Aho-Corasick 自动机 =================
+
+class AhoCorasick:
+    """通用多模式匹配自动机，符号可以是字符也可以是拼音音节"""
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+
+    def add(self, pattern, payload):
+        node = 0
+        for sym in pattern:
+            nxt = self.goto[node].get(sym)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][sym] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            node = nxt
+        self.out[node].append((len(pattern), payload))
+
+    def build(self):
+        """BFS 建 fail 指针，并把 fail 链上的输出合并进来，匹配时不用再沿链回溯"""
+        queue = list(self.goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for sym, nxt in self.goto[node].items():
+                f = self.fail[node]
+                while f and sym not in self.goto[f]:
+                    f = self.fail[f]
+                cand = self.goto[f].get(sym, 0)
+                self.fail[nxt] = cand if cand != nxt else 0
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+                queue.append(nxt)
+
+    def iter(self, seq):
+        """逐个产出 (起始下标, 结束下标(不含), payload)"""
+        node = 0
+        for i, sym in enumerate(seq):
+            while node and sym not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(sym, 0)
+            for length, payload in self.out[node]:
+                yield i + 1 - length, i + 1, payload
+
+
+def _approx_find(pattern, window):
+    """Sellers 半全局编辑距离：pattern 可以从 window 任意位置开始，返回 (距离, 起点, 终点)"""
+    m = len(pattern)
+    prev = [(0, j) for j in range(len(window) + 1)]
+    for i in range(1, m + 1):
+        cur = [(i, 0)]
+        for j in range(1, len(window) + 1):
+            sub = prev[j - 1][0] + (pattern[i - 1] != window[j - 1])
+            best = (sub, prev[j - 1][1])
+            if prev[j][0] + 1 < best[0]:
+                best = (prev[j][0] + 1, prev[j][1])
+            if cur[j - 1][0] + 1 < best[0]:
+                best = (cur[j - 1][0] + 1, cur[j - 1][1])
+            cur.append(best)
+        prev = cur
+    end = min(range(len(window) + 1), key=lambda j: (prev[j][0], -j))
+    return prev[end][0], prev[end][1], end
+
+
+# ================= 匹配器 =================
+
+class KeywordMatcher:
+    """
+    一次扫描同时匹配所有房间关键词 (切片触发词、过滤词等)，耗时与关键词数量基本无关。
+    - 文本层：繁简归一化后精确匹配
+    - 拼音层：按模糊拼音匹配，允许 pinyin_distance 个音节的编辑距离 (分片精确匹配 + 编辑距离校验)
+    """
+
+    def __init__(self, phrases_by_kind, pinyin_distance=1, fuzzy_kinds=("trigger",)):
+        self.text_ac = AhoCorasick()
+        self.pinyin_ac = AhoCorasick()
+        self.pinyin_patterns = []   # (kind, phrase, 音节列表, 允许距离)
+        self.pinyin_distance = pinyin_distance
+
+        for kind, phrases in phrases_by_kind.items():
+            for phrase in phrases:
+                if not phrase:
+                    continue
+                self.text_ac.add(normalize_text(phrase), (kind, phrase))
+                if kind in fuzzy_kinds:
+                    self._add_pinyin(kind, phrase)
+        self.text_ac.build()
+        self.pinyin_ac.build()
+
+        if lazy_pinyin is None and any(k in fuzzy_kinds for k in phrases_by_kind):
+            print("⚠️ [关键词] 未安装 pypinyin，拼音模糊匹配已关闭，只有列出的词会命中 (pip install pypinyin)")
+
+    def _add_pinyin(self, kind, phrase):
+        syls, _ = to_syllables(normalize_text(phrase))
+        if len(syls) < 2:
+            return
+        # 短语太短时只做同音匹配，避免误报 (4 个音节最多容 1 个错)
+        k = min(self.pinyin_distance, (len(syls) - 1) // 3)
+        pid = len(self.pinyin_patterns)
+        self.pinyin_patterns.append((kind, phrase, syls, k))
+        # 鸽巢原理：k 个错误最多破坏 k 片，切成 k+1 片至少有一片完全命中
+        pieces = k + 1
+        bounds = [round(len(syls) * p / pieces) for p in range(pieces + 1)]
+        for p in range(pieces):
+            self.pinyin_ac.add(syls[bounds[p]:bounds[p + 1]], (pid, bounds[p]))
+
+    @classmethod
+    def from_room_config(cls, config, default_triggers=(), default_ignores=(), default_highlights=()):
+        """从房间 json 读取 trigger_keywords / ignore_keywords / highlight_keywords / pinyin_max_distance，缺省时用脚本自带的列表"""
+        config = config or {}
+        return cls(
+            {
+                "trigger": config.get("trigger_keywords", list(default_triggers)),
+                "ignore": config.get("ignore_keywords", list(default_ignores)),
+                "highlight": config.get("highlight_keywords", list(default_highlights)),
+            },
+            pinyin_distance=int(config.get("pinyin_max_distance", 1)),
+        )
+
+    def match(self, text):
+        """返回 MatchEvent 列表 (按起始位置排序)，偏移是原文中的字符下标"""
+        events = {}
+        norm = normalize_text(text)
+        for start, end, (kind, phrase) in self.text_ac.iter(norm):
+            events[(kind, phrase, start)] = MatchEvent(kind, phrase, start, end, text[start:end], 0)
+
+        if self.pinyin_patterns:
+            syls, idx = to_syllables(norm)
+            checked = set()
+            for s_start, _, (pid, piece_offset) in self.pinyin_ac.iter(syls):
+                kind, phrase, pattern, k = self.pinyin_patterns[pid]
+                lo = max(0, s_start - piece_offset - k)
+                if (pid, lo) in checked:
+                    continue
+                checked.add((pid, lo))
+                window = syls[lo:lo + len(pattern) + 2 * k]
+                dist, w_start, w_end = _approx_find(pattern, window)
+                if dist > k or w_end <= w_start:
+                    continue
+                start, end = idx[lo + w_start], idx[lo + w_end - 1] + 1
+                if any(e.kind == kind and e.phrase == phrase and e.start < end and start < e.end for e in events.values()):
+                    continue
+                events[(kind, phrase, start)] = MatchEvent(kind, phrase, start, end, text[start:end], dist)
+
+        return sorted(events.values(), key=lambda e: e.start)
@@ -1,10 +1,11 @@
 import os
 # 解决多个库同时调用 OpenMP 导致的 DLL 冲突闪退问题
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
+import time
+APP_START_TIME = time.time()  # 用于统计窗口弹出耗时
 import tkinter as tk
 from tkinter import scrolledtext, messagebox, filedialog
 import subprocess
-import time
 import sys
 import json
 
@@ -12,95 +13,261 @@ import numpy as np
 import threading
 import queue
 import warnings
-import torch
-from faster_whisper import WhisperModel
+import hw_probe
+import model_store
+import audio_fingerprint
+import hallucination_detector
+import keyword_matcher
+import dedup_filter
+import transcript_writer
+import segment_record
+import transcript_archive
+import term_analytics
+import subtitle_writer
+import output_sinks
+import segment_recorder
+import dvr_buffer
+import clip_scheduler
+import remux_worker
+import speech_archive
+import retention_manager
+import highlight_detector
+import danmaku_client
+import refine_transcript
 
 warnings.filterwarnings("ignore")
 
 # ================= 配置区 =================
-# 模型大小
-MODEL_SIZE = "large-v3" 
+# 模型大小与精度：默认读取 hw_probe.py 为本机缓存的最佳配置，填写后则强制使用
+MODEL_SIZE = None
+COMPUTE_TYPE = None
+# 本机没有探测缓存时，是否在启动时现场跑一次探测 (较慢)
+AUTO_PROBE = False
 # 过滤词
 IGNORE_KEYWORDS = [
     "by bwd6", "字幕by", "Amara.org", "优优独播剧场", "compared compared",
     "YoYo Television", "不吝点赞", "订阅我的频道", "Copyright", "The following content"
 ]
+# 切片触发词：装了 pypinyin 时同音变体由 keyword_matcher 按拼音自动容错；
+# 没装时只做精确匹配 (繁简视为相同)，所以常见的误识别仍逐个列出作为兜底
+# 房间 json 里的 trigger_keywords / ignore_keywords / pinyin_max_distance 会覆盖这里的默认值
+TRIGGER_KEYWORDS = ["切片飞来", "切片飞莱", "贴片飞来", "切片飛來", "切片飛来"]
+
+# 近似重复过滤：时间窗 (秒) 内与任一句相似度超过阈值即视为重复
+DEDUP_WINDOW_SECONDS = 120
+DEDUP_THRESHOLD = 0.8
+
+# 日志写入：后台线程攒批，到行数或时间就刷盘；开启 fsync 更抗断电但更费磁盘
+LOG_FLUSH_LINES = 20
+LOG_FLUSH_INTERVAL = 1.0
+LOG_FSYNC = False
+# 日志按大小 (MB) / 时长 (小时) 切分，0 表示不切分
+LOG_ROTATE_MB = 0
+LOG_ROTATE_HOURS = 0
+
+# 转写实时写入 SQLite 全文检索库 (用 transcript_archive.py search 查询)，设为 None 关闭
+ARCHIVE_DB = transcript_archive.ARCHIVE_DB
+
+# 额外的输出 (文件 / Unix 套接字 / 本地 webhook / stdout JSONL)，房间 json 的 "sinks" 字段优先
+# 例如 [{"type": "webhook", "url": "http://127.0.0.1:9000/hook"}]，每个输出独立缓冲，慢了也不拖累转写
+DEFAULT_SINKS = []
+
+# 录像方式："single" 录成一个 .ts，结束后转 .mp4；
+# "segments" 按关键帧切成固定时长的分段并建索引，切片只读覆盖区间的分段，耗时与已录时长无关
+# "fmp4" 直接录成分片 MP4，边录边能播放 / 拖动，录完不需要转封装
+# "none" 不落盘录像，只监听音频 (配合下面的内存 DVR 仍然可以切片)
+RECORD_MODE = "single"
+# .ts / 分段录完后在后台低优先级封装成 .mp4 的并发数
+REMUX_WORKERS = remux_worker.DEFAULT_WORKERS
+
+# 内存 DVR：在内存里保留最近几分钟的直播画面，切片直接从内存取，不读磁盘上正在增长的录像；0 关闭
+DVR_BUFFER_SECONDS = 0
+DVR_BUFFER_MB = 256       # 内存上限，码率再高也不会超过
+
+# 同时进行的切片数；重叠的触发会合并成一个加长切片，切片进程以低优先级运行
+CLIP_WORKERS = clip_scheduler.DEFAULT_WORKERS
+
+# 语音归档：只把 VAD 判为语音的片段存成低码率 Opus (xxx.speech.opus + 索引)，
+# 以后重新转写 / 检索不用保留整场录像；配合 RECORD_MODE = "none" 就是体积最小的存档方式
+SPEECH_ARCHIVE = False
+
+# 磁盘配额与过期清理 (录像 / 切片 / 日志)：存在 retention.json 时才在后台启用，策略说明见 retention_manager.py
+RETENTION_POLICY_FILE = retention_manager.POLICY_FILE
+RETENTION_INTERVAL = retention_manager.DEFAULT_INTERVAL
+
+# 自动高光切片：语音密度、语速、笑声 / 感叹、热词和高光关键词相对房间基线突然升高时自动切一段
+# 房间 json 的 highlight_keywords 会覆盖这里的关键词；基线跨场累计保存在 highlight_baseline.json
+AUTO_HIGHLIGHT = False
+HIGHLIGHT_KEYWORDS = []
+HIGHLIGHT_THRESHOLD = highlight_detector.THRESHOLD   # 越大越保守
+HIGHLIGHT_TREND_EVERY = 20    # 每转写多少句刷新一次高光检测用的趋势词
+
+# 弹幕接收：同时连上直播间的弹幕服务器，把弹幕 / 礼物 / SC / 上舰存成 xxx.danmaku.jsonl，
+# stream_offset 与转写记录是同一条录像时间轴；解码在独立线程里成批进行，不影响音频与转写
+DANMAKU = False
+DANMAKU_DELAY = 0.0       # 秒：观众看到画面到发弹幕的反应时间，对齐时从接收时间里减掉
+
+# 赛后精修：每场结束后把会话登记到排队文件，夜里用 python refine_transcript.py --queue refine_queue.txt --wait-until 02:00
+# 以最低优先级用大模型重新转写，生成修正后的日志和对比报告；None 表示不登记
+REFINE_QUEUE_FILE = None  # 例如 refine_transcript.QUEUE_FILE
 
 # ================= 全局变量与队列 =================
 audio_queue = queue.Queue()
 ui_queue = queue.Queue()       # 子线程给主界面发消息
 running_event = threading.Event() # 控制开始/停止
+models_ready_event = threading.Event() # 模型加载 + 预热完成
+
+# 录像后台封装 (.ts -> .mp4)，不占用采集线程
+remux_jobs = remux_worker.RemuxPool(REMUX_WORKERS, ui_queue=ui_queue,
+                                    creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0)
+
+# 后台清理：正在录的文件 (以及还没封装完的录像) 不会被动到
+retention = None
+if os.path.exists(RETENTION_POLICY_FILE):
+    retention = retention_manager.RetentionManager.load(
+        RETENTION_POLICY_FILE, ui_queue=ui_queue, protect=lambda: [current_record_file, *remux_jobs.busy_files()],
+        creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0)
+
+# 最近音频的指纹缓存 (重复的片头/广告/礼物音效直接复用结果)，多个房间共享
+fingerprint_cache = audio_fingerprint.shared_cache
+FINGERPRINT_REPORT_EVERY = 50  # 每处理多少个切片在控制台打印一次命中率
+
+# 配置了 stdout JSONL 输出时，一启动就把控制台日志改到 stderr，标准输出上从头到尾只有 JSONL
+if any(conf.get("type") == "stdout" for conf in DEFAULT_SINKS):
+    output_sinks.claim_stdout()
+
+# 热词统计 (按房间 / 单场 / 单日计数，内存固定)，基线跨场累计保存在 term_stats/房间.pkl
+# 这里不读盘：房间的状态在转写线程开始时于后台读入
+term_stats = term_analytics.TermAnalytics(term_analytics.STATE_DIR)
+TREND_REPORT_EVERY = 100  # 每转写多少句推送一次本场趋势词
+
+# 高光检测 (每个房间一份滚动基线)
+highlights = highlight_detector.HighlightDetector.load(highlight_detector.STATE_FILE, HIGHLIGHT_THRESHOLD)
 
 # === 新增：用于切片功能的全局变量 ===
 current_record_file = ""
 record_start_time = 0.0
+current_manifest_file = ""  # 本次会话的清单 (关联日志、结构化记录与录像)
+live_subtitles = None       # 本次录像的实时字幕 (SubtitleWriter)，切片时从这里截取
+current_segment_index = None  # 分段录像模式下的关键帧索引 (SegmentIndex)
+live_dvr = None             # 最近几分钟画面的内存缓冲 (DvrBuffer)
+stream_clock = None         # 接收时间 -> 录像秒 (锚定在最近读到的音频块上，弹幕对齐用)
 
-# ================= 模型初始化 (启动时加载) =================
-
-print("🛠 正在初始化环境，请稍候...")
-
-# 1. 检查 CUDA
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-print(f"🖥️ 运行设备: {DEVICE}")
-if DEVICE == "cpu":
-    print("⚠️ 警告: 未检测到 GPU，运行速度可能会很慢！")
-
-# 2. 加载 VAD 模型
-print("🛠 正在加载 VAD 模型...")
-try:
-    vad_model, utils = torch.hub.load(repo_or_dir='snakers4/silero-vad',
-                                      model='silero_vad',
-                                      force_reload=False,
-                                      trust_repo=True)
-    (get_speech_timestamps, save_audio, read_audio, VADIterator, collect_chunks) = utils
-    vad_model.to(DEVICE)
-    print("✅ VAD 模型加载完毕")
-except Exception as e:
-    print(f"❌ VAD 模型加载失败: {e}")
-    sys.exit(1)
-
-# 3. 加载 Faster-Whisper
-print(f"🚀 正在加载 Faster-Whisper ({MODEL_SIZE})...")
-try:
-    # compute_type="float16" 是 N 卡甜点精度
-    whisper_model = WhisperModel(MODEL_SIZE, device=DEVICE, compute_type="int8_float16")
-    print("✅ Whisper 模型加载完毕")
-except Exception as e:
-    print(f"❌ Whisper 模型加载失败: {e}")
-    sys.exit(1)
+# ================= 模型初始化 (后台线程加载) =================
+# torch / faster_whisper 导入本身就要好几秒，全部推迟到后台线程，窗口先弹出来
+torch = None
+DEVICE = "cpu"
+vad_model = None
+get_speech_timestamps = None
+whisper_model = None
 
+def load_models():
+    """ 后台加载 VAD 与 Whisper，并跑一次预热推理，让第一条直播切片就达到稳态速度 """
+    global torch, DEVICE, MODEL_SIZE, COMPUTE_TYPE, vad_model, get_speech_timestamps, whisper_model
+    load_t = time.time()
 
-# ================= 核心处理逻辑 =================
+    msg = "🛠 [系统] 正在后台初始化环境，请稍候..."
+    ui_queue.put(msg)
+    print(msg)
 
-def is_hallucination(text):
-    for kw in IGNORE_KEYWORDS:
-        if kw.lower() in text.lower():
-            return True
-    return False
+    try:
+        import torch
+        from faster_whisper import WhisperModel
+
+        # 1. 检查 CUDA
+        DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+        msg = f"🖥️ [系统] 运行设备: {DEVICE}"
+        ui_queue.put(msg)
+        print(msg)
+        if DEVICE == "cpu":
+            msg = "⚠️ 警告: 未检测到 GPU，运行速度可能会很慢！"
+            ui_queue.put(msg)
+            print(msg)
+
+        if not MODEL_SIZE or not COMPUTE_TYPE:
+            _probed_size, _probed_type = hw_probe.get_profile(DEVICE, auto_probe=AUTO_PROBE)
+            MODEL_SIZE = MODEL_SIZE or _probed_size
+            COMPUTE_TYPE = COMPUTE_TYPE or _probed_type
+
+        # 2. 加载 VAD 模型
+        msg = "🛠 [系统] 正在加载 VAD 模型..."
+        ui_queue.put(msg)
+        print(msg)
+        vad_model, utils = model_store.load_silero_vad()
+        (get_speech_timestamps, save_audio, read_audio, VADIterator, collect_chunks) = utils
+        vad_model.to(DEVICE)
+
+        # 3. 加载 Faster-Whisper
+        msg = f"🛠 [系统] 正在加载 Faster-Whisper ({MODEL_SIZE} / {COMPUTE_TYPE})..."
+        ui_queue.put(msg)
+        print(msg)
+        # 本地模型仓库里有就直接读本地目录，不走 HF 缓存的联网检查
+        whisper_model = WhisperModel(model_store.resolve_faster_whisper(MODEL_SIZE), device=DEVICE, compute_type=COMPUTE_TYPE)
+
+        # 4. 预热：用一段合成音频把 CUDA 上下文、显存分配和解码器都跑一遍
+        msg = "🛠 [系统] 正在预热模型..."
+        ui_queue.put(msg)
+        print(msg)
+        warmup_audio = hw_probe.synthetic_clip(2)
+        get_speech_timestamps(torch.from_numpy(warmup_audio).to(DEVICE), vad_model, sampling_rate=16000)
+        segments, info = whisper_model.transcribe(warmup_audio, beam_size=5, language="zh", vad_filter=False)
+        for _ in segments:
+            pass
+    except Exception as e:
+        err_msg = f"❌ [错误] 模型加载失败: {e}"
+        ui_queue.put(err_msg)
+        print(err_msg)
+        return
+
+    models_ready_event.set()
+    msg = f"✅ [系统] 模型已就绪 (加载+预热 {time.time() - load_t:.1f}s)，可以启动"
+    ui_queue.put(msg)
+    print(msg)
+
+
+# ================= 核心处理逻辑 =================
 
-def check_voice_activity(audio_np):
+def detect_speech(audio_np):
+    """VAD 检测到的语音区间 [{"start", "end"}, ...] (采样点)；语音总长不足 0.5s 时返回空列表"""
     try:
         # numpy -> tensor -> gpu
         audio_tensor = torch.from_numpy(audio_np).to(DEVICE)
         speech_timestamps = get_speech_timestamps(audio_tensor, vad_model, sampling_rate=16000)
         if not speech_timestamps:
-            return False
+            return []
         total_speech_time = sum([(i['end'] - i['start']) for i in speech_timestamps]) / 16000
-        return total_speech_time > 0.5
+        return speech_timestamps if total_speech_time > 0.5 else []
     except Exception as e:
         print(f"❌ VAD检测出错: {e}")
-        return False
+        return []
 
 # ================= 线程任务 =================
 
 def run_stream_producer(room_id):
     """ 音频采集与视频录制线程 (FFmpeg) """
-    global current_record_file, record_start_time
+    global current_record_file, record_start_time, current_segment_index, live_dvr, stream_clock
     
     # 🔴 关键修改 1：后缀改为 .ts
     record_filename = f"live_record_{room_id}_{int(time.time())}.ts"
+    record_output = ["-c", "copy", "-f", "mpegts", "-flush_packets", "1", record_filename]
+    if RECORD_MODE == "segments":
+        # 分段录像：录像路径是一个目录，里面是 seg_*.ts 分段 + 分段列表 + 关键帧索引
+        record_filename = os.path.splitext(record_filename)[0]
+        os.makedirs(record_filename, exist_ok=True)
+        record_output = segment_recorder.ffmpeg_output_args(record_filename)
+        current_segment_index = segment_recorder.SegmentIndex(record_filename)
+    elif RECORD_MODE == "fmp4":
+        record_filename = os.path.splitext(record_filename)[0] + ".mp4"
+        record_output = remux_worker.FMP4_OUTPUT_ARGS + [record_filename]
+    elif RECORD_MODE == "none":
+        record_filename = ""
+        record_output = []
     current_record_file = record_filename
     record_start_time = time.time()
+    stream_clock = danmaku_client.StreamClock(record_start_time)
+    clip_jobs.new_session()
+    if retention:
+        retention.wake()  # 开录前先确认磁盘空间够用
     
     streamlink_cmd = ["streamlink", "--twitch-disable-ads", f"https://live.bilibili.com/{room_id}", "best", "--stdout"]
     
@@ -109,7 +276,7 @@ def run_stream_producer(room_id):
         "ffmpeg", 
         "-v", "error",            # 显示错误信息，方便排查崩溃
         "-i", "pipe:0", 
-        "-c", "copy", "-f", "mpegts", "-flush_packets", "1", record_filename,  # 第一路：实时刷新 ts 流
+        *record_output,  # 第一路：实时刷新 ts 流 (或分段)
         "-map", "0:a:0", "-vn", "-ac", "1", "-ar", "16000", "-f", "s16le", "-" # 第二路：音频流
     ]
     
@@ -121,16 +288,25 @@ def run_stream_producer(room_id):
         ui_queue.put(msg)
         print(msg) 
         
-        msg_rec = f"📼 [系统] 视频后台直录中: {record_filename}"
-        ui_queue.put(msg_rec)
-        print(msg_rec)
+        if record_filename:
+            msg_rec = f"📼 [系统] 视频后台直录中: {record_filename}"
+            ui_queue.put(msg_rec)
+            print(msg_rec)
         
         creation_flags = 0
         if sys.platform == "win32":
             creation_flags = subprocess.CREATE_NO_WINDOW
 
         process_streamlink = subprocess.Popen(streamlink_cmd, stdout=subprocess.PIPE, creationflags=creation_flags)
-        process_ffmpeg = subprocess.Popen(ffmpeg_cmd, stdin=process_streamlink.stdout, stdout=subprocess.PIPE, creationflags=creation_flags)
+        if DVR_BUFFER_SECONDS > 0:
+            # 直播流原始字节一份给录像 ffmpeg，一份进内存 DVR
+            live_dvr = dvr_buffer.DvrBuffer(DVR_BUFFER_SECONDS, DVR_BUFFER_MB, creation_flags)
+            live_dvr.start()
+            process_ffmpeg = subprocess.Popen(ffmpeg_cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, creationflags=creation_flags)
+            threading.Thread(target=live_dvr.tee, args=(process_streamlink.stdout, process_ffmpeg.stdin), daemon=True).start()
+        else:
+            live_dvr = None
+            process_ffmpeg = subprocess.Popen(ffmpeg_cmd, stdin=process_streamlink.stdout, stdout=subprocess.PIPE, creationflags=creation_flags)
         
         msg_ok = "🎧 [系统] 直播流已接通，录像与监听开始..."
         ui_queue.put(msg_ok)
@@ -138,6 +314,7 @@ def run_stream_producer(room_id):
         
         chunk_seconds = 8 
         chunk_size = 16000 * 2 * chunk_seconds
+        samples_read = 0  # 已读取的采样数，用来算每个切片在录像时间轴上的位置
         
         while running_event.is_set():
             in_bytes = process_ffmpeg.stdout.read(chunk_size)
@@ -149,7 +326,9 @@ def run_stream_producer(room_id):
             if not running_event.is_set(): break
 
             audio_data = np.frombuffer(in_bytes, np.int16).flatten().astype(np.float32) / 32768.0
-            audio_queue.put(audio_data)
+            audio_queue.put((samples_read / 16000.0, audio_data))
+            samples_read += len(audio_data)
+            stream_clock.mark(samples_read / 16000.0)
             
     except Exception as e:
         err_msg = f"❌ [错误] 采集流异常: {e}"
@@ -162,64 +341,64 @@ def run_stream_producer(room_id):
         if process_streamlink: 
             try: process_streamlink.kill() 
             except: pass
+        if live_dvr is not None:
+            live_dvr.close()
+            ui_queue.put(live_dvr.report())
+            print(live_dvr.report())
+        # 录像不会再变长，排队中的切片立即开始切
+        clip_jobs.flush()
         
-        # === 新增：录像结束后自动将 .ts 无损封装为 .mp4 ===
-        if os.path.exists(record_filename):
-            mp4_filename = record_filename.replace(".ts", ".mp4")
-            convert_msg = f"🔄 [系统] 录制结束，正在将 .ts 无损封装为 .mp4..."
-            ui_queue.put(convert_msg)
-            print(convert_msg)
-            
-            # 执行极速转封装
-            convert_cmd = [
-                "ffmpeg", "-y", "-v", "error",
-                "-i", record_filename,
-                "-c", "copy",
-                "-movflags", "faststart",
-                mp4_filename
-            ]
-            
-            try:
-                subprocess.run(convert_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, creationflags=creation_flags)
-                
-                # 转换成功后，可以选择删除原 .ts 文件（如果想保留可以把下面两行注释掉）
-                os.remove(record_filename) 
-                
-                finish_msg = f"✅ [系统] 视频已成功保存为: {mp4_filename}"
-                ui_queue.put(finish_msg)
-                print(finish_msg)
-            except Exception as e:
-                err_msg = f"❌ [错误] 格式转换失败: {e}"
-                ui_queue.put(err_msg)
-                print(err_msg)
+        # === 录像结束后在后台把 .ts (或分段) 无损封装为 .mp4，停止后马上可以开始下一场 ===
+        # 分片 MP4 本身就能播放拖动，不需要封装
+        if record_filename and os.path.exists(record_filename) and RECORD_MODE != "fmp4":
+            remux_jobs.submit(record_filename, manifest=current_manifest_file,
+                              before_delete=lambda f=record_filename: clip_jobs.wait_record(f))
         
         end_msg = "🛑 [系统] 采集与录制线程已彻底退出"
         ui_queue.put(end_msg)
         print(end_msg)
 
-def make_clip(trigger_time, streamer_name):
-    """执行后台切片的独立函数 (Windows 防黑框 + MP4 moov头前置)"""
-    global current_record_file, record_start_time
+def run_clip_job(job):
+    """
+    切片调度器的工作线程里执行：从登记时的录像来源 (job.source) 切出 job 的区间，返回 (文件名, 实际开始秒, 实际结束秒)。
+    不读当前会话的全局变量：停止后马上开始下一场时，上一场排队的任务仍然切上一场的录像。
+    """
+    start_sec, end_sec = job.start, job.end
+    src = job.source
+    record_file, subtitles, dvr = src["record_file"], src["subtitles"], src["dvr"]
+    
+    # 1. 构造输出文件名 (.mp4 格式)，用第一次触发的时间
+    clip_name = f"Clip_{job.streamer}_{time.strftime('%H%M%S', time.localtime(job.created))}_from_{int(start_sec)}s.mp4"
+    cues = subtitles.cues_between(start_sec, end_sec) if subtitles else []
+    
+    # 2. Windows 下隐藏 FFmpeg 执行时的命令行黑框，并以低于正常的优先级运行
+    creation_flags = 0
+    if sys.platform == "win32":
+        creation_flags = subprocess.CREATE_NO_WINDOW | clip_scheduler.LOW_PRIORITY_FLAGS
+    
+    # 内存 DVR 里还有起点的画面：直接从内存切，不碰磁盘上的录像
+    if dvr is not None and dvr.covers(start_sec):
+        # ready_at 是按墙钟估算的，缓冲未必已收到结束点的画面：等它覆盖到结束点 (停播或超时就用已有的)
+        deadline = time.time() + clip_scheduler.DVR_WAIT_SECONDS
+        while dvr.is_live() and dvr.duration() < end_sec and time.time() < deadline:
+            time.sleep(0.5)
+        result = dvr.clip(start_sec, end_sec, clip_name, cues, creation_flags, clip_scheduler.CLIP_NICE)
+        return result and (clip_name + " (内存)", *result)
     
     # 确保主录像文件存在
-    if not current_record_file or not os.path.exists(current_record_file):
-        msg = "⚠️ [切片失败] 找不到当前录像文件"
-        ui_queue.put(msg)
-        print(msg)
-        return
-        
-    # 1. 计算相对时间
-    current_video_duration = trigger_time - record_start_time
-    start_sec = max(0, current_video_duration - 180)  # 往前推 3 分钟 (180秒)
-    end_sec = current_video_duration + 5              # 往后多留 5 秒作为缓冲
+    if not record_file or not os.path.exists(record_file):
+        raise RuntimeError(f"找不到录像文件: {record_file}")
     
-    # 2. 构造输出文件名 (.mp4 格式)
-    clip_name = f"Clip_{streamer_name}_{time.strftime('%H%M%S')}_from_{int(start_sec)}s.mp4"
+    # 分段录像：不再从头扫描整个录像，只拼接覆盖 [start, end] 的分段
+    if src["segment_index"] is not None:
+        result = segment_recorder.build_clip(src["segment_index"], start_sec, end_sec, clip_name, cues,
+                                             creation_flags, clip_scheduler.CLIP_NICE)
+        return result and (clip_name, *result)
     
     # 3. 构造 FFmpeg 命令
     cmd = [
         "ffmpeg", "-y", "-v", "error", 
-        "-i", current_record_file,          # 输入源：正在录制的 .ts 文件
+        "-i", record_file,          # 输入源：正在录制的 .ts 文件
         "-ss", str(start_sec),              # 起始时间
         "-to", str(end_sec),                # 结束时间
         "-c", "copy",                       # 复制音视频流，不重新编码 (速度极快)
@@ -227,66 +406,196 @@ def make_clip(trigger_time, streamer_name):
         clip_name
     ]
     
-    msg = f"✂️ [切片触发] 已截取画面 -> {clip_name}"
+    # 有字幕时一并封装成软字幕轨 (字幕保持录像时间轴，和音视频一起被 -ss/-to 截取)
+    if cues:
+        clip_srt = os.path.splitext(clip_name)[0] + ".srt"
+        subtitle_writer.write_srt(cues, clip_srt)
+        cmd = subtitle_writer.mux_cmd(record_file, clip_srt, clip_name, ["-ss", str(start_sec), "-to", str(end_sec)])
+    
+    # 4. 在工作线程里等切片完成 (同时进行的切片数由调度器限制)
+    if clip_scheduler.run_low_priority(cmd, creation_flags) != 0:
+        raise RuntimeError(f"ffmpeg 切片失败: {clip_name}")
+    return clip_name, start_sec, end_sec
+
+# 切片调度：有界的工作线程 + 重叠触发合并，切片 ffmpeg 降低优先级，爆发的切片不拖慢实时转写
+clip_jobs = clip_scheduler.ClipScheduler(run_clip_job, CLIP_WORKERS, ui_queue=ui_queue)
+
+def make_clip(trigger_time, streamer_name, before=180, after=5):
+    """登记一次切片触发 (默认往前 3 分钟、往后 5 秒)，等录像写到结束点后由调度器执行"""
+    # 计算相对时间
+    current_video_duration = trigger_time - record_start_time
+    start_sec = max(0, current_video_duration - before)  # 往前推 (默认 3 分钟)
+    end_sec = current_video_duration + after              # 往后多留几秒作为缓冲
+    
+    # 分段录像要等结束点所在的分段写完
+    delay = segment_recorder.SEGMENT_SECONDS if RECORD_MODE == "segments" else clip_scheduler.READY_DELAY
+    # 记下这一场的录像来源，任务执行时只从这里切
+    source = {"record_file": current_record_file, "segment_index": current_segment_index,
+              "dvr": live_dvr, "subtitles": live_subtitles}
+    clip_jobs.submit(streamer_name, start_sec, end_sec, ready_at=record_start_time + end_sec + delay, source=source)
+
+def observe_highlight(streamer_name, room_id, chunk_offset, samples, speech, text="", events=()):
+    """每段音频调用一次：喂给高光检测，检测到一段高光时按它的区间登记切片"""
+    if not AUTO_HIGHLIGHT:
+        return
+    speech_seconds = sum(s["end"] - s["start"] for s in speech) / 16000 if speech else 0.0
+    keyword_hits = sum(1 for e in events if e.kind == "highlight")
+    hl = highlights.observe(room_id, chunk_offset, samples / 16000, speech_seconds, text, keyword_hits)
+    if hl is None:
+        return
+    msg = f"🌟 [高光] {hl.describe()}"
     ui_queue.put(msg)
     print(msg)
-    
-    # 4. Windows 下隐藏 FFmpeg 执行时的命令行黑框
-    creation_flags = 0
-    if sys.platform == "win32":
-        creation_flags = subprocess.CREATE_NO_WINDOW
-        
-    # 5. 启动后台进程执行切片，不阻塞主线程
-    subprocess.Popen(
-        cmd, 
-        stdout=subprocess.DEVNULL, 
-        stderr=subprocess.DEVNULL, 
-        creationflags=creation_flags
-    )
+    # 区间是直播流时间，换算成触发时刻交给 make_clip (与关键词触发走同一个切片队列，重叠的会合并)
+    make_clip(record_start_time + hl.end, streamer_name, before=hl.end - hl.start, after=0)
 
-def run_transcriber(streamer_name, room_id):
+def run_transcriber(streamer_name, room_id, room_config=None):
     """ Whisper 转写线程 """
-    last_text = ""
-    log_file = f"{streamer_name}_{room_id}_win_cuda_log_{int(time.time())}.txt"
+    global current_manifest_file, live_subtitles
+    dedup = dedup_filter.NearDuplicateFilter(DEDUP_WINDOW_SECONDS, DEDUP_THRESHOLD)
+    matcher = keyword_matcher.KeywordMatcher.from_room_config(room_config, TRIGGER_KEYWORDS, IGNORE_KEYWORDS, HIGHLIGHT_KEYWORDS)
+    highlights.new_session(room_id)
+    term_stats.preload(room_id)     # 读入该房间的热词基线 (在转写线程里，不拖慢窗口弹出)
+    started_at = time.time()
+    first_line = True
+    lines_emitted = 0
+    session_ts = int(time.time())
+    session_id = f"{room_id}_{session_ts}"
+    model_name = f"faster-whisper/{MODEL_SIZE}/{COMPUTE_TYPE}"
+    log_base = f"{streamer_name}_{room_id}_win_cuda_log_{session_ts}"
+    log_file = log_base + ".txt"
+    records_file = log_base + ".jsonl"     # 结构化记录 (每行一个 JSON)
+    current_manifest_file = log_base + ".manifest.json"
     
     log_msg = f"📝 [系统] 日志将写入: {log_file}"
     ui_queue.put(log_msg)
     print(log_msg)
+    log_writer = transcript_writer.TranscriptWriter(
+        log_file,
+        flush_lines=LOG_FLUSH_LINES,
+        flush_interval=LOG_FLUSH_INTERVAL,
+        fsync=LOG_FSYNC,
+        rotate_bytes=int(LOG_ROTATE_MB * 1024 * 1024),
+        rotate_seconds=LOG_ROTATE_HOURS * 3600,
+        on_rotate=lambda path: ui_queue.put(f"📝 [系统] 日志已切分，继续写入: {path}"),
+        on_error=ui_queue.put,
+    )
+    record_writer = transcript_writer.TranscriptWriter(
+        records_file,
+        flush_lines=LOG_FLUSH_LINES,
+        flush_interval=LOG_FLUSH_INTERVAL,
+        fsync=LOG_FSYNC,
+        rotate_bytes=int(LOG_ROTATE_MB * 1024 * 1024),
+        rotate_seconds=LOG_ROTATE_HOURS * 3600,
+        on_error=ui_queue.put,
+    )
+    segment_record.update_manifest(
+        current_manifest_file,
+        session=session_id,
+        room=room_id,
+        streamer=streamer_name,
+        model=model_name,
+        started_at=session_ts,
+        record_file=current_record_file,
+        record_start_time=record_start_time,
+        log_file=log_file,
+        records_file=records_file,
+    )
+    # 字幕与录像同名 (.srt / .vtt)，时间轴对齐录像
+    live_subtitles = subtitle_writer.SubtitleWriter(os.path.splitext(current_record_file)[0] if current_record_file else log_base)
+    segment_record.update_manifest(current_manifest_file, subtitle_file=live_subtitles.srt_path)
+    speech_writer = speech_archive.SpeechArchiveWriter(log_base, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0) if SPEECH_ARCHIVE else None
+    if speech_writer:
+        segment_record.update_manifest(current_manifest_file, speech_archive=speech_writer.path)
+    danmaku = None
+    if DANMAKU:
+        danmaku = danmaku_client.DanmakuClient(room_id, log_base + danmaku_client.RECORD_SUFFIX, ui_queue=ui_queue,
+                                               clock=lambda wall: stream_clock(wall), delay=DANMAKU_DELAY).start()
+        segment_record.update_manifest(current_manifest_file, danmaku_file=danmaku.out_path)
+    archiver = transcript_archive.LiveArchiver(ARCHIVE_DB) if ARCHIVE_DB else None
+    if archiver:
+        archiver.add_session(current_manifest_file)
+    sinks = output_sinks.SinkFanout.from_config((room_config or {}).get("sinks", DEFAULT_SINKS))
 
     while running_event.is_set():
         try:
             # 1秒超时
-            audio_data = audio_queue.get(timeout=1)
+            chunk_offset, audio_data = audio_queue.get(timeout=1)
         except queue.Empty:
             continue
             
+        # === 音频指纹：重复出现的声音不再重复跑 VAD / Whisper ===
+        fp = audio_fingerprint.fingerprint(audio_data)
+        hit = fingerprint_cache.lookup(fp, room_id)
+        if fingerprint_cache.stats["lookups"] % FINGERPRINT_REPORT_EVERY == 0 and fingerprint_cache.stats["lookups"]:
+            print(fingerprint_cache.report())
+        if hit is not None and hit.text is None:
+            print(f"🔁 [指纹] 命中已知的纯音乐/音效片段，跳过 VAD 与 Whisper...")
+            continue
+            
         # === VAD 检测与控制台输出 ===
-        if not check_voice_activity(audio_data):
+        speech = detect_speech(audio_data) if hit is None else None
+        if hit is None and not speech:
             print(f"🎵 [VAD] 检测到纯音乐/静音，跳过 Whisper...")
+            fingerprint_cache.add(fp, None, room_id)
+            observe_highlight(streamer_name, room_id, chunk_offset, len(audio_data), [])
             continue
+        if speech_writer:
+            # 只归档语音部分 (指纹命中的重复音频整段保存)
+            speech_writer.add(chunk_offset, audio_data, speech)
             
         try:
             start_t = time.time()
             
-            # Faster-Whisper 推理
-            segments, info = whisper_model.transcribe(
-                audio_data, 
-                beam_size=5, 
-                language="zh",
-                vad_filter=False, 
-                no_speech_threshold=0.4,
-                log_prob_threshold=-0.8
-            )
+            if hit is not None:
+                print(f"🔁 [指纹] 命中重复音频，复用已有转写结果")
+                text = hit.text
+                segs, verdicts = [], []
+            else:
+                # Faster-Whisper 推理
+                segments, info = whisper_model.transcribe(
+                    audio_data, 
+                    beam_size=5, 
+                    language="zh",
+                    vad_filter=False, 
+                    no_speech_threshold=0.4,
+                    log_prob_threshold=-0.8
+                )
+                
+                # 按 segment 的解码置信度 / 压缩比 / 无语音概率 / 复读程度逐段打分过滤
+                segs = list(segments)
+                text, verdicts = hallucination_detector.filter_segments(segs)
+                for v in verdicts:
+                    if v.action != "keep":
+                        print(f"👻 [幻觉] {v.action} (score={v.score:.2f}, {'/'.join(v.reasons)}) {v.text}")
+                fingerprint_cache.add(fp, text, room_id)
+            
+            # 一次扫描同时匹配过滤词和触发词
+            events = matcher.match(text) if len(text) > 1 else []
+            
+            ignored = any(e.kind == "ignore" for e in events)
             
-            text = "".join([segment.text for segment in segments]).strip()
+            # 近似重复过滤 (滑动时间窗内的 n-gram 相似度)，不再只和上一句做精确比较
+            dup_action = "new"
+            if len(text) > 1 and not ignored:
+                dup_action, text = dedup.check(text)
+                if dup_action == "duplicate":
+                    print(f"♻️ [去重] 跳过近似重复: {text}")
             
-            if len(text) > 1 and text != last_text and not is_hallucination(text):
+            if len(text) > 1 and dup_action != "duplicate" and not ignored:
                 cost_time = time.time() - start_t
                 timestamp = time.strftime("%H:%M:%S")
                 
+                # 结构化记录 (录像时间轴位置、置信度、耗时)；字幕先于切片触发写入，切片能带上触发的这句
+                record = segment_record.SegmentRecord.from_segments(room_id, session_id, chunk_offset, model_name, text, segs, verdicts, cost_time)
+                cue_end = record.stream_offset + (record.duration or len(audio_data) / 16000.0)
+                live_subtitles.add(record.stream_offset, cue_end, text)
+                
                 # === 新增：关键词触发器 ===
-                trigger_keywords = ["切片飞来", "切片飞莱", "贴片飞来","切片飛來","切片飛来"]
-                if any(kw in text for kw in trigger_keywords):
+                for e in events:
+                    if e.kind == "trigger":
+                        print(f"🎯 [关键词] 命中「{e.phrase}」-> 「{e.text}」 位置 {e.start}-{e.end} (拼音距离 {e.distance})")
+                if any(e.kind == "trigger" for e in events):
                     make_clip(time.time(), streamer_name)
                 
                 # 1. 发送给 UI
@@ -297,23 +606,89 @@ def run_transcriber(streamer_name, room_id):
                 console_msg = f"[{timestamp}] (🚀{cost_time:.2f}s) {text}"
                 print(console_msg)
                 
-                # 3. 写入文件
-                with open(log_file, "a", encoding="utf-8") as f:
-                    f.write(console_msg.strip() + "\n")
+                # 3. 写入文件 (交给后台写入线程，不阻塞推理)
+                log_writer.write(console_msg.strip())
+                
+                # 4. 结构化记录
+                record_writer.write(record.to_json())
+                if archiver:
+                    archiver.add(record)
+                triggers = [e.phrase for e in events if e.kind == "trigger"]
+                sinks.publish({**record.to_dict(), "streamer": streamer_name, "triggers": triggers})
+                
+                # 5. 热词统计：本场出现率明显高于房间基线的词 (梗、新昵称)
+                term_stats.add(room_id, session_id, text)
+                lines_emitted += 1
+                if AUTO_HIGHLIGHT and lines_emitted % HIGHLIGHT_TREND_EVERY == 0:
+                    highlights.set_trending(room_id, term_stats.trending(room_id, key=session_id))
+                if lines_emitted % TREND_REPORT_EVERY == 0:
+                    trending = term_stats.trending(room_id, key=session_id, k=5)
+                    if trending:
+                        msg = f"📈 [热词] 本场趋势: {term_analytics.format_trending(trending)}"
+                        ui_queue.put(msg)
+                        print(msg)
                 
-                last_text = text
+                if first_line:
+                    first_line = False
+                    msg = f"⏱️ [系统] 首条字幕耗时: {time.time() - started_at:.1f}s (自点击启动)"
+                    ui_queue.put(msg)
+                    print(msg)
+                
+            # 6. 高光检测 (每段一次，过滤掉的句子不算文本信号；指纹命中的重复音频不参与)
+            if hit is None:
+                kept = len(text) > 1 and dup_action != "duplicate" and not ignored
+                observe_highlight(streamer_name, room_id, chunk_offset, len(audio_data), speech, text if kept else "", events)
                 
         except Exception as e:
             err_msg = f"❌ [错误] 转写异常: {e}"
             ui_queue.put(err_msg)
             print(err_msg)
+    
+    log_writer.close()
+    record_writer.close()
+    live_subtitles.close()
+    if speech_writer:
+        speech_writer.close()
+    if danmaku:
+        danmaku.close()
+    segment_record.update_manifest(
+        current_manifest_file,
+        ended_at=int(time.time()),
+        log_files=log_writer.paths,
+        records_files=record_writer.paths,
+    )
+    if archiver:
+        archiver.close()
+    sinks.close()
+    if REFINE_QUEUE_FILE:
+        refine_transcript.enqueue(REFINE_QUEUE_FILE, current_manifest_file)
+        ui_queue.put(f"🔬 [系统] 已登记赛后精修: {current_manifest_file}")
+    
+    # 会话结束时汇报指纹缓存命中率、去重统计、各输出送达情况与本场高频词
+    top_terms = term_stats.top(room_id, key=session_id, k=10)
+    term_stats.save()
+    if AUTO_HIGHLIGHT:
+        highlights.save(highlight_detector.STATE_FILE)
+    reports = [fingerprint_cache.report(), dedup.report(), clip_jobs.report()] + sinks.reports()
+    if speech_writer:
+        reports.append(speech_writer.report())
+    if AUTO_HIGHLIGHT:
+        reports.append(highlights.report())
+    if danmaku:
+        reports.append(danmaku.report())
+    if top_terms:
+        reports.append("📈 [热词] 本场高频: " + "、".join(f"{t}×{int(c)}" for t, c in top_terms))
+    for report_msg in reports:
+        ui_queue.put(report_msg)
+        print(report_msg)
 
 # ================= GUI 界面类 =================
 # ... 后面的 WinSubtitleApp 类代码保持原样，没有任何修改，无需改动 ...
 class WinSubtitleApp:
     def __init__(self, root):
         self.root = root
-        self.root.title(f"Bilibili Live Whisper (Win CUDA版) - {MODEL_SIZE}")
+        self.root.title("Bilibili Live Whisper (Win CUDA版) - 模型加载中...")
+        self.room_config = {}  # 最近一次加载的房间 json (关键词等)
         self.root.geometry("640x720")
         
         # --- 配置区域 ---
@@ -342,7 +717,8 @@ class WinSubtitleApp:
         frame_btns = tk.Frame(root, pady=10)
         frame_btns.pack(fill="x")
         
-        self.btn_start = tk.Button(frame_btns, text="▶ 启动字幕", bg="#98FB98", command=self.start_processing, width=15, height=2, font=("微软雅黑", 10, "bold"))
+        # 模型就绪前禁用启动按钮，由 process_ui_queue 在就绪后解锁
+        self.btn_start = tk.Button(frame_btns, text="⏳ 模型加载中", bg="#98FB98", command=self.start_processing, width=15, height=2, font=("微软雅黑", 10, "bold"), state="disabled")
         self.btn_start.pack(side="left", padx=40, expand=True)
         
         self.btn_stop = tk.Button(frame_btns, text="⏹ 停止连接", bg="#FFB6C1", command=self.stop_processing, width=15, height=2, font=("微软雅黑", 10, "bold"), state="disabled")
@@ -355,6 +731,7 @@ class WinSubtitleApp:
         self.text_area.tag_config("sys", foreground="gray", font=("Microsoft YaHei", 9))
         self.text_area.tag_config("err", foreground="red")
         
+        self.models_ready_shown = False
         self.root.after(100, self.process_ui_queue)
 
     def log_to_ui(self, message, tag=None):
@@ -385,6 +762,7 @@ class WinSubtitleApp:
         try:
             with open(path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
+                self.room_config = data
                 self.entry_room.delete(0, tk.END)
                 self.entry_room.insert(0, str(data.get("room_id", "")))
                 self.entry_name.delete(0, tk.END)
@@ -407,11 +785,19 @@ class WinSubtitleApp:
             msg = ui_queue.get()
             if "❌" in msg:
                 self.log(msg, "err")
-            elif "🔗" in msg or "🎧" in msg or "🛑" in msg or "📝" in msg or "✅" in msg or "⚠️" in msg:
+            elif "🔗" in msg or "🎧" in msg or "🛑" in msg or "📝" in msg or "✅" in msg or "⚠️" in msg or "🛠" in msg or "🖥️" in msg or "⏱️" in msg or "🔁" in msg or "♻️" in msg or "📈" in msg or "📤" in msg or "🧹" in msg or "🌟" in msg or "💬" in msg or "🔬" in msg:
                 self.log(msg, "sys")
             else:
                 self.log(msg) 
         
+        # 模型加载完成后解锁启动按钮 (Tk 控件只能在主线程里改)
+        if models_ready_event.is_set() and not self.models_ready_shown:
+            self.models_ready_shown = True
+            self.root.title(f"Bilibili Live Whisper (Win CUDA版) - {MODEL_SIZE}")
+            if not running_event.is_set():
+                self.btn_start.config(state="normal")
+            self.btn_start.config(text="▶ 启动字幕")
+        
         self.root.after(100, self.process_ui_queue)
 
     def start_processing(self):
@@ -422,7 +808,7 @@ class WinSubtitleApp:
             messagebox.showwarning("提示", "请输入房间号")
             return
             
-        if running_event.is_set():
+        if running_event.is_set() or not models_ready_event.is_set():
             return
             
         running_event.set()
@@ -434,7 +820,9 @@ class WinSubtitleApp:
         t1 = threading.Thread(target=run_stream_producer, args=(room_id,), daemon=True)
         t1.start()
         
-        t2 = threading.Thread(target=run_transcriber, args=(name, room_id), daemon=True)
+        # 手动改了房间号时，不沿用其他房间的关键词配置
+        room_config = self.room_config if str(self.room_config.get("room_id", "")) == room_id else {}
+        t2 = threading.Thread(target=run_transcriber, args=(name, room_id, room_config), daemon=True)
         t2.start()
 
     def stop_processing(self):
@@ -456,8 +844,20 @@ if __name__ == "__main__":
     app = WinSubtitleApp(root)
     def on_closing():
         running_event.clear()
+        if remux_jobs.pending():
+            print(f"⚠️ [系统] 还有 {remux_jobs.pending()} 个录像没封装完，原 .ts 已保留，可稍后运行 python remux_worker.py 补做")
         root.destroy()
         sys.exit(0)
     root.protocol("WM_DELETE_WINDOW", on_closing)
     
+    # 窗口画出来之后再开始加载模型
+    def on_window_ready():
+        msg = f"⏱️ [系统] 窗口弹出耗时: {time.time() - APP_START_TIME:.2f}s"
+        ui_queue.put(msg)
+        print(msg)
+        threading.Thread(target=load_models, daemon=True).start()
+        if retention:
+            retention.start(RETENTION_INTERVAL)
+    root.after_idle(on_window_ready)
+    
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+
+# ================= 配置区 =================
+# 本地模型仓库目录，可用环境变量指向共享盘 (多进程共用同一份文件，共享 page cache)
+MODEL_STORE_DIR = os.environ.get(
+    "BILI_MODEL_STORE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+)
+MANIFEST_NAME = "manifest.json"
+
+# 为 True 时，仓库里缺模型直接报错，绝不联网 (离线节点建议打开)
+OFFLINE_ONLY = os.environ.get("BILI_MODEL_OFFLINE_ONLY", "") == "1"
+
+# faster-whisper 的模型名 -> Hugging Face 仓库 (与 faster_whisper.utils 中的对应关系一致)
+FASTER_WHISPER_REPOS = {
+    "tiny": "Systran/faster-whisper-tiny",
+    "base": "Systran/faster-whisper-base",
+    "small": "Systran/faster-whisper-small",
+    "medium": "Systran/faster-whisper-medium",
+    "large-v2": "Systran/faster-whisper-large-v2",
+    "large-v3": "Systran/faster-whisper-large-v3",
+}
+
+SILERO_VAD_NAME = "silero-vad"
+
+
+def store_name(repo_id):
+    """仓库内的目录名：取 HF 仓库 id 的最后一段，例如 whisper-large-v3-mlx"""
+    return repo_id.rstrip("/").split("/")[-1]
+
+
+# ================= 清单读写 =================
+
+def _manifest_path():
+    return os.path.join(MODEL_STORE_DIR, MANIFEST_NAME)
+
+
+def read_manifest():
+    if not os.path.exists(_manifest_path()):
+        return {"models": {}}
+    with open(_manifest_path(), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(manifest):
+    os.makedirs(MODEL_STORE_DIR, exist_ok=True)
+    # 临时文件名带进程号：多个进程同时入库 / 全量校验时不会互相覆盖半写的文件
+    tmp = f"{_manifest_path()}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, _manifest_path())
+
+
+def sha256_file(path, block_size=4 * 1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+# ================= 入库与校验 =================
+
+def add_model(name, src_path):
+    """把一个已下载好的模型目录 (或单个文件) 拷进仓库并记录每个文件的校验和"""
+    dst = os.path.join(MODEL_STORE_DIR, name)
+    if os.path.abspath(src_path) != os.path.abspath(dst):
+        if os.path.exists(dst):
+            shutil.rmtree(dst)
+        if os.path.isdir(src_path):
+            # .git 之类的元数据不需要
+            shutil.copytree(src_path, dst, ignore=shutil.ignore_patterns(".git", "__pycache__", ".cache"))
+        else:
+            os.makedirs(dst, exist_ok=True)
+            shutil.copy2(src_path, dst)
+
+    files = {}
+    for root, _, names in os.walk(dst):
+        for fn in names:
+            full = os.path.join(root, fn)
+            rel = os.path.relpath(full, dst).replace(os.sep, "/")
+            st = os.stat(full)
+            files[rel] = {"sha256": sha256_file(full), "size": st.st_size, "verified_mtime": st.st_mtime}
+
+    manifest = read_manifest()
+    manifest["models"][name] = {
+        "files": files,
+        "added_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    write_manifest(manifest)
+    print(f"✅ [模型仓库] 已入库 {name} ({len(files)} 个文件)")
+    return dst
+
+
+def verify_model(name, full=False, manifest=None):
+    """
+    校验模型文件。
+    默认是启动时的快速检查：比对文件是否齐全、大小是否一致，只对 mtime 与上次全量校验时不同的文件重算 sha256，
+    不写清单 (只读仓库、多个进程同时启动都没问题)。mtime 没变的文件不会重算，真正的完整性检查请用 full=True
+    (python model_store.py verify)，全量校验通过后才把新的 mtime 写回清单。
+    """
+    manifest = manifest or read_manifest()
+    entry = manifest["models"].get(name)
+    if not entry:
+        return False
+    base = os.path.join(MODEL_STORE_DIR, name)
+    changed = False
+    for rel, info in entry["files"].items():
+        full_path = os.path.join(base, rel)
+        if not os.path.exists(full_path):
+            print(f"❌ [模型仓库] {name} 缺少文件: {rel}")
+            return False
+        st = os.stat(full_path)
+        if st.st_size != info["size"]:
+            print(f"❌ [模型仓库] {name} 文件大小不符: {rel}")
+            return False
+        if full or st.st_mtime != info.get("verified_mtime"):
+            if sha256_file(full_path) != info["sha256"]:
+                print(f"❌ [模型仓库] {name} 校验和不符: {rel}")
+                return False
+            info["verified_mtime"] = st.st_mtime
+            changed = True
+    if changed and full:
+        write_manifest(manifest)
+    return True
+
+
+def enable_offline():
+    """
+    禁止 huggingface / transformers 联网。huggingface_hub 在 import 时就读取这两个环境变量，
+    所以必须在 import faster_whisper / mlx_whisper 之前调用 (本模块被 import 时按 OFFLINE_ONLY 自动调用)。
+    """
+    os.environ["HF_HUB_OFFLINE"] = "1"
+    os.environ["TRANSFORMERS_OFFLINE"] = "1"
+
+
+if OFFLINE_ONLY:
+    enable_offline()
+
+
+def local_path(name):
+    """模型在仓库中且校验通过时返回本地目录 (传目录给加载函数时不会访问 HF)，否则返回 None"""
+    if not os.path.exists(_manifest_path()):
+        return None
+    if not verify_model(name):
+        return None
+    return os.path.join(MODEL_STORE_DIR, name)
+
+
+def _fallback(name, remote):
+    if OFFLINE_ONLY:
+        raise FileNotFoundError(f"本地模型仓库中没有可用的 {name} (OFFLINE_ONLY 已开启): {MODEL_STORE_DIR}")
+    print(f"⚠️ [模型仓库] 本地没有 {name}，回退到联网加载 {remote}")
+    return remote
+
+
+# ================= 加载入口 =================
+
+def resolve_faster_whisper(model_size):
+    """faster-whisper 模型：有本地副本就返回目录，否则返回原模型名"""
+    repo_id = FASTER_WHISPER_REPOS.get(model_size, model_size)
+    path = local_path(store_name(repo_id))
+    return path or _fallback(store_name(repo_id), model_size)
+
+
+def resolve_mlx_whisper(repo_id):
+    """mlx_whisper 模型：本地目录中的 safetensors 会被 MLX 以内存映射方式懒加载"""
+    path = local_path(store_name(repo_id))
+    return path or _fallback(store_name(repo_id), repo_id)
+
+
+def load_silero_vad():
+    """从仓库里的 silero-vad 源码目录加载 (torch.hub source='local')，返回 (model, utils)"""
+    import torch
+    path = local_path(SILERO_VAD_NAME)
+    if path:
+        return torch.hub.load(repo_or_dir=path, model='silero_vad', source='local')
+    _fallback(SILERO_VAD_NAME, "snakers4/silero-vad")
+    return torch.hub.load(repo_or_dir='snakers4/silero-vad',
+                          model='silero_vad',
+                          force_reload=False,
+                          trust_repo=True)
+
+
+# ================= 联网机器上预先拉取 =================
+
+def fetch_model(name):
+    """在能联网的机器上下载并入库，然后把整个 models 目录拷到离线节点即可"""
+    if name == SILERO_VAD_NAME:
+        import torch
+        torch.hub.load(repo_or_dir='snakers4/silero-vad', model='silero_vad', trust_repo=True)
+        src = os.path.join(torch.hub.get_dir(), "snakers4_silero-vad_master")
+        return add_model(name, src)
+
+    from huggingface_hub import snapshot_download
+    repo_id = FASTER_WHISPER_REPOS.get(name, name)
+    src = snapshot_download(repo_id)
+    return add_model(store_name(repo_id), src)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模型仓库：预先下载、入库、校验，离线节点无需联网")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_fetch = sub.add_parser("fetch", help="联网下载并入库，例如 silero-vad / large-v3 / mlx-community/whisper-large-v3-mlx")
+    p_fetch.add_argument("names", nargs="+")
+
+    p_add = sub.add_parser("add", help="把已有的模型目录拷进仓库")
+    p_add.add_argument("name")
+    p_add.add_argument("src")
+
+    p_verify = sub.add_parser("verify", help="全量校验仓库内所有模型")
+    p_verify.add_argument("names", nargs="*")
+
+    sub.add_parser("list", help="列出仓库内的模型")
+
+    args = parser.parse_args()
+    print(f"📦 [模型仓库] 目录: {MODEL_STORE_DIR}")
+
+    if args.cmd == "fetch":
+        for name in args.names:
+            fetch_model(name)
+    elif args.cmd == "add":
+        add_model(args.name, args.src)
+    elif args.cmd == "verify":
+        manifest = read_manifest()
+        names = args.names or list(manifest["models"])
+        bad = [n for n in names if not verify_model(n, full=True, manifest=manifest)]
+        for n in names:
+            print(f"{'❌' if n in bad else '✅'} {n}")
+        if bad:
+            sys.exit(1)
+    elif args.cmd == "list":
+        for name, entry in read_manifest()["models"].items():
+            size = sum(f["size"] for f in entry["files"].values())
+            print(f"  {name:<32} {size / 1024 / 1024:>10.1f} MB  入库于 {entry['added_at']}")
+
+
+if __name__ == "__main__":
+    main()
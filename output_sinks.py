@@ -0,0 +1,300 @@
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import threading
+import urllib.request
+from collections import deque
+
+# ================= 配置区 =================
+DEFAULT_QUEUE_SIZE = 1000     # 每个输出的缓冲上限 (条)
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_BATCH_INTERVAL = 0.5  # 秒：攒不满一批也按时发送
+DEFAULT_MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5           # 秒，每次重试翻倍
+LATENCY_SAMPLES = 200         # 计算延迟分位数的样本窗口
+
+
+class Sink:
+    """
+    一个输出目标：独立的有界队列 + 独立的发送线程。
+    转写线程只调用 offer()，永远不阻塞；队列满时按 on_full 丢弃最新 (drop_new) 或最旧 (drop_oldest)。
+    发送失败按指数退避重试 max_retries 次，仍失败则整批丢弃并计数。
+    子类只需实现 send(batch)；要占用的资源 (文件、stdout) 在 super().__init__ 校验完参数之后再拿，
+    拿失败时 close() 掉已经起来的发送线程再抛出。
+    """
+
+    kind = "sink"
+
+    def __init__(self, name=None, queue_size=DEFAULT_QUEUE_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+                 batch_interval=DEFAULT_BATCH_INTERVAL, on_full="drop_oldest", max_retries=DEFAULT_MAX_RETRIES):
+        if on_full not in ("drop_new", "drop_oldest"):
+            raise ValueError(f"on_full 只能是 drop_new / drop_oldest: {on_full}")
+        self.name = name or self.kind
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.on_full = on_full
+        self.max_retries = max_retries
+        self.stats = {"offered": 0, "delivered": 0, "dropped": 0, "retries": 0, "failed_batches": 0}
+        self._stats_lock = threading.Lock()     # 转写线程 (offer) 和发送线程都会改计数
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"sink-{self.name}", daemon=True)
+        self._thread.start()
+
+    # ---------- 转写线程调用 ----------
+
+    def offer(self, item):
+        self._count(offered=1)
+        entry = (time.time(), item)
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            if self.on_full == "drop_new":
+                self._count(dropped=1)
+                return
+            dropped = 0
+            try:
+                self._queue.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(entry)
+            except queue.Full:
+                dropped += 1        # 腾出的位置被别的线程抢先占了，这条也没放进去
+            self._count(dropped=dropped)
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for k, v in deltas.items():
+                self.stats[k] += v
+
+    def close(self, timeout=5):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    # ---------- 发送线程 ----------
+
+    def send(self, batch):
+        raise NotImplementedError
+
+    def shutdown(self):
+        """发送线程退出前调用，子类在这里关闭连接 / 文件"""
+
+    def _deliver(self, batch):
+        items = [item for _, item in batch]
+        delay = RETRY_BACKOFF
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.send(items)
+                now = time.time()
+                with self._stats_lock:
+                    self.latencies.extend(now - t for t, _ in batch)
+                    self.stats["delivered"] += len(batch)
+                return
+            except Exception as e:
+                if attempt == self.max_retries or self._stop.is_set():
+                    self._count(failed_batches=1, dropped=len(batch))
+                    print(f"⚠️ [输出] {self.name} 发送失败，丢弃 {len(batch)} 条: {e}")
+                    return
+                self._count(retries=1)
+                time.sleep(delay)
+                delay *= 2
+
+    def _run(self):
+        batch = []
+        deadline = time.time() + self.batch_interval
+        while True:
+            try:
+                batch.append(self._queue.get(timeout=max(0.0, deadline - time.time())))
+            except queue.Empty:
+                pass
+            stopping = self._stop.is_set()
+            if stopping:
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+            if batch and (stopping or len(batch) >= self.batch_size or time.time() >= deadline):
+                for i in range(0, len(batch), self.batch_size):
+                    self._deliver(batch[i:i + self.batch_size])
+                batch = []
+            if time.time() >= deadline:
+                deadline = time.time() + self.batch_interval
+            if stopping:
+                break
+        self.shutdown()
+
+    def report(self):
+        with self._stats_lock:
+            s = dict(self.stats)
+            lat = sorted(self.latencies)
+        if lat:
+            p50 = lat[len(lat) // 2] * 1000
+            p95 = lat[min(len(lat) - 1, int(len(lat) * 0.95))] * 1000
+            lat_text = f"延迟 p50 {p50:.0f}ms / p95 {p95:.0f}ms"
+        else:
+            lat_text = "延迟 -"
+        return (f"📤 [输出] {self.name}: 送达 {s['delivered']}/{s['offered']} | 丢弃 {s['dropped']} | "
+                f"重试 {s['retries']} | {lat_text} | 积压 {self._queue.qsize()}")
+
+
+def _jsonl(items):
+    return "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in items)
+
+
+class FileSink(Sink):
+    """追加写 JSONL 文件"""
+    kind = "file"
+
+    def __init__(self, path, **kwargs):
+        self.path = path
+        self._file = None
+        super().__init__(name=kwargs.pop("name", f"file:{path}"), **kwargs)
+        try:
+            self._file = open(path, "a", encoding="utf-8")
+        except OSError:
+            self.close()
+            raise
+
+    def send(self, batch):
+        self._file.write(_jsonl(batch))
+        self._file.flush()
+
+    def shutdown(self):
+        if self._file is not None:
+            self._file.close()
+
+
+_stdout_stream = None
+_stdout_lock = threading.Lock()
+
+
+def claim_stdout():
+    """
+    把进程的标准输出留给 JSONL：复制一份原来的 fd 1 专门写 JSONL，再把 fd 1 指向 stderr，
+    之后 GUI 的控制台 print (以及继承 fd 1 的子进程) 都进 stderr，管道下游只会读到 JSONL。整个进程只做一次。
+    """
+    global _stdout_stream
+    with _stdout_lock:
+        if _stdout_stream is None:
+            if sys.stdout is None or sys.stderr is None:
+                raise RuntimeError("没有可用的标准输出 / 标准错误 (用 pythonw 启动时不能使用 stdout 输出)")
+            sys.stdout.flush()
+            fd = os.dup(sys.stdout.fileno())
+            os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+            _stdout_stream = os.fdopen(fd, "w", encoding="utf-8", newline="\n")
+        return _stdout_stream
+
+
+class StdoutSink(Sink):
+    """标准输出 JSONL (给管道下游用)；创建时控制台输出改走 stderr，stdout 上只有 JSONL"""
+    kind = "stdout"
+
+    def __init__(self, **kwargs):
+        # 先校验参数：配置写错时不能已经把进程的 stdout 改走了
+        super().__init__(**kwargs)
+        try:
+            self._out = claim_stdout()
+        except Exception:
+            self.close()
+            raise
+
+    def send(self, batch):
+        with _stdout_lock:
+            self._out.write(_jsonl(batch))
+            self._out.flush()
+
+
+class UnixSocketSink(Sink):
+    """Unix 域套接字 (流式 JSONL)，断开后下次发送时自动重连"""
+    kind = "unix"
+
+    def __init__(self, path, timeout=2.0, **kwargs):
+        if not hasattr(socket, "AF_UNIX"):
+            raise RuntimeError("当前系统不支持 Unix 域套接字")
+        self.path = path
+        self.timeout = timeout
+        self._sock = None
+        super().__init__(name=kwargs.pop("name", f"unix:{path}"), **kwargs)
+
+    def send(self, batch):
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            self._sock = sock
+        try:
+            self._sock.sendall(_jsonl(batch).encode("utf-8"))
+        except OSError:
+            self._sock.close()
+            self._sock = None
+            raise
+
+    def shutdown(self):
+        if self._sock is not None:
+            self._sock.close()
+
+
+class WebhookSink(Sink):
+    """本地 HTTP webhook：每批 POST 一个 JSON 数组"""
+    kind = "webhook"
+
+    def __init__(self, url, timeout=3.0, headers=None, **kwargs):
+        self.url = url
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+        super().__init__(name=kwargs.pop("name", f"webhook:{url}"), **kwargs)
+
+    def send(self, batch):
+        body = json.dumps(batch, ensure_ascii=False).encode("utf-8")
+        req = urllib.request.Request(self.url, data=body, headers=self.headers, method="POST")
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            resp.read()
+
+
+SINK_TYPES = {cls.kind: cls for cls in (FileSink, StdoutSink, UnixSocketSink, WebhookSink)}
+
+
+class SinkFanout:
+    """把每条定稿的转写分发给所有输出；任何一个输出慢或挂掉都不影响其他输出和转写线程"""
+
+    def __init__(self, sinks=()):
+        self.sinks = list(sinks)
+
+    @classmethod
+    def from_config(cls, configs):
+        """
+        房间 json 的 "sinks" 字段，例如:
+        [{"type": "webhook", "url": "http://127.0.0.1:9000/hook", "on_full": "drop_oldest"},
+         {"type": "file", "path": "out.jsonl", "batch_size": 50}]
+        """
+        sinks = []
+        for conf in configs or ():
+            conf = dict(conf)
+            kind = conf.pop("type", None)
+            sink_cls = SINK_TYPES.get(kind)
+            if sink_cls is None:
+                print(f"⚠️ [输出] 未知的输出类型: {kind}")
+                continue
+            try:
+                sinks.append(sink_cls(**conf))
+            except Exception as e:
+                print(f"⚠️ [输出] 创建 {kind} 输出失败: {e}")
+        return cls(sinks)
+
+    def publish(self, item):
+        for sink in self.sinks:
+            sink.offer(item)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    def reports(self):
+        return [sink.report() for sink in self.sinks]
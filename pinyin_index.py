@@ -0,0 +1,140 @@
+import re
+
+from keyword_matcher import normalize_text, to_syllables, fuzzy_syllable, lazy_pinyin, _approx_find
+
+# ================= 配置区 =================
+# 每批从 segments 表取多少行转拼音
+INDEX_BATCH_ROWS = 5000
+# 分片粗筛最多取多少条候选再做编辑距离校验
+CANDIDATE_LIMIT = 2000
+
+# 拼音副索引：每条转写存一份 "模糊拼音音节" 串 (空格分隔)，同音 / 近音错字在这一层是同一个词
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS segments_pinyin USING fts5(syllables, tokenize='unicode61');
+CREATE TABLE IF NOT EXISTS index_state (
+    name    TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS segments_pinyin_ad AFTER DELETE ON segments BEGIN
+    DELETE FROM segments_pinyin WHERE rowid = old.id;
+END;
+"""
+
+_PINYIN_SPLIT_RE = re.compile(r"[\s'’,，]+")
+_warned = False
+
+
+def ensure_schema(conn):
+    conn.executescript(SCHEMA)
+
+
+def query_syllables(query):
+    """查询可以是汉字 ("绝命山主") 也可以是空格分隔的拼音 ("jue ming shan zhu")"""
+    norm = normalize_text(query)
+    if any("一" <= ch <= "鿿" for ch in norm):
+        syls, _ = to_syllables(norm)
+        return syls
+    return [fuzzy_syllable(s) for s in _PINYIN_SPLIT_RE.split(norm.strip()) if s]
+
+
+# ================= 增量建索引 =================
+
+def index_new(conn, batch_rows=INDEX_BATCH_ROWS):
+    """
+    把上次建索引之后新增的 segments 转成拼音写入副索引，返回本次处理的行数。
+    按行号推进进度，依赖 segments.id 是 AUTOINCREMENT (删掉的行号不会被新行复用)。
+    没装 pypinyin 时不推进进度，装上之后再调用会自动补齐。
+    """
+    global _warned
+    if lazy_pinyin is None:
+        if not _warned:
+            _warned = True
+            print("⚠️ [拼音索引] 未安装 pypinyin，拼音检索不可用 (pip install pypinyin)")
+        return 0
+
+    row = conn.execute("SELECT last_id FROM index_state WHERE name = 'pinyin'").fetchone()
+    last_id = row[0] if row else 0
+    total = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, text FROM segments WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_rows)
+        ).fetchall()
+        if not rows:
+            break
+        entries = []
+        for seg_id, text in rows:
+            syls, _ = to_syllables(normalize_text(text))
+            if syls:
+                entries.append((seg_id, " ".join(syls)))
+        last_id = rows[-1][0]
+        with conn:
+            conn.executemany("INSERT INTO segments_pinyin(rowid, syllables) VALUES (?, ?)", entries)
+            conn.execute(
+                "INSERT INTO index_state(name, last_id) VALUES ('pinyin', ?) "
+                "ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id",
+                (last_id,),
+            )
+        total += len(rows)
+    return total
+
+
+def rebuild(conn):
+    """清空拼音索引从头重建 (例如更换了模糊音规则)"""
+    with conn:
+        conn.execute("DELETE FROM segments_pinyin")
+        conn.execute("DELETE FROM index_state WHERE name = 'pinyin'")
+    return index_new(conn)
+
+
+# ================= 检索 =================
+
+def search(conn, query, max_distance=1, room=None, since=None, until=None, limit=50):
+    """
+    按读音检索，返回 [(room, session, wall_time, stream_offset, text, snippet, distance), ...]
+    排序：音节编辑距离优先，其次 FTS 相关度。
+    做法与 KeywordMatcher 一致：查询切成 k+1 片，任一片精确命中的才是候选 (鸽巢原理)，再逐条算编辑距离。
+    """
+    pattern = query_syllables(query)
+    if not pattern:
+        return []
+    # 太短的查询只做同音匹配，避免一个音节的误差就匹配到一大片
+    k = min(max_distance, (len(pattern) - 1) // 3)
+    pieces = k + 1
+    bounds = [round(len(pattern) * p / pieces) for p in range(pieces + 1)]
+    match_expr = " OR ".join(
+        '"' + " ".join(pattern[bounds[p]:bounds[p + 1]]) + '"' for p in range(pieces)
+    )
+
+    sql = (
+        "SELECT s.room, s.session, s.wall_time, s.stream_offset, s.text, p.syllables "
+        "FROM segments_pinyin p JOIN segments s ON s.id = p.rowid "
+        "WHERE segments_pinyin MATCH ?"
+    )
+    params = [match_expr]
+    if room:
+        sql += " AND s.room = ?"
+        params.append(str(room))
+    if since:
+        sql += " AND s.wall_time >= ?"
+        params.append(since)
+    if until:
+        sql += " AND s.wall_time < ?"
+        params.append(until)
+    sql += " ORDER BY p.rank LIMIT ?"
+    params.append(CANDIDATE_LIMIT)
+
+    hits = []
+    for order, (room_, session, wall_time, offset, text, syllables) in enumerate(conn.execute(sql, params)):
+        seg_syls = syllables.split()
+        dist, w_start, w_end = _approx_find(pattern, seg_syls)
+        if dist > k or w_end <= w_start:
+            continue
+        # 把命中的音节区间映射回原文标出来
+        _, idx = to_syllables(normalize_text(text))
+        snippet = text
+        if len(idx) == len(seg_syls):
+            start, end = idx[w_start], idx[w_end - 1] + 1
+            snippet = f"{text[:start]}【{text[start:end]}】{text[end:]}"
+        hits.append(((dist, order), (room_, session, wall_time, offset, text, snippet, dist)))
+    hits.sort(key=lambda h: h[0])
+    return [h[1] for h in hits[:limit]]
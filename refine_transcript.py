@@ -0,0 +1,385 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import datetime
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+import batch_transcribe
+import hallucination_detector
+import keyword_matcher
+import model_store
+import segment_record
+import speech_archive
+
+# ================= 配置区 =================
+BEST_MODEL = "large-v3"       # 不赶时间，默认用最大的模型
+COMPUTE_TYPE = "int8"
+BEAM_SIZE = 5
+WINDOW_SECONDS = 300          # 每个任务连续处理的语音时长：段与段之间用上文作提示，任务之间并行
+PROMPT_CHARS = 120            # 作为下一段提示的上文长度 (字)
+LIVE_CHUNK_SECONDS = 8.0      # 实时记录没有 duration 时按一个切片的长度算
+NICE = 19                     # 整个任务 (含工作进程) 的 nice 值；Windows 用“空闲”优先级
+QUEUE_FILE = "refine_queue.txt"   # GUI 每场结束后把会话清单追加到这里，夜里统一处理
+PARTIAL_SUFFIX = ".refine.partial.jsonl"   # 已完成窗口的缓存，中断后重跑跳过
+REPORT_SUFFIX = ".refine_report.txt"
+
+_PUNCT_RE = re.compile(r"[\s\W_]+", re.UNICODE)
+
+
+# ================= 工作进程 =================
+
+def _refine_window(index, pieces):
+    """
+    在工作进程里按顺序转写一个窗口内的各段：每段以前一段的结尾作为提示词，
+    段内 condition_on_previous_text，比实时的 8 秒切片多得多的上下文。
+    返回的 segment 时间已换算成直播流秒。
+    """
+    model = batch_transcribe._worker_model
+    t0 = time.time()
+    prompt = None
+    out = []
+    for offset, pcm in pieces:
+        audio = np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+        segments, info = model.transcribe(
+            audio,
+            beam_size=BEAM_SIZE,
+            language="zh",
+            vad_filter=False,
+            condition_on_previous_text=True,
+            initial_prompt=prompt,
+            no_speech_threshold=0.4,
+            log_prob_threshold=-0.8,
+        )
+        segs = [{"start": offset + s.start, "end": offset + s.end, "text": s.text, "avg_logprob": s.avg_logprob,
+                 "compression_ratio": s.compression_ratio, "no_speech_prob": s.no_speech_prob} for s in segments]
+        text = "".join(s["text"] for s in segs).strip()
+        prompt = text[-PROMPT_CHARS:] if text else prompt
+        out.extend(segs)
+    return index, pieces[0][0], out, time.time() - t0
+
+
+def lower_own_priority(nice=NICE):
+    """把当前进程调到最低优先级；之后创建的工作进程会继承"""
+    if sys.platform == "win32":
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), 0x00000040)   # IDLE_PRIORITY_CLASS
+    elif hasattr(os, "nice"):
+        try:
+            os.nice(nice)
+        except OSError:
+            pass
+
+
+# ================= 对齐与比较 =================
+
+def normalize_for_cer(text):
+    return _PUNCT_RE.sub("", keyword_matcher.normalize_text(text or ""))
+
+
+def edit_distance(a, b):
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+def align(live, refined):
+    """
+    按直播流时间把精修 segment 分配给重叠最多的实时记录 (两者都按时间排好序，双指针一遍扫完)。
+    返回 (每条实时记录对应的精修 segment 列表, 没有对上任何实时记录的精修 segment, 合并去向)。
+    一个精修 segment 跨了两条实时记录时整段归重叠多的那条；另一条如果因此什么都没分到，
+    它的话其实还在 (被合并进了那条)，合并去向里记下那条的下标，不算删除；真正没有任何重叠的为 None。
+    """
+    groups = [[] for _ in live]
+    added = []
+    merged = [None] * len(live)
+    merged_overlap = [0.0] * len(live)
+    spans = [(r.stream_offset, r.stream_offset + (r.duration or LIVE_CHUNK_SECONDS)) for r in live]
+    j = 0
+    for seg in refined:
+        while j < len(spans) and spans[j][1] <= seg["start"]:
+            j += 1
+        best, best_overlap = None, 0.0
+        overlaps = []
+        k = j
+        while k < len(spans) and spans[k][0] < seg["end"]:
+            overlap = min(spans[k][1], seg["end"]) - max(spans[k][0], seg["start"])
+            if overlap > 0:
+                overlaps.append((k, overlap))
+            if overlap > best_overlap:
+                best, best_overlap = k, overlap
+            k += 1
+        if best is None:
+            added.append(seg)
+            continue
+        groups[best].append(seg)
+        for k, overlap in overlaps:
+            if k != best and overlap > merged_overlap[k]:
+                merged[k], merged_overlap[k] = best, overlap
+    merged = [m if not segs else None for m, segs in zip(merged, groups)]
+    return groups, added, merged
+
+
+def compare(live, refined):
+    """
+    对齐后逐条比较。返回 (修正后的行 [(直播流秒, 文本, segment 列表)], 报告条目 [(直播流秒, 文字)], 统计)。
+    CER 以修正文本为参考：被删掉的实时记录整条算错字，新增的精修文本整条算漏字；
+    被合并的实时记录和吸收它的那条拼在一起再和修正文本比。
+    """
+    groups, added, merged = align(live, refined)
+    absorbed = {}
+    for i, k in enumerate(merged):
+        if k is not None:
+            absorbed.setdefault(k, []).append(i)
+    lines, report = [], []
+    stats = {"changed": 0, "added": len(added), "removed": 0, "merged": 0, "dist": 0, "length": 0}
+    for i, (rec, segs) in enumerate(zip(live, groups)):
+        if not segs:
+            if merged[i] is not None:
+                stats["merged"] += 1
+                report.append((rec.stream_offset, f"= 实时 (合并进 {live[merged[i]].stream_offset:.1f}s 那条): {rec.text}"))
+            else:
+                stats["removed"] += 1
+                stats["dist"] += len(normalize_for_cer(rec.text))
+                report.append((rec.stream_offset, f"- 实时 (删除): {rec.text}"))
+            continue
+        text = "".join(s["text"] for s in segs)
+        lines.append((rec.stream_offset, text, segs))
+        live_text = "".join(live[m].text for m in sorted([i] + absorbed.get(i, [])))
+        a, b = normalize_for_cer(live_text), normalize_for_cer(text)
+        dist = edit_distance(a, b)
+        stats["dist"] += dist
+        stats["length"] += len(b)
+        if dist:
+            stats["changed"] += 1
+            report.append((rec.stream_offset, f"  CER {dist / max(len(b), 1):.0%}\n  - 实时: {live_text}\n  + 修正: {text}"))
+    for seg in added:
+        lines.append((seg["start"], seg["text"], [seg]))
+        stats["dist"] += len(normalize_for_cer(seg["text"]))
+        stats["length"] += len(normalize_for_cer(seg["text"]))
+        report.append((seg["start"], f"+ 修正 (新增): {seg['text']}"))
+    lines.sort(key=lambda x: x[0])
+    report.sort(key=lambda x: x[0])
+    stats["cer"] = stats["dist"] / max(stats["length"], 1)
+    return lines, report, stats
+
+
+# ================= 精修一场 =================
+
+def resolve(path, base_dir):
+    """清单里的路径是相对 GUI 工作目录 (即清单所在目录) 的"""
+    return path if not path or os.path.isabs(path) else os.path.join(base_dir, path)
+
+
+def pick_source(manifest, base_dir):
+    """优先用录像，录像被清理掉后依次用语音归档、清理时转出的音轨"""
+    for key in ("record_file", "speech_archive", "audio_file"):
+        path = resolve(manifest.get(key), base_dir)
+        if path and os.path.exists(path) and not os.path.isdir(path):
+            return path
+    return None
+
+
+def iter_windows(source):
+    """把 VAD 切好的段按 WINDOW_SECONDS 攒成窗口"""
+    spans = (batch_transcribe.iter_archive_spans(source) if source.endswith(speech_archive.ARCHIVE_SUFFIX)
+             else batch_transcribe.iter_media_spans(source))
+    window, seconds = [], 0.0
+    for offset, pcm in spans:
+        window.append((offset, pcm.tobytes()))
+        seconds += len(pcm) / batch_transcribe.SAMPLE_RATE
+        if seconds >= WINDOW_SECONDS:
+            yield window
+            window, seconds = [], 0.0
+    if window:
+        yield window
+
+
+def load_partial(path):
+    done = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                done[entry["offset"]] = entry["segments"]
+    return done
+
+
+def transcribe_windows(source, pool, workers, partial_path):
+    """并行转写所有窗口 (已缓存的跳过)，返回按时间排序的精修 segment"""
+    done = load_partial(partial_path)
+    if done:
+        print(f"⏯️ 已有 {len(done)} 个窗口的缓存，跳过")
+    results = dict(done)
+    inflight = set()
+    t0 = time.time()
+    audio_seconds = 0.0
+    with open(partial_path, "a", encoding="utf-8") as partial:
+        def collect(futures):
+            nonlocal audio_seconds
+            for fut in futures:
+                index, offset, segs, cost = fut.result()
+                key = round(offset, 3)
+                results[key] = segs
+                partial.write(json.dumps({"offset": key, "segments": segs}, ensure_ascii=False) + "\n")
+                partial.flush()
+                audio_seconds += segs[-1]["end"] - offset if segs else 0.0
+                print(f"🔬 窗口 {offset:.0f}s 完成，{len(segs)} 段，用时 {cost:.0f}s")
+
+        for index, window in enumerate(iter_windows(source)):
+            if round(window[0][0], 3) in done:
+                continue
+            while len(inflight) >= workers * 2:
+                finished, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                collect(finished)
+            inflight.add(pool.submit(_refine_window, index, window))
+        while inflight:
+            finished, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+            collect(finished)
+    elapsed = time.time() - t0
+    if audio_seconds:
+        print(f"⏱️ 转写 {audio_seconds / 60:.1f} 分钟，用时 {elapsed / 60:.1f} 分钟")
+    return sorted((s for segs in results.values() for s in segs), key=lambda s: s["start"])
+
+
+def refine_session(manifest_path, pool, workers, model_name):
+    manifest = segment_record.read_manifest(manifest_path)
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    if not manifest.get("ended_at"):
+        print(f"⚠️ 会话还没结束，跳过: {manifest_path}")
+        return False
+    source = pick_source(manifest, base_dir)
+    if not source:
+        print(f"⚠️ 找不到录像 / 语音归档，跳过: {manifest_path}")
+        return False
+    live = []
+    for path in manifest.get("records_files") or [manifest.get("records_file")]:
+        path = resolve(path, base_dir)
+        if path and os.path.exists(path):
+            live.extend(segment_record.read_jsonl(path))
+    live.sort(key=lambda r: r.stream_offset)
+
+    meta = segment_record.parse_log_name(manifest["log_file"])
+    streamer, room, session_ts = meta if meta else (manifest.get("streamer"), str(manifest.get("room")), manifest.get("started_at"))
+    out_dir = os.path.dirname(resolve(manifest["log_file"], base_dir))
+    out_base = os.path.join(out_dir, f"{streamer}_{room}_refined_log_{session_ts}")
+    start_wall = manifest.get("record_start_time") or session_ts
+    session_id = manifest.get("session") or f"{room}_{session_ts}"
+    print(f"🔬 精修 {manifest_path}: {source} ({len(live)} 条实时记录)")
+
+    refined = []
+    for seg in transcribe_windows(source, pool, workers, out_base + PARTIAL_SUFFIX):
+        verdict = hallucination_detector.judge_segment(seg)
+        if verdict.action != "drop" and len(verdict.text) > 1:
+            refined.append({**seg, "text": verdict.text, "verdict": verdict})
+    # 修正后的日志：实时记录逐条换成对上的精修文本，实时漏掉的按时间插入，没对上任何精修结果的删掉
+    lines, report, stats = compare(live, refined)
+
+    log_file, records_file, report_file = out_base + ".txt", out_base + ".jsonl", out_base + REPORT_SUFFIX
+    with open(log_file, "w", encoding="utf-8") as log_f, open(records_file, "w", encoding="utf-8") as rec_f:
+        for offset, text, segs in lines:
+            record = segment_record.SegmentRecord.from_segments(room, session_id, 0.0, model_name, text, segs,
+                                                                [s["verdict"] for s in segs], None)
+            record.wall_time = start_wall + record.stream_offset
+            hms = time.strftime("%H:%M:%S", time.localtime(record.wall_time))
+            log_f.write(f"[{hms}] (🚀0.00s) {text}\n")
+            rec_f.write(record.to_json() + "\n")
+    cer = stats["cer"]
+    with open(report_file, "w", encoding="utf-8") as f:
+        f.write(f"实时日志: {manifest['log_file']}\n修正日志: {log_file} ({model_name})\n"
+                f"实时 {len(live)} 条 -> 修正 {len(lines)} 条 | 改动 {stats['changed']} | 新增 {stats['added']} | "
+                f"删除 {stats['removed']} | 合并 {stats['merged']} | 实时日志 CER {cer:.1%}\n\n")
+        for offset, entry in report:
+            hms = time.strftime("%H:%M:%S", time.localtime(start_wall + offset))
+            f.write(f"[{hms}] {offset:.1f}s {entry}\n")
+    segment_record.update_manifest(manifest_path, refined_log_file=log_file, refined_records_file=records_file,
+                                   refine_report=report_file, refine_model=model_name, refine_cer=round(cer, 4))
+    os.remove(out_base + PARTIAL_SUFFIX)
+    print(f"✅ {log_file} | 改动 {stats['changed']} 条，新增 {stats['added']}，删除 {stats['removed']}，"
+          f"合并 {stats['merged']}，实时日志 CER {cer:.1%} -> {report_file}")
+    return True
+
+
+# ================= 排队与调度 =================
+
+def enqueue(queue_file, manifest_path):
+    """登记一场待精修的会话 (只追加，处理时按清单里的 refined_log_file 判断是否做过)"""
+    with open(queue_file, "a", encoding="utf-8") as f:
+        f.write(os.path.abspath(manifest_path) + "\n")
+
+
+def read_queue(queue_file):
+    if not os.path.exists(queue_file):
+        return []
+    with open(queue_file, "r", encoding="utf-8") as f:
+        paths = list(dict.fromkeys(line.strip() for line in f if line.strip()))
+    pending = []
+    for path in paths:
+        try:
+            if not segment_record.read_manifest(path).get("refined_log_file"):
+                pending.append(path)
+        except (OSError, ValueError):
+            continue
+    return pending
+
+
+def wait_until(hhmm):
+    """睡到下一个 HH:MM (例如 02:00，已经过了就等到明天)"""
+    now = datetime.datetime.now()
+    h, m = (int(x) for x in hhmm.split(":"))
+    target = now.replace(hour=h, minute=m, second=0, microsecond=0)
+    if target <= now:
+        target += datetime.timedelta(days=1)
+    print(f"⏳ 等到 {target:%Y-%m-%d %H:%M} 再开始")
+    time.sleep((target - now).total_seconds())
+
+
+# ================= 命令行 =================
+
+def main():
+    parser = argparse.ArgumentParser(description="直播结束后用大模型重新转写，修正实时日志并生成对比报告 (低优先级)")
+    parser.add_argument("manifests", nargs="*", help="会话清单 (*.manifest.json)")
+    parser.add_argument("--queue", default=None, help=f"处理排队文件里所有还没精修的会话，例如 {QUEUE_FILE}")
+    parser.add_argument("--wait-until", default=None, help="HH:MM，等到这个时间再开始 (例如 02:00)")
+    parser.add_argument("--model", default=BEST_MODEL)
+    parser.add_argument("--compute-type", default=COMPUTE_TYPE)
+    parser.add_argument("--workers", type=int, default=0, help="工作进程数，默认 CPU 核数 / 每进程线程数")
+    parser.add_argument("--threads", type=int, default=batch_transcribe.THREADS_PER_WORKER)
+    parser.add_argument("--normal-priority", action="store_true", help="不降低优先级")
+    args = parser.parse_args()
+
+    if args.wait_until:
+        wait_until(args.wait_until)
+    manifests = list(args.manifests) + (read_queue(args.queue) if args.queue else [])
+    if not manifests:
+        print("✅ 没有待精修的会话")
+        return
+    if not args.normal_priority:
+        lower_own_priority()
+
+    workers = args.workers or max(1, (os.cpu_count() or 2) // args.threads)
+    model_name = f"faster-whisper/{args.model}/{args.compute_type}"
+    print(f"🛠 {len(manifests)} 场会话，{workers} 个进程 x {args.threads} 线程，模型 {args.model} / {args.compute_type}")
+    with ProcessPoolExecutor(workers, initializer=batch_transcribe._init_worker,
+                             initargs=(model_store.resolve_faster_whisper(args.model), args.compute_type, args.threads)) as pool:
+        for path in manifests:
+            try:
+                refine_session(path, pool, workers, model_name)
+            except Exception as e:
+                print(f"❌ 精修失败 {path}: {e}")
+
+
+if __name__ == "__main__":
+    main()
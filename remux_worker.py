@@ -0,0 +1,154 @@
+import os
+import glob
+import time
+import queue
+import shutil
+import argparse
+import threading
+
+import segment_record
+import segment_recorder
+import subtitle_writer
+import clip_scheduler
+
+# ================= 配置区 =================
+DEFAULT_WORKERS = 1           # 同时进行的转封装数 (纯磁盘 I/O，多了只会互相抢)
+
+# 直接录成分片 MP4：moov 写在开头、每个关键帧一个分片，边录边能播放 / 拖动，录完不需要转封装
+FMP4_OUTPUT_ARGS = ["-c", "copy", "-f", "mp4", "-movflags", "+frag_keyframe+empty_moov+default_base_moof", "-flush_packets", "1"]
+
+
+def remux_cmd(src, dst, srt_path=None):
+    """录像 (.ts 文件或分段目录) -> .mp4 的 ffmpeg 命令，有字幕时作为软字幕轨一起封装"""
+    if os.path.isdir(src):
+        return segment_recorder.concat_cmd(src, dst, srt_path)
+    if srt_path:
+        return subtitle_writer.mux_cmd(src, srt_path, dst)
+    return ["ffmpeg", "-y", "-v", "error", "-i", src, "-c", "copy", "-movflags", "faststart", dst]
+
+
+def sidecar_srt(src):
+    """与录像同名的实时字幕 (非空才算)"""
+    path = os.path.splitext(src)[0] + ".srt"
+    return path if os.path.exists(path) and os.path.getsize(path) > 0 else None
+
+
+class RemuxJob:
+    __slots__ = ("src", "dst", "cmd", "manifest", "before_delete")
+
+    def __init__(self, src, dst, cmd, manifest=None, before_delete=None):
+        self.src = src
+        self.dst = dst
+        self.cmd = cmd
+        self.manifest = manifest
+        self.before_delete = before_delete
+
+
+class RemuxPool:
+    """
+    后台转封装：录制线程停下后只登记一个任务就返回，停止 -> 再次开始不用等。
+    ffmpeg 以低优先级运行；成功后才删除源文件 (或分段目录) 并把清单里的 record_file 改成 .mp4，
+    失败或程序中途退出时源文件原样保留，之后可以用 python remux_worker.py 补做。
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, ui_queue=None, creationflags=0, keep_source=False):
+        self.ui_queue = ui_queue
+        self.keep_source = keep_source
+        self.creationflags = creationflags
+        self._queue = queue.Queue()
+        self._active = 0
+        self.busy = set()           # 还没封装完的源文件 (清理时不能动)
+        self._lock = threading.Lock()
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"remux-worker-{i}", daemon=True).start()
+
+    def _notify(self, msg):
+        if self.ui_queue is not None:
+            self.ui_queue.put(msg)
+        print(msg)
+
+    def submit(self, src, dst=None, manifest=None, before_delete=None):
+        """
+        登记一个转封装任务。before_delete 在删除源文件前调用 (例如等还在读这份录像的切片切完)，
+        返回 False 时保留源文件 (还有人在读)。
+        """
+        dst = dst or os.path.splitext(src)[0] + ".mp4"
+        job = RemuxJob(src, dst, remux_cmd(src, dst, sidecar_srt(src)), manifest, before_delete)
+        with self._lock:
+            self._active += 1
+            self.busy.add(src)
+        self._queue.put(job)
+        self._notify(f"🔄 [系统] 已转入后台封装: {src} -> {dst} (排队 {self.pending()})")
+        return job
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            except Exception as e:
+                self._notify(f"❌ [错误] 格式转换失败: {e}")
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self.busy.discard(job.src)
+
+    def _run(self, job):
+        rc = clip_scheduler.run_low_priority(job.cmd, self.creationflags)
+        if rc != 0 or not os.path.exists(job.dst):
+            self._notify(f"⚠️ [系统] 封装失败 (退出码 {rc})，原录像保留: {job.src}")
+            return
+        keep = self.keep_source
+        if job.before_delete and job.before_delete() is False:
+            self._notify(f"⚠️ [系统] 还有切片在读这份录像，原录像保留: {job.src}")
+            keep = True
+        # 转换成功后删除原录像 (想保留就传 keep_source=True)
+        if not keep:
+            if os.path.isdir(job.src):
+                shutil.rmtree(job.src)
+            else:
+                os.remove(job.src)
+        if job.manifest:
+            segment_record.update_manifest(job.manifest, record_file=job.dst)
+        self._notify(f"✅ [系统] 视频已成功保存为: {job.dst}")
+
+    def pending(self):
+        with self._lock:
+            return self._active
+
+    def busy_files(self):
+        """还没封装完的源文件快照 (给清理线程用，不能直接读会被工作线程改动的 busy)"""
+        with self._lock:
+            return set(self.busy)
+
+    def wait(self, timeout=None):
+        """等所有任务结束，返回是否全部完成"""
+        deadline = None if timeout is None else time.time() + timeout
+        while self.pending():
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(0.5)
+        return True
+
+
+# ================= 命令行 =================
+
+def main():
+    parser = argparse.ArgumentParser(description="把遗留的 .ts 录像 / 分段目录补封装成 .mp4 (低优先级)")
+    parser.add_argument("paths", nargs="+", help="录像文件或分段目录，支持通配符")
+    parser.add_argument("--keep", action="store_true", help="保留原录像")
+    parser.add_argument("--manifest", default=None, help="同时更新这个会话清单里的 record_file")
+    args = parser.parse_args()
+
+    paths = [p for pattern in args.paths for p in (glob.glob(pattern) or [pattern])]
+    pool = RemuxPool(keep_source=args.keep)
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"⚠️ 找不到: {path}")
+            continue
+        pool.submit(path, manifest=args.manifest if len(paths) == 1 else None)
+    pool.wait()
+
+
+if __name__ == "__main__":
+    main()
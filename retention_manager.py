@@ -0,0 +1,394 @@
+import os
+import re
+import json
+import time
+import shutil
+import argparse
+import threading
+
+import segment_record
+import clip_scheduler
+
+# ================= 配置区 =================
+POLICY_FILE = "retention.json"  # 存在时 GUI 才会启用后台清理
+DEFAULT_INTERVAL = 300          # 秒：后台每隔多久检查一次
+MAX_ACTIONS_PER_PASS = 20       # 每轮最多处理多少个产物，清理分摊到多轮，不会一下子占满磁盘 I/O
+PROTECT_SECONDS = 600           # 最近这么久内修改过的文件视为正在使用，不动
+AUDIO_BITRATE = "24k"           # audio_only 且没有语音归档时，把录像的音轨转成 Opus 保留
+
+GB = 1024 ** 3
+
+# 默认策略：只有磁盘剩余空间不足时才动手；其他上限在 retention.json 里按需打开
+DEFAULT_POLICY = {
+    "global_budget_gb": 0,          # 所有录像 / 切片 / 日志的总大小上限，0 不限
+    "room_budget_gb": 0,            # 每个房间的默认上限，0 不限
+    "rooms": {},                    # 单独配置的房间：{"24692760": {"budget_gb": 50}}
+    "min_free_gb": 5,               # 磁盘剩余低于这个值时按超出预算处理 (避免录到一半 ffmpeg 写满磁盘)
+    "cold_dir": "",                 # 冷存储目录 (例如 NAS 挂载点)，action 为 cold 时必填
+    # 每类产物：超过 max_age_days 天执行 action (0 不按时间处理)；超出预算时按从旧到新执行 budget_action (默认同 action)
+    # action 可选 delete / cold (移到冷存储) / audio_only (只对录像：删掉视频，保留语音) / keep
+    "recording": {"max_age_days": 0, "action": "audio_only", "budget_action": "audio_only"},
+    "clip": {"max_age_days": 0, "action": "cold", "budget_action": "delete"},
+    "log": {"max_age_days": 0, "action": "keep"},
+}
+
+ACTIONS = ("delete", "cold", "audio_only", "keep")
+VIDEO_EXTS = (".ts", ".mp4", ".mkv")
+
+RECORD_RE = re.compile(r"^live_record_(?P<room>\d+)_(?P<ts>\d+)(?P<ext>(?:\.\w+)*)$")
+CLIP_RE = re.compile(r"^(?P<stem>Clip_(?P<streamer>.+)_\d{6}_from_\d+s)\.\w+$")
+LOG_RE = re.compile(r"^(?P<stem>(?P<streamer>.+)_(?P<room>\d+)_.+?_log_(?P<ts>\d+))(?:_part\d+)?\.[\w.]+$")
+
+
+def path_size(path):
+    if os.path.isdir(path):
+        return sum(path_size(os.path.join(path, name)) for name in os.listdir(path))
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def path_mtime(path):
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return 0.0
+    if os.path.isdir(path):
+        for name in os.listdir(path):
+            mtime = max(mtime, path_mtime(os.path.join(path, name)))
+    return mtime
+
+
+class Artifact:
+    """一个清理单位：同一场录像 (视频 + 字幕)、同一个切片 (视频 + 字幕)、同一场会话的日志 / 记录 / 清单 / 语音归档"""
+    __slots__ = ("kind", "key", "room", "streamer", "started", "paths", "size", "mtime")
+
+    def __init__(self, kind, key, room=None, streamer=None, started=None):
+        self.kind = kind
+        self.key = key
+        self.room = room
+        self.streamer = streamer
+        self.started = started
+        self.paths = []
+        self.size = 0
+        self.mtime = 0.0
+
+    def add(self, path):
+        self.paths.append(path)
+        self.size += path_size(path)
+        self.mtime = max(self.mtime, path_mtime(path))
+
+    @property
+    def age_time(self):
+        return self.started or self.mtime
+
+    def video_paths(self):
+        return [p for p in self.paths if os.path.isdir(p) or p.endswith(VIDEO_EXTS)]
+
+    def reclaim(self, action):
+        """执行 action 后本地能腾出的字节数 (估算)"""
+        if action in ("delete", "cold"):
+            return self.size
+        if action == "audio_only" and self.kind == "recording":
+            return sum(path_size(p) for p in self.video_paths())
+        return 0
+
+
+def scan(root="."):
+    """扫描工作目录，按 录像 / 切片 / 日志 归组"""
+    groups = {}
+    streamer_rooms = {}
+    for entry in os.scandir(root):
+        name = entry.name
+        m = RECORD_RE.match(name)
+        if m:
+            key = ("recording", f"live_record_{m.group('room')}_{m.group('ts')}")
+            art = groups.get(key) or groups.setdefault(key, Artifact("recording", key[1], m.group("room"), started=int(m.group("ts"))))
+            art.add(entry.path)
+            continue
+        m = CLIP_RE.match(name)
+        if m and entry.is_file():
+            key = ("clip", m.group("stem"))
+            art = groups.get(key) or groups.setdefault(key, Artifact("clip", key[1], streamer=m.group("streamer")))
+            art.add(entry.path)
+            continue
+        m = LOG_RE.match(name)
+        if m and entry.is_file():
+            key = ("log", m.group("stem"))
+            art = groups.get(key) or groups.setdefault(key, Artifact("log", key[1], m.group("room"), m.group("streamer"), int(m.group("ts"))))
+            art.add(entry.path)
+            streamer_rooms[m.group("streamer")] = m.group("room")
+    # 切片文件名里只有主播名，按日志里的 主播 -> 房间 对应关系归到房间
+    for art in groups.values():
+        if art.kind == "clip":
+            art.room = streamer_rooms.get(art.streamer)
+    return list(groups.values())
+
+
+def load_policy(path=POLICY_FILE):
+    policy = json.loads(json.dumps(DEFAULT_POLICY))
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            user = json.load(f)
+        for k, v in user.items():
+            if isinstance(v, dict) and isinstance(policy.get(k), dict):
+                policy[k].update(v)
+            else:
+                policy[k] = v
+    for kind in ("recording", "clip", "log"):
+        for field in ("action", "budget_action"):
+            action = policy[kind].get(field, policy[kind]["action"])
+            if action not in ACTIONS:
+                raise ValueError(f"{kind}.{field} 只能是 {' / '.join(ACTIONS)}: {action}")
+    return policy
+
+
+class RetentionManager:
+    """
+    按磁盘预算与保留期限清理录像、切片和日志。
+    每轮：扫描工作目录 -> 先按年龄、再按房间预算、全局预算 / 剩余空间从旧到新挑出要处理的产物 ->
+    最多执行 MAX_ACTIONS_PER_PASS 个，其余留到下一轮。正在写入的文件 (最近修改过或 protect() 返回的) 不动。
+    """
+
+    def __init__(self, policy=None, root=".", ui_queue=None, protect=None, creationflags=0, dry_run=False):
+        self.policy = policy or load_policy(None)
+        self.root = root
+        self.ui_queue = ui_queue
+        self.protect = protect
+        self.creationflags = creationflags
+        self.dry_run = dry_run
+        self.stats = {"reclaimed": 0, "delete": 0, "cold": 0, "audio_only": 0, "failed": 0}
+        self._wake = threading.Event()
+        self._thread = None
+        self._warned = set()
+
+    @classmethod
+    def load(cls, path=POLICY_FILE, **kwargs):
+        return cls(load_policy(path), **kwargs)
+
+    def _notify(self, msg):
+        if self.ui_queue is not None:
+            self.ui_queue.put(msg)
+        print(msg)
+
+    def _warn_once(self, key, msg):
+        if key not in self._warned:
+            self._warned.add(key)
+            self._notify(msg)
+
+    # ---------- 规划 ----------
+
+    def _protected(self, art, now):
+        if now - art.mtime < PROTECT_SECONDS:
+            return True
+        busy = {os.path.abspath(p) for p in (self.protect() if self.protect else ()) if p}
+        return any(os.path.abspath(p) in busy for p in art.paths)
+
+    def _room_budget(self, room):
+        conf = self.policy["rooms"].get(str(room)) or {}
+        return conf.get("budget_gb", self.policy["room_budget_gb"]) * GB
+
+    def plan(self, artifacts, now=None):
+        """返回 [(产物, 动作, 原因), ...]，按从旧到新排列"""
+        now = now or time.time()
+        candidates = sorted((a for a in artifacts if not self._protected(a, now)), key=lambda a: a.age_time)
+        planned = {}
+
+        def choose(art, field):
+            conf = self.policy[art.kind]
+            action = conf.get(field) or conf["action"]
+            if action == "cold" and not self.policy["cold_dir"]:
+                self._warn_once("cold_dir", "⚠️ [清理] 策略里用了 cold 但没有配置 cold_dir，跳过冷存储")
+                return None
+            return action if art.reclaim(action) > 0 else None
+
+        # 1. 超过保留期限
+        for art in candidates:
+            days = self.policy[art.kind].get("max_age_days", 0)
+            if days and now - art.age_time > days * 86400:
+                action = choose(art, "action")
+                if action:
+                    planned[id(art)] = (art, action, f"超过 {days} 天")
+
+        def usage(arts):
+            return sum(a.size - (planned[id(a)][0].reclaim(planned[id(a)][1]) if id(a) in planned else 0) for a in arts)
+
+        def trim(arts, excess, reason):
+            for art in arts:
+                if excess <= 0:
+                    break
+                if id(art) in planned:
+                    continue
+                action = choose(art, "budget_action")
+                if action:
+                    planned[id(art)] = (art, action, reason)
+                    excess -= art.reclaim(action)
+            return excess
+
+        # 2. 房间预算
+        rooms = {a.room for a in candidates if a.room}
+        for room in sorted(rooms):
+            budget = self._room_budget(room)
+            if budget:
+                in_room = [a for a in artifacts if a.room == room]
+                left = trim([a for a in candidates if a.room == room], usage(in_room) - budget, f"房间 {room} 超出预算")
+                if left > 0:
+                    self._warn_once(f"room:{room}", f"⚠️ [清理] 房间 {room} 清理后仍超出预算 {left / GB:.1f} GB (其余文件正在使用或策略为 keep)")
+
+        # 3. 全局预算与磁盘剩余空间
+        excess = 0
+        if self.policy["global_budget_gb"]:
+            excess = usage(artifacts) - self.policy["global_budget_gb"] * GB
+        if self.policy["min_free_gb"]:
+            free = shutil.disk_usage(self.root).free + sum(a.reclaim(act) for a, act, _ in planned.values())
+            excess = max(excess, self.policy["min_free_gb"] * GB - free)
+        if excess > 0:
+            left = trim(candidates, excess, "磁盘空间不足 / 超出总预算")
+            if left > 0:
+                self._warn_once("global", f"⚠️ [清理] 能清理的都清理了，仍差 {left / GB:.1f} GB")
+        return sorted(planned.values(), key=lambda t: t[0].age_time)
+
+    # ---------- 执行 ----------
+
+    def _manifests(self, artifacts):
+        """录像路径 -> 会话清单 (清理后更新清单里的 record_file)"""
+        out = {}
+        for art in artifacts:
+            if art.kind != "log":
+                continue
+            for path in art.paths:
+                if path.endswith(".manifest.json"):
+                    try:
+                        manifest = segment_record.read_manifest(path)
+                    except (OSError, ValueError):
+                        continue
+                    if manifest.get("record_file"):
+                        out[os.path.abspath(manifest["record_file"])] = (path, manifest)
+        return out
+
+    def _audio_only(self, art, manifest):
+        """删掉视频，保留语音：会话已有语音归档就直接删；没有就先把音轨转成低码率 Opus"""
+        kept = manifest.get("speech_archive") if manifest else None
+        if not (kept and os.path.exists(kept)):
+            video = next((p for p in art.video_paths() if os.path.isfile(p)), None)
+            if video is None:
+                raise RuntimeError("分段目录没有语音归档，无法只保留音频")
+            kept = os.path.join(self.root, art.key + ".audio.opus")
+            cmd = ["ffmpeg", "-y", "-v", "error", "-i", video, "-vn", "-ac", "1",
+                   "-c:a", "libopus", "-b:a", AUDIO_BITRATE, "-application", "voip", kept]
+            if clip_scheduler.run_low_priority(cmd, self.creationflags) != 0:
+                raise RuntimeError(f"音轨转码失败: {video}")
+        for path in art.video_paths():
+            shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+        return kept
+
+    def apply(self, art, action, manifests):
+        entry = None
+        for path in art.video_paths():
+            entry = manifests.get(os.path.abspath(path)) or entry
+        manifest_path, manifest = entry or (None, None)
+        reclaim = art.reclaim(action)
+        new_path = None
+        if action == "delete":
+            for path in art.paths:
+                shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+        elif action == "cold":
+            dest_dir = os.path.join(self.policy["cold_dir"], art.kind)
+            os.makedirs(dest_dir, exist_ok=True)
+            videos = art.video_paths()
+            for path in art.paths:
+                dest = os.path.join(dest_dir, os.path.basename(path))
+                shutil.move(path, dest)
+                if path in videos:
+                    new_path = dest
+        elif action == "audio_only":
+            new_path = self._audio_only(art, manifest)
+        if manifest_path and os.path.exists(manifest_path):
+            fields = {"retention": action, "record_file": new_path if action == "cold" else None}
+            if action == "audio_only":
+                fields["audio_file"] = new_path
+            segment_record.update_manifest(manifest_path, **fields)
+        return reclaim
+
+    def run_once(self, max_actions=MAX_ACTIONS_PER_PASS):
+        """执行一轮清理，返回本轮腾出的字节数"""
+        artifacts = scan(self.root)
+        plan = self.plan(artifacts)
+        if not plan:
+            return 0
+        manifests = self._manifests(artifacts)
+        reclaimed = 0
+        done = {"delete": 0, "cold": 0, "audio_only": 0}
+        for art, action, reason in plan[:max_actions]:
+            if self.dry_run:
+                print(f"🧹 [清理] (演练) {action}: {art.key} ({art.size / GB:.2f} GB，{reason})")
+                reclaimed += art.reclaim(action)
+                continue
+            try:
+                reclaimed += self.apply(art, action, manifests)
+                done[action] += 1
+                self.stats[action] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                self._notify(f"❌ [清理] {action} 失败 {art.key}: {e}")
+        self.stats["reclaimed"] += reclaimed
+        if not self.dry_run and any(done.values()):
+            left = len(plan) - min(len(plan), max_actions)
+            self._notify(f"🧹 [清理] 本轮腾出 {reclaimed / GB:.2f} GB：删除 {done['delete']} / 冷存储 {done['cold']} / "
+                         f"只留音频 {done['audio_only']}" + (f"，还剩 {left} 个下一轮处理" if left else ""))
+        return reclaimed
+
+    # ---------- 后台线程 ----------
+
+    def start(self, interval=DEFAULT_INTERVAL):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="retention", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """马上执行一轮 (例如开始录制前)"""
+        self._wake.set()
+
+    def _run(self, interval):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                self._notify(f"❌ [清理] 本轮出错: {e}")
+            self._wake.wait(interval)
+            self._wake.clear()
+
+    def report(self):
+        s = self.stats
+        return (f"🧹 [清理] 累计腾出 {s['reclaimed'] / GB:.2f} GB：删除 {s['delete']} / 冷存储 {s['cold']} / "
+                f"只留音频 {s['audio_only']} / 失败 {s['failed']}")
+
+
+# ================= 命令行 =================
+
+def main():
+    parser = argparse.ArgumentParser(description="按磁盘预算与保留期限清理录像、切片和日志")
+    parser.add_argument("--policy", default=POLICY_FILE, help="策略文件 (不存在时用默认策略)")
+    parser.add_argument("--root", default=".", help="录像与日志所在目录")
+    parser.add_argument("--dry-run", action="store_true", help="只列出会处理哪些文件")
+    parser.add_argument("--show", action="store_true", help="按房间汇总当前占用")
+    args = parser.parse_args()
+
+    manager = RetentionManager.load(args.policy, root=args.root, dry_run=args.dry_run)
+    if args.show:
+        usage = {}
+        for art in scan(args.root):
+            room = usage.setdefault(art.room or "?", {"recording": 0, "clip": 0, "log": 0})
+            room[art.kind] += art.size
+        for room, kinds in sorted(usage.items()):
+            print(f"📦 房间 {room}: 录像 {kinds['recording'] / GB:.2f} GB | 切片 {kinds['clip'] / GB:.2f} GB | 日志 {kinds['log'] / GB:.3f} GB")
+        print(f"💽 磁盘剩余 {shutil.disk_usage(args.root).free / GB:.1f} GB")
+        return
+    reclaimed = manager.run_once(max_actions=10 ** 9)
+    print(f"✅ {'预计' if args.dry_run else '已'}腾出 {reclaimed / GB:.2f} GB")
+
+
+if __name__ == "__main__":
+    main()
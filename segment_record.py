@@ -0,0 +1,213 @@
+import os
+import re
+import json
+import time
+import datetime
+import argparse
+import threading
+
+# ================= 纯文本日志格式 =================
+# 旧日志行："[HH:MM:SS] (⚡️0.41s) 文本" (MLX) 或 "[HH:MM:SS] (🚀0.41s) 文本" (CUDA)
+LOG_LINE_RE = re.compile(r"^\[(\d{2}:\d{2}:\d{2})\] \((?:⚡️|🚀)([\d.]+)s\) (.*)$")
+# 日志文件名："{主播}_{房间号}_{标签}_log_{开始时间戳}[_part002].txt"
+LOG_NAME_RE = re.compile(r"^(?P<streamer>.+)_(?P<room>\d+)_(?P<tag>.+?)_log_(?P<ts>\d+)(?:_part\d+)?\.txt$")
+
+
+def parse_log_line(line):
+    """解析一行文本日志，返回 (时间, 耗时, 文本) 或 None"""
+    m = LOG_LINE_RE.match(line.strip())
+    if not m:
+        return None
+    return m.group(1), float(m.group(2)), m.group(3)
+
+
+def parse_log_name(path):
+    """从日志文件名解析 (主播, 房间号, 会话开始时间戳)，不符合命名规则时返回 None"""
+    m = LOG_NAME_RE.match(os.path.basename(path))
+    if not m:
+        return None
+    return m.group("streamer"), m.group("room"), int(m.group("ts"))
+
+
+# ================= 结构化记录 =================
+
+class SegmentRecord:
+    """
+    一条转写结果的结构化记录，下游 (归档、检索、切片、总结) 直接读字段，不用再正则解析日志。
+    stream_offset 是相对录像开头的秒数，wall_time 是 unix 时间戳。
+    """
+    __slots__ = (
+        "room", "session", "stream_offset", "wall_time", "duration", "model",
+        "avg_logprob", "compression_ratio", "no_speech_prob", "hallucination_score",
+        "latency", "text",
+    )
+
+    def __init__(self, room, session, stream_offset, wall_time, duration, model, text,
+                 avg_logprob=None, compression_ratio=None, no_speech_prob=None,
+                 hallucination_score=None, latency=None):
+        self.room = room
+        self.session = session
+        self.stream_offset = stream_offset
+        self.wall_time = wall_time
+        self.duration = duration
+        self.model = model
+        self.avg_logprob = avg_logprob
+        self.compression_ratio = compression_ratio
+        self.no_speech_prob = no_speech_prob
+        self.hallucination_score = hallucination_score
+        self.latency = latency
+        self.text = text
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def to_json(self):
+        d = self.to_dict()
+        for k, v in d.items():
+            if isinstance(v, float):
+                d[k] = round(v, 3)
+        return json.dumps(d, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**{k: d.get(k) for k in cls.__slots__})
+
+    @classmethod
+    def from_segments(cls, room, session, chunk_offset, model, text, segments, verdicts, latency):
+        """
+        把一次 Whisper 推理里保留下来的 segment 汇总成一条记录：
+        时间跨度取首尾 segment，置信度取均值 / 最坏值。
+        """
+        kept = [(seg, v) for seg, v in zip(segments, verdicts) if v.action != "drop"]
+
+        def get(seg, key):
+            return seg.get(key) if isinstance(seg, dict) else getattr(seg, key, None)
+
+        if not kept:
+            return cls(room, session, chunk_offset, time.time(), None, model, text, latency=latency)
+        start, end = get(kept[0][0], "start") or 0.0, get(kept[-1][0], "end") or 0.0
+        logprobs = [get(s, "avg_logprob") for s, _ in kept if get(s, "avg_logprob") is not None]
+        ratios = [get(s, "compression_ratio") for s, _ in kept if get(s, "compression_ratio") is not None]
+        no_speech = [get(s, "no_speech_prob") for s, _ in kept if get(s, "no_speech_prob") is not None]
+        return cls(
+            room, session, chunk_offset + start, time.time(), end - start, model, text,
+            avg_logprob=sum(logprobs) / len(logprobs) if logprobs else None,
+            compression_ratio=max(ratios) if ratios else None,
+            no_speech_prob=max(no_speech) if no_speech else None,
+            hallucination_score=max(v.score for _, v in kept),
+            latency=latency,
+        )
+
+
+def read_jsonl(path):
+    """逐条读取 .jsonl 记录文件，跳过写了一半的坏行 (崩溃时最后一行可能不完整)"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield SegmentRecord.from_dict(json.loads(line))
+            except (json.JSONDecodeError, TypeError):
+                continue
+
+
+def records_from_log(path):
+    """把旧的 .txt 日志转成记录 (没有置信度字段；stream_offset 按会话开始时间推算)"""
+    meta = parse_log_name(path)
+    if not meta:
+        return
+    streamer, room, session_ts = meta
+    session = f"{room}_{session_ts}"
+    day = datetime.datetime.fromtimestamp(session_ts).replace(hour=0, minute=0, second=0, microsecond=0)
+    last_wall = session_ts
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parsed = parse_log_line(line)
+            if not parsed:
+                continue
+            hms, latency, text = parsed
+            h, m, s = (int(x) for x in hms.split(":"))
+            wall = (day + datetime.timedelta(hours=h, minutes=m, seconds=s)).timestamp()
+            # 跨过午夜
+            while wall < last_wall - 3600:
+                day += datetime.timedelta(days=1)
+                wall += 86400
+            last_wall = wall
+            yield SegmentRecord(room, session, max(0.0, wall - session_ts), wall, None, None, text, latency=latency)
+
+
+def export_columnar(jsonl_path, out_path):
+    """导出为 Parquet (.parquet) 或 Arrow IPC (.arrow)，需要 pyarrow"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("导出列式格式需要安装 pyarrow: pip install pyarrow")
+
+    columns = {k: [] for k in SegmentRecord.__slots__}
+    for rec in read_jsonl(jsonl_path):
+        for k in SegmentRecord.__slots__:
+            columns[k].append(getattr(rec, k))
+    table = pa.table(columns)
+    if out_path.endswith(".arrow"):
+        with pa.OSFile(out_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    else:
+        pq.write_table(table, out_path, compression="zstd")
+    return table.num_rows
+
+
+# ================= 会话清单 =================
+
+_manifest_lock = threading.Lock()
+
+
+def update_manifest(path, **fields):
+    """
+    会话清单：把文本日志、结构化记录、录像文件关联起来。
+    采集线程和转写线程都会更新 (例如录像转封装完成后改名)，这里做读-改-写并原子替换。
+    """
+    if not path:
+        return
+    with _manifest_lock:
+        data = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        data.update(fields)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+
+def read_manifest(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="结构化转写记录工具")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_export = sub.add_parser("export", help="把 .jsonl 记录导出为 .parquet / .arrow")
+    p_export.add_argument("jsonl")
+    p_export.add_argument("out")
+    p_convert = sub.add_parser("convert", help="把旧的 .txt 日志转成 .jsonl 记录")
+    p_convert.add_argument("logs", nargs="+")
+    args = parser.parse_args()
+
+    if args.cmd == "export":
+        rows = export_columnar(args.jsonl, args.out)
+        print(f"✅ 已导出 {rows} 条记录 -> {args.out}")
+    elif args.cmd == "convert":
+        for path in args.logs:
+            out = os.path.splitext(path)[0] + ".jsonl"
+            count = 0
+            with open(out, "w", encoding="utf-8") as f:
+                for rec in records_from_log(path):
+                    f.write(rec.to_json() + "\n")
+                    count += 1
+            print(f"✅ {path} -> {out} ({count} 条)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+import os
+import csv
+import sys
+import glob
+import json
+import time
+import bisect
+import argparse
+import threading
+import subprocess
+
+import subtitle_writer
+
+# ================= 配置区 =================
+SEGMENT_SECONDS = 10          # 每个分段的目标时长 (实际在其后的第一个关键帧处切分)
+SEGMENT_PATTERN = "seg_%06d.ts"
+LIST_FILE = "segments.csv"    # ffmpeg 每写完一个分段追加一行
+INDEX_FILE = "keyframes.jsonl"  # 已完成分段的关键帧索引 (时间 -> 字节偏移)
+READ_CHUNK = 1 << 20
+
+TS_PACKET = 188
+PTS_WRAP = 1 << 33
+PTS_HZ = 90000.0
+
+
+def ffmpeg_output_args(seg_dir, segment_seconds=SEGMENT_SECONDS):
+    """
+    替代单文件录制的 ffmpeg 输出参数：segment 复用器按关键帧切成固定时长的 .ts 分段，
+    保留原始时间戳 (-reset_timestamps 0)，分段列表写成 CSV 供索引增量读取。
+    """
+    return [
+        "-c", "copy", "-f", "segment",
+        "-segment_time", str(segment_seconds),
+        "-segment_format", "mpegts",
+        "-reset_timestamps", "0",
+        "-segment_list", os.path.join(seg_dir, LIST_FILE),
+        "-segment_list_type", "csv",
+        os.path.join(seg_dir, SEGMENT_PATTERN),
+    ]
+
+
+# ================= MPEG-TS 关键帧扫描 =================
+
+def _pes_pts(payload):
+    """PES 头里的 PTS (90kHz)，没有则返回 None"""
+    if len(payload) < 14 or payload[0:3] != b"\x00\x00\x01" or not payload[7] & 0x80:
+        return None
+    p = payload[9:14]
+    return ((p[0] >> 1) & 0x07) << 30 | p[1] << 22 | (p[2] >> 1) << 15 | p[3] << 7 | p[4] >> 1
+
+
+def scan_ts(data, info, pmt_pid=None, base=0):
+    """
+    扫描一段 188 字节对齐的 TS 数据，把 PAT / PMT / 关键帧追加进 info (偏移都加上 base)。
+    关键帧 = 视频 PES 起始包且适配域里 random_access_indicator 置位。
+    返回 PMT 的 PID，连续的数据分块扫描时传给下一块。
+    """
+    size = len(data) - len(data) % TS_PACKET
+    for off in range(0, size, TS_PACKET):
+        if data[off] != 0x47:
+            continue
+        b1, b2, b3 = data[off + 1], data[off + 2], data[off + 3]
+        pid = (b1 & 0x1F) << 8 | b2
+        pusi = b1 & 0x40
+        afc = (b3 >> 4) & 0x03
+        start = off + 4
+        rai = False
+        if afc & 0x02:
+            af_len = data[start]
+            if af_len:
+                rai = bool(data[start + 1] & 0x40)
+            start += 1 + af_len
+        if not afc & 0x01 or not pusi:
+            continue
+        payload = data[start:off + TS_PACKET]
+        if pid == 0:
+            if info["pat"] is None:
+                info["pat"] = base + off
+            # pointer_field + 8 字节表头之后是 (program_number, PMT PID) 列表
+            table = payload[1 + payload[0]:]
+            for i in range(8, len(table) - 4, 4):
+                program = table[i] << 8 | table[i + 1]
+                if program:
+                    pmt_pid = (table[i + 2] & 0x1F) << 8 | table[i + 3]
+                    break
+            continue
+        if pid == pmt_pid:
+            if info["pmt"] is None:
+                info["pmt"] = base + off
+            continue
+        if rai and len(payload) > 3 and payload[0:3] == b"\x00\x00\x01" and 0xE0 <= payload[3] <= 0xEF:
+            pts = _pes_pts(payload)
+            if pts is not None:
+                info["keyframes"].append([pts, base + off])
+    return pmt_pid
+
+
+def scan_segment(path, limit=None):
+    """
+    扫描一个 .ts 分段：返回 {"size", "pat", "pmt", "keyframes": [[pts, 字节偏移], ...]}。
+    pat / pmt 记录第一个 PAT / PMT 包的偏移，从分段中间起切时要先补上这两个包，解码器才能识别节目。
+    """
+    with open(path, "rb") as f:
+        data = f.read() if limit is None else f.read(limit)
+    info = {"size": len(data) - len(data) % TS_PACKET, "pat": None, "pmt": None, "keyframes": []}
+    scan_ts(data, info)
+    return info
+
+
+# ================= 分段索引 =================
+
+class SegmentIndex:
+    """
+    录像时间 -> (分段, 字节偏移, 关键帧) 的索引。已完成的分段扫描一次后写入 keyframes.jsonl，
+    正在写的最后一个分段每次按当前大小临时扫描，所以切片耗时只和切片长度有关，与录了多久无关。
+    """
+
+    def __init__(self, seg_dir):
+        self.seg_dir = seg_dir
+        self.segments = []      # [{"name", "size", "pat", "pmt", "keyframes"}, ...]
+        self.base_pts = None    # 第一个关键帧的 PTS = 录像时间 0
+        self.lock = threading.Lock()  # 多个切片线程可能同时刷新索引
+        index_path = os.path.join(seg_dir, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._add(json.loads(line))
+                    except ValueError:
+                        break
+
+    def _add(self, entry):
+        if self.base_pts is None and entry["keyframes"]:
+            self.base_pts = entry["keyframes"][0][0]
+        self.segments.append(entry)
+
+    def seconds(self, pts):
+        return ((pts - self.base_pts) % PTS_WRAP) / PTS_HZ
+
+    def completed_names(self):
+        list_path = os.path.join(self.seg_dir, LIST_FILE)
+        if not os.path.exists(list_path):
+            return []
+        with open(list_path, "r", encoding="utf-8", newline="") as f:
+            return [row[0] for row in csv.reader(f) if row]
+
+    def refresh(self):
+        """把分段列表里新完成的分段扫描进索引"""
+        names = self.completed_names()
+        if len(names) <= len(self.segments):
+            return 0
+        added = 0
+        with self.lock, open(os.path.join(self.seg_dir, INDEX_FILE), "a", encoding="utf-8") as f:
+            for name in names[len(self.segments):]:
+                path = os.path.join(self.seg_dir, name)
+                if not os.path.exists(path):
+                    break
+                entry = {"name": name, **scan_segment(path)}
+                f.write(json.dumps(entry) + "\n")
+                self._add(entry)
+                added += 1
+        return added
+
+    def live_segment(self):
+        """正在写入、还没进列表的分段 (按当前大小扫描)"""
+        done = {s["name"] for s in self.segments}
+        pending = sorted(os.path.basename(p) for p in glob.glob(os.path.join(self.seg_dir, "seg_*.ts")))
+        pending = [n for n in pending if n not in done]
+        if not pending:
+            return None
+        path = os.path.join(self.seg_dir, pending[0])
+        entry = {"name": pending[0], **scan_segment(path, os.path.getsize(path))}
+        if self.base_pts is None and entry["keyframes"]:
+            self.base_pts = entry["keyframes"][0][0]
+        return entry
+
+    def duration(self):
+        self.refresh()
+        segments = self.segments + [s for s in [self.live_segment()] if s]
+        for seg in reversed(segments):
+            if seg["keyframes"] and self.base_pts is not None:
+                return self.seconds(seg["keyframes"][-1][0])
+        return 0.0
+
+    def plan(self, start, end):
+        """
+        算出覆盖 [start, end] 的字节区间：从 start 之前最近的关键帧开始，到 end 之后第一个关键帧为止。
+        返回 (起始分段的 PAT+PMT 包, [(路径, 起始偏移, 结束偏移), ...], 实际开始秒, 实际结束秒)；没有数据时返回 None。
+        """
+        self.refresh()
+        segments = list(self.segments)
+        live = self.live_segment()
+        if live:
+            segments.append(live)
+        if self.base_pts is None:
+            return None
+
+        # 所有关键帧按时间排成一列 (分段序号, 偏移, 秒)
+        marks = [(i, off, self.seconds(pts)) for i, seg in enumerate(segments) for pts, off in seg["keyframes"]]
+        if not marks:
+            return None
+        times = [m[2] for m in marks]
+        first = max(0, bisect.bisect_right(times, start) - 1)
+        last = bisect.bisect_left(times, end)
+        s_seg, s_off, actual_start = marks[first]
+        if last < len(marks):
+            e_seg, e_off, actual_end = marks[last]
+        else:
+            e_seg, e_off, actual_end = len(segments) - 1, segments[-1]["size"], times[-1]
+
+        ranges = []
+        for i in range(s_seg, e_seg + 1):
+            seg = segments[i]
+            lo = s_off if i == s_seg else 0
+            hi = e_off if i == e_seg else seg["size"]
+            if hi > lo:
+                ranges.append((os.path.join(self.seg_dir, seg["name"]), lo, hi))
+
+        header = b""
+        start_seg = segments[s_seg]
+        if s_off > 0 and start_seg["pat"] is not None and start_seg["pmt"] is not None:
+            with open(os.path.join(self.seg_dir, start_seg["name"]), "rb") as f:
+                for off in (start_seg["pat"], start_seg["pmt"]):
+                    f.seek(off)
+                    header += f.read(TS_PACKET)
+        return header, ranges, actual_start, actual_end
+
+
+def iter_bytes(header, ranges):
+    if header:
+        yield header
+    for path, lo, hi in ranges:
+        with open(path, "rb") as f:
+            f.seek(lo)
+            remaining = hi - lo
+            while remaining > 0:
+                chunk = f.read(min(READ_CHUNK, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+# ================= 切片 =================
+
+def write_clip(chunks, actual_start, actual_end, out_path, cues=(), creationflags=0, nice=0):
+    """
+    把一串 TS 字节 (从关键帧开始，前面补好 PAT / PMT) 经 ffmpeg 标准输入流复制封装成 out_path；
+    cues 是录像时间轴上的字幕，平移到切片时间轴后作为软字幕轨一起封装。
+    nice > 0 时降低 ffmpeg 的调度优先级 (macOS / Linux)，不和转写抢 CPU。
+    """
+    shifted = [(max(0.0, s - actual_start), e - actual_start, t) for s, e, t in cues if e > actual_start and s < actual_end]
+    if shifted:
+        clip_srt = os.path.splitext(out_path)[0] + ".srt"
+        subtitle_writer.write_srt(shifted, clip_srt)
+        cmd = subtitle_writer.mux_cmd("pipe:0", clip_srt, out_path, input_args=["-f", "mpegts"])
+    else:
+        cmd = ["ffmpeg", "-y", "-v", "error", "-f", "mpegts", "-i", "pipe:0", "-c", "copy"]
+        if out_path.lower().endswith(".mp4"):
+            cmd += ["-movflags", "faststart"]
+        cmd.append(out_path)
+
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL, creationflags=creationflags)
+    if nice and hasattr(os, "setpriority"):
+        try:
+            os.setpriority(os.PRIO_PROCESS, proc.pid, nice)
+        except OSError:
+            pass
+    try:
+        for chunk in chunks:
+            proc.stdin.write(chunk)
+    except BrokenPipeError:
+        pass
+    finally:
+        proc.stdin.close()
+    proc.wait()
+    return proc.returncode
+
+
+def build_clip(index, start, end, out_path, cues=(), creationflags=0, nice=0):
+    """
+    按关键帧拼接分段字节切出 [start, end]。
+    返回 (实际开始秒, 实际结束秒)，没有可用数据时返回 None；ffmpeg 失败时抛 RuntimeError。
+    """
+    plan = index.plan(start, end)
+    if plan is None:
+        return None
+    header, ranges, actual_start, actual_end = plan
+    rc = write_clip(iter_bytes(header, ranges), actual_start, actual_end, out_path, cues, creationflags, nice)
+    if rc != 0:
+        raise RuntimeError(f"ffmpeg 切片失败 (退出码 {rc}): {out_path}")
+    return actual_start, actual_end
+
+
+def concat_cmd(seg_dir, out_path, srt_path=None):
+    """整场结束后把所有分段无损合并成一个文件 (concat 分离器，流复制)，可选带上字幕轨"""
+    names = SegmentIndex(seg_dir).completed_names()
+    live = sorted(os.path.basename(p) for p in glob.glob(os.path.join(seg_dir, "seg_*.ts")))
+    names += [n for n in live if n not in names]
+    list_path = os.path.join(seg_dir, "concat.txt")
+    with open(list_path, "w", encoding="utf-8") as f:
+        for name in names:
+            f.write(f"file '{os.path.abspath(os.path.join(seg_dir, name))}'\n")
+    concat_input = ["-f", "concat", "-safe", "0"]
+    if srt_path:
+        return subtitle_writer.mux_cmd(list_path, srt_path, out_path, input_args=concat_input)
+    cmd = ["ffmpeg", "-y", "-v", "error", *concat_input, "-i", list_path, "-c", "copy"]
+    if out_path.lower().endswith(".mp4"):
+        cmd += ["-movflags", "faststart"]
+    return cmd + [out_path]
+
+
+# ================= 命令行 =================
+
+def main():
+    parser = argparse.ArgumentParser(description="分段录像的关键帧索引与切片")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_index = sub.add_parser("index", help="扫描 / 更新关键帧索引")
+    p_index.add_argument("seg_dir")
+    p_clip = sub.add_parser("clip", help="按时间切片 (秒，录像时间轴)")
+    p_clip.add_argument("seg_dir")
+    p_clip.add_argument("start", type=float)
+    p_clip.add_argument("end", type=float)
+    p_clip.add_argument("out")
+    p_clip.add_argument("--srt", default=None, help="录像时间轴上的字幕，一并封装")
+    p_concat = sub.add_parser("concat", help="把分段合并成一个文件")
+    p_concat.add_argument("seg_dir")
+    p_concat.add_argument("out")
+    p_concat.add_argument("--srt", default=None)
+    args = parser.parse_args()
+
+    if args.cmd == "index":
+        index = SegmentIndex(args.seg_dir)
+        added = index.refresh()
+        n_kf = sum(len(s["keyframes"]) for s in index.segments)
+        print(f"✅ 新增 {added} 个分段，共 {len(index.segments)} 个 / {n_kf} 个关键帧，时长 {index.duration():.1f}s")
+    elif args.cmd == "clip":
+        t0 = time.time()
+        cues = subtitle_writer.read_srt(args.srt) if args.srt else ()
+        try:
+            result = build_clip(SegmentIndex(args.seg_dir), args.start, args.end, args.out, cues)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        if result is None:
+            print("⚠️ 没有可用的分段数据")
+            sys.exit(1)
+        print(f"✅ {args.out}: {result[0]:.2f}s ~ {result[1]:.2f}s，用时 {time.time() - t0:.2f}s")
+    elif args.cmd == "concat":
+        subprocess.run(concat_cmd(args.seg_dir, args.out, args.srt), check=True)
+        print(f"✅ 已合并 -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import os
+import sys
+import json
+import queue
+import bisect
+import argparse
+import threading
+import subprocess
+
+import numpy as np
+
+import clip_scheduler
+
+# ================= 配置区 =================
+SAMPLE_RATE = 16000
+BITRATE = "16k"               # Opus 语音 16 kbps，约 7 MB / 小时语音 (原始 .ts 通常 1~3 GB / 小时)
+PAD_SECONDS = 0.2             # 每段语音前后多留一点，避免切掉字头字尾
+ARCHIVE_SUFFIX = ".speech.opus"
+INDEX_SUFFIX = ".speech.jsonl"  # 每行一段：{"pos": 归档内秒, "offset": 直播流秒, "duration": 秒}
+WRITE_QUEUE_CHUNKS = 64       # 编码跟不上时最多积压多少块音频 (约几分钟)，再多就丢块并计数，不阻塞转写
+READ_BLOCK_BYTES = 1 << 16
+
+
+def index_path(archive_path):
+    return archive_path[:-len(ARCHIVE_SUFFIX)] + INDEX_SUFFIX if archive_path.endswith(ARCHIVE_SUFFIX) else archive_path + ".jsonl"
+
+
+def merge_spans(spans, pad, length):
+    """VAD 区间 (采样点) 前后各加 pad 后合并重叠部分，限制在 [0, length) 内"""
+    merged = []
+    for span in spans:
+        start = max(0, span["start"] - pad)
+        end = min(length, span["end"] + pad)
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class SpeechArchiveWriter:
+    """
+    只保存 VAD 判为语音的片段：按到达顺序首尾相接编码进一个 Ogg/Opus 文件，
+    同时写一份索引 (归档位置 -> 直播流时间)，以后重新转写 / 说话人分离 / 检索只需要读这些语音。
+    编码由一个常驻的低优先级 ffmpeg 完成；Ogg 容器即使程序中途退出也能读到已写入的部分。
+    往 ffmpeg 写管道放在后台线程：低优先级进程被抢占时管道会写满，不能卡住转写线程。
+    队列满时整块丢弃 (连同它的索引)，归档时间轴只算真正写进去的音频。
+    """
+
+    def __init__(self, base_path, bitrate=BITRATE, pad=PAD_SECONDS, creationflags=0):
+        self.path = base_path + ARCHIVE_SUFFIX
+        self.index_path = base_path + INDEX_SUFFIX
+        self.pad = int(pad * SAMPLE_RATE)
+        self.written = 0            # 已写入的采样数 = 归档时间轴
+        self.stream_end = 0.0       # 见过的直播流最远位置 (算压缩比用)
+        self.spans = 0
+        self.dropped = 0            # 队列满丢掉的块数
+        cmd = ["ffmpeg", "-y", "-v", "error",
+               "-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", "1", "-i", "pipe:0",
+               "-c:a", "libopus", "-b:a", bitrate, "-application", "voip", "-f", "ogg", self.path]
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.DEVNULL, creationflags=creationflags | clip_scheduler.LOW_PRIORITY_FLAGS)
+        clip_scheduler.lower_priority(self._proc)
+        self._index = open(self.index_path, "a", encoding="utf-8")
+        self._queue = queue.Queue(WRITE_QUEUE_CHUNKS)
+        self._thread = threading.Thread(target=self._run, name="speech-archive", daemon=True)
+        self._thread.start()
+
+    def add(self, chunk_offset, audio, spans=None):
+        """
+        chunk_offset: 这段音频在直播流里的起点 (秒)；audio: float32 16kHz；
+        spans: VAD 给出的语音区间 [{"start", "end"}, ...] (采样点)，为空时整段都算语音。
+        """
+        self.stream_end = max(self.stream_end, chunk_offset + len(audio) / SAMPLE_RATE)
+        if self._proc is None:
+            return
+        spans = merge_spans(spans, self.pad, len(audio)) if spans else [[0, len(audio)]]
+        data = (np.clip(np.concatenate([audio[a:b] for a, b in spans]), -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+        try:
+            self._queue.put_nowait((chunk_offset, spans, data))
+        except queue.Full:
+            if not self.dropped:
+                print("⚠️ [语音归档] 编码跟不上，开始丢弃语音块")
+            self.dropped += 1
+
+    def _run(self):
+        """写入线程：先把音频写进 ffmpeg，写成功才记索引"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._proc is None:
+                continue
+            chunk_offset, spans, data = item
+            try:
+                self._proc.stdin.write(data)
+            except (BrokenPipeError, OSError):
+                print("⚠️ [语音归档] 编码进程已退出，停止归档")
+                self._proc = None
+                continue
+            for start, end in spans:
+                self._index.write(json.dumps({
+                    "pos": round(self.written / SAMPLE_RATE, 3),
+                    "offset": round(chunk_offset + start / SAMPLE_RATE, 3),
+                    "duration": round((end - start) / SAMPLE_RATE, 3),
+                }) + "\n")
+                self.written += end - start
+                self.spans += 1
+            self._index.flush()
+
+    def close(self):
+        """等队列里的音频写完再关 ffmpeg"""
+        self._queue.put(None)
+        self._thread.join()
+        self._index.close()
+        if self._proc is not None:
+            try:
+                self._proc.stdin.close()
+            except OSError:
+                pass
+            self._proc.wait()
+            self._proc = None
+
+    def report(self):
+        speech = self.written / SAMPLE_RATE
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        ratio = speech / self.stream_end * 100 if self.stream_end else 0.0
+        dropped = f"，编码跟不上丢弃 {self.dropped} 块" if self.dropped else ""
+        return (f"🗜️ [语音归档] 保存语音 {speech / 60:.1f} 分钟 / 直播 {self.stream_end / 60:.1f} 分钟 ({ratio:.0f}%)，"
+                f"{self.spans} 段{dropped}，{size / 1024 / 1024:.1f} MB -> {self.path}")
+
+
+# ================= 读取 =================
+
+class SpeechArchive:
+    """读取语音归档：归档位置与直播流时间互相换算，按直播流时间取出语音"""
+
+    def __init__(self, path):
+        self.path = path
+        self.spans = []             # [(归档秒, 直播流秒, 时长), ...]，相邻且首尾相接的段合并
+        with open(index_path(path), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    e = json.loads(line)
+                except ValueError:
+                    break           # 写到一半的最后一行
+                if self.spans:
+                    pos, offset, dur = self.spans[-1]
+                    if abs(pos + dur - e["pos"]) < 1e-3 and abs(offset + dur - e["offset"]) < 1e-3:
+                        self.spans[-1] = (pos, offset, dur + e["duration"])
+                        continue
+                self.spans.append((e["pos"], e["offset"], e["duration"]))
+        self._pos = [s[0] for s in self.spans]
+        self._offsets = [s[1] for s in self.spans]
+
+    @property
+    def speech_seconds(self):
+        return sum(s[2] for s in self.spans)
+
+    def to_stream(self, pos):
+        """归档内秒 -> 直播流秒"""
+        i = max(0, bisect.bisect_right(self._pos, pos) - 1)
+        start, offset, _ = self.spans[i]
+        return offset + (pos - start)
+
+    def to_archive(self, offset):
+        """直播流秒 -> 归档内秒 (落在两段语音之间时取下一段的开头)"""
+        i = bisect.bisect_right(self._offsets, offset) - 1
+        if i >= 0:
+            pos, start, dur = self.spans[i]
+            if offset < start + dur:
+                return pos + (offset - start)
+        return self.spans[i + 1][0] if i + 1 < len(self.spans) else self._pos[-1] + self.spans[-1][2]
+
+    def decode(self, pos=0.0, duration=None):
+        """解码归档的一段 (归档时间轴) 为 float32 16kHz"""
+        cmd = ["ffmpeg", "-v", "error", "-ss", str(pos)]
+        if duration is not None:
+            cmd += ["-t", str(duration)]
+        cmd += ["-i", self.path, "-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", "1", "-"]
+        out = subprocess.run(cmd, stdout=subprocess.PIPE, check=True).stdout
+        return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+
+    def iter_spans(self, start=None, end=None):
+        """
+        按直播流时间顺序产出 (直播流秒, 音频)；start / end 限定直播流时间范围。
+        从第一段要用的位置起开一个 ffmpeg 顺序解码，边读管道边按段切出来，
+        内存里只留当前一段 (长直播的归档整段解码要好几百 MB)。
+        """
+        wanted = [s for s in self.spans
+                  if not ((end is not None and s[1] >= end) or (start is not None and s[1] + s[2] <= start))]
+        if not wanted:
+            return
+        cmd = ["ffmpeg", "-v", "error", "-ss", str(wanted[0][0]), "-i", self.path,
+               "-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", "1", "-"]
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+        read = int(wanted[0][0] * SAMPLE_RATE)      # 管道里下一个采样在归档里的位置
+        try:
+            for pos, offset, dur in wanted:
+                a = int(pos * SAMPLE_RATE)
+                skip = max(0, a - read) * 2
+                while skip:
+                    block = proc.stdout.read(min(skip, READ_BLOCK_BYTES))
+                    if not block:
+                        return
+                    skip -= len(block)
+                data = _read_exact(proc.stdout, int(dur * SAMPLE_RATE) * 2)
+                read = max(read, a) + len(data) // 2
+                if data:
+                    yield offset, np.frombuffer(data, np.int16).astype(np.float32) / 32768.0
+                if len(data) < int(dur * SAMPLE_RATE) * 2:
+                    return
+        finally:
+            proc.stdout.close()
+            proc.kill()
+            proc.wait()
+
+
+def _read_exact(f, n):
+    """读满 n 字节，管道结束时返回已读到的部分"""
+    buf = bytearray()
+    while len(buf) < n:
+        block = f.read(n - len(buf))
+        if not block:
+            break
+        buf += block
+    return bytes(buf)
+
+
+# ================= 命令行 =================
+
+def main():
+    parser = argparse.ArgumentParser(description="语音归档 (只存 VAD 语音段的 Opus) 的查看与导出")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_info = sub.add_parser("info", help="语音段数、时长、体积")
+    p_info.add_argument("archive")
+    p_extract = sub.add_parser("extract", help="按直播流时间导出语音 (wav，各段首尾相接)")
+    p_extract.add_argument("archive")
+    p_extract.add_argument("start", type=float)
+    p_extract.add_argument("end", type=float)
+    p_extract.add_argument("out")
+    args = parser.parse_args()
+
+    archive = SpeechArchive(args.archive)
+    if not archive.spans:
+        print("⚠️ 归档里没有语音段")
+        sys.exit(1)
+    if args.cmd == "info":
+        size = os.path.getsize(args.archive)
+        first, last = archive.spans[0], archive.spans[-1]
+        print(f"🗜️ {len(archive.spans)} 段语音，共 {archive.speech_seconds / 60:.1f} 分钟，"
+              f"覆盖直播 {first[1]:.0f}s ~ {last[1] + last[2]:.0f}s，{size / 1024 / 1024:.2f} MB")
+    elif args.cmd == "extract":
+        pos = archive.to_archive(args.start)
+        dur = archive.to_archive(args.end) - pos
+        cmd = ["ffmpeg", "-y", "-v", "error", "-ss", str(pos), "-t", str(max(0.0, dur)), "-i", args.archive, args.out]
+        subprocess.run(cmd, check=True)
+        print(f"✅ 已导出 {dur:.1f}s 语音 -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
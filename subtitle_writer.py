@@ -0,0 +1,160 @@
+import os
+import re
+import argparse
+import threading
+import subprocess
+
+import segment_record
+
+# ================= 配置区 =================
+MIN_CUE_SECONDS = 1.0     # 单条字幕最短显示时长
+MAX_CUE_SECONDS = 8.0     # 单条字幕最长显示时长 (不超过一个音频切片)
+
+_SRT_TIME_RE = re.compile(r"(\d+):(\d{2}):(\d{2})[,.](\d{3})\s*-->\s*(\d+):(\d{2}):(\d{2})[,.](\d{3})")
+
+
+def format_ts(seconds, sep=","):
+    """秒 -> HH:MM:SS,mmm (SRT) / HH:MM:SS.mmm (WebVTT)"""
+    ms = int(round(max(0.0, seconds) * 1000))
+    h, ms = divmod(ms, 3600000)
+    m, ms = divmod(ms, 60000)
+    s, ms = divmod(ms, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d}{sep}{ms:03d}"
+
+
+def srt_block(index, start, end, text):
+    return f"{index}\n{format_ts(start)} --> {format_ts(end)}\n{text}\n\n"
+
+
+def vtt_block(start, end, text):
+    return f"{format_ts(start, '.')} --> {format_ts(end, '.')}\n{text}\n\n"
+
+
+def write_srt(cues, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for i, (start, end, text) in enumerate(cues, 1):
+            f.write(srt_block(i, start, end, text))
+
+
+def read_srt(path):
+    """读取 SRT / WebVTT，返回 [(开始秒, 结束秒, 文本), ...]"""
+    cues = []
+    with open(path, "r", encoding="utf-8") as f:
+        blocks = f.read().replace("\r\n", "\n").split("\n\n")
+    for block in blocks:
+        lines = block.strip().split("\n")
+        for i, line in enumerate(lines):
+            m = _SRT_TIME_RE.search(line)
+            if m:
+                g = [int(x) for x in m.groups()]
+                start = g[0] * 3600 + g[1] * 60 + g[2] + g[3] / 1000
+                end = g[4] * 3600 + g[5] * 60 + g[6] + g[7] / 1000
+                cues.append((start, end, "\n".join(lines[i + 1:])))
+                break
+    return cues
+
+
+# ================= 实时字幕写入 =================
+
+class SubtitleWriter:
+    """
+    按录像时间轴增量写出 .srt / .vtt：每条字幕到来就追加并刷盘，
+    录像转封装和切片随时能读到最新内容；同时在内存里保留一份供切片截取。
+    """
+
+    def __init__(self, base_path, formats=("srt", "vtt")):
+        self.base_path = base_path
+        self.paths = {fmt: f"{base_path}.{fmt}" for fmt in formats}
+        self.cues = []
+        self.lock = threading.Lock()
+        self._files = {fmt: open(path, "w", encoding="utf-8") for fmt, path in self.paths.items()}
+        if "vtt" in self._files:
+            self._files["vtt"].write("WEBVTT\n\n")
+            self._files["vtt"].flush()
+
+    @property
+    def srt_path(self):
+        return self.paths.get("srt")
+
+    def add(self, start, end, text):
+        """追加一条字幕；与上一条重叠时顺延开始时间，显示时长限制在 [MIN, MAX] 之间"""
+        text = text.strip()
+        if not text:
+            return
+        with self.lock:
+            if self.cues and start < self.cues[-1][1]:
+                start = self.cues[-1][1]
+            end = min(max(end, start + MIN_CUE_SECONDS), start + MAX_CUE_SECONDS)
+            self.cues.append((start, end, text))
+            for fmt, f in self._files.items():
+                f.write(srt_block(len(self.cues), start, end, text) if fmt == "srt" else vtt_block(start, end, text))
+                f.flush()
+
+    def cues_between(self, start, end):
+        """与 [start, end] 有交集的字幕 (保持录像时间轴，交给 ffmpeg 的 -ss/-to 一起截取)"""
+        with self.lock:
+            return [c for c in self.cues if c[1] > start and c[0] < end]
+
+    def close(self):
+        with self.lock:
+            for f in self._files.values():
+                f.close()
+            self._files = {}
+
+
+# ================= ffmpeg 封装参数 =================
+
+def subtitle_codec(out_path):
+    """MP4 只支持 mov_text 文本字幕，MKV 直接存 SRT；都是软字幕，不涉及音视频重编码"""
+    return "mov_text" if out_path.lower().endswith((".mp4", ".m4v", ".mov")) else "srt"
+
+
+def mux_cmd(video_path, srt_path, out_path, output_args=(), input_args=()):
+    """
+    把字幕作为软字幕轨封装进去，音视频流直接复制。
+    output_args 放在输出文件前 (例如切片的 -ss / -to，会对音视频和字幕同时生效)；
+    input_args 放在视频输入前 (例如从管道读 mpegts 时的 -f mpegts)。
+    """
+    return [
+        "ffmpeg", "-y", "-v", "error",
+        *input_args, "-i", video_path,
+        "-i", srt_path,
+        *output_args,
+        "-map", "0:v?", "-map", "0:a?", "-map", "1:0",
+        "-c", "copy",
+        "-c:s", subtitle_codec(out_path),
+        "-metadata:s:s:0", "language=chi",
+        *(["-movflags", "faststart"] if subtitle_codec(out_path) == "mov_text" else []),
+        out_path,
+    ]
+
+
+# ================= 命令行 =================
+
+def main():
+    parser = argparse.ArgumentParser(description="从结构化记录生成字幕，或把字幕封装进录像")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_gen = sub.add_parser("generate", help="从 .jsonl 记录生成 .srt / .vtt")
+    p_gen.add_argument("jsonl")
+    p_gen.add_argument("--out", default=None, help="输出路径 (不含扩展名)，默认与记录同名")
+    p_mux = sub.add_parser("mux", help="把 .srt 作为软字幕封装进录像 (流复制)")
+    p_mux.add_argument("video")
+    p_mux.add_argument("srt")
+    p_mux.add_argument("out")
+    args = parser.parse_args()
+
+    if args.cmd == "generate":
+        base = args.out or os.path.splitext(args.jsonl)[0]
+        writer = SubtitleWriter(base)
+        for rec in segment_record.read_jsonl(args.jsonl):
+            if rec.stream_offset is not None:
+                writer.add(rec.stream_offset, rec.stream_offset + (rec.duration or MAX_CUE_SECONDS), rec.text)
+        writer.close()
+        print(f"✅ 已生成 {len(writer.cues)} 条字幕 -> {', '.join(writer.paths.values())}")
+    elif args.cmd == "mux":
+        subprocess.run(mux_cmd(args.video, args.srt, args.out), check=True)
+        print(f"✅ 已封装 -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
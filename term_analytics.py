@@ -0,0 +1,336 @@
+import os
+import re
+import sys
+import math
+import time
+import zlib
+import pickle
+import argparse
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from keyword_matcher import normalize_text
+import segment_record
+
+# ================= 配置区 =================
+NGRAM_SIZES = (2, 3, 4)       # 中文按字符 n-gram 计数，梗和昵称一般 2~4 个字
+SKETCH_DEPTH = 4
+ROOM_SKETCH_WIDTH = 1 << 16   # 房间基线与当天累计：各 4 x 65536 x 4 字节 = 1 MB
+SCOPE_SKETCH_WIDTH = 1 << 14  # 单场 / 单日：256 KB
+HEAVY_HITTERS = 300           # 每个统计范围保留的高频候选数
+MAX_SESSIONS_PER_ROOM = 10    # 只保留最近 N 场 / N 天的明细 (基线单独累计，不受影响)
+MAX_DAYS_PER_ROOM = 14
+BASELINE_DECAY = 0.9          # 每并入一天，基线先衰减，老梗的权重逐渐降低
+TREND_MIN_COUNT = 5           # 至少出现这么多次 (按行计) 才算趋势
+SUBSUME_RATIO = 0.8           # 长词次数 >= 短词的 80% 时，短词视为长词的碎片不单独展示
+STATE_DIR = "term_stats"      # 统计状态目录 (GUI 与命令行共用，基线跨场累计)：每个房间一个文件，
+                              # 多个 GUI 进程录不同房间时各写各的，不会互相覆盖
+LEGACY_STATE_FILE = "term_stats.pkl"  # 旧版所有房间存在一个文件里，读到时按房间迁移
+
+_CJK_RUN_RE = re.compile(r"[一-鿿]+")
+_WORD_RE = re.compile(r"[a-z0-9]{2,}")
+
+
+def extract_terms(text):
+    """一行文本里的候选词：中文字符 n-gram + 英文 / 数字词，同一行内去重 (刷屏的 "哈哈哈哈" 只算一次)"""
+    norm = normalize_text(text)
+    terms = set(_WORD_RE.findall(norm))
+    for run in _CJK_RUN_RE.findall(norm):
+        for n in NGRAM_SIZES:
+            for i in range(len(run) - n + 1):
+                terms.add(run[i:i + n])
+    return terms
+
+
+# ================= 概率数据结构 =================
+
+class CountMinSketch:
+    """Count-Min Sketch (保守更新)：内存固定，估计值只会偏大不会偏小"""
+
+    def __init__(self, width, depth=SKETCH_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.float32)
+        self.rows = np.arange(depth)
+        self.total = 0.0
+
+    def _cols(self, term):
+        data = term.encode("utf-8")
+        return [zlib.crc32(data, seed * 0x9E3779B1 & 0xFFFFFFFF) % self.width for seed in range(1, self.depth + 1)]
+
+    def add(self, term, count=1.0):
+        """加计数并返回新的估计值 (只抬高低于新估计值的格子)"""
+        cols = self._cols(term)
+        cells = self.table[self.rows, cols]
+        est = cells.min() + count
+        self.table[self.rows, cols] = np.maximum(cells, est)
+        self.total += count
+        return float(est)
+
+    def estimate(self, term):
+        return float(self.table[self.rows, self._cols(term)].min())
+
+    def merge(self, other, decay=1.0):
+        """self = self * decay + other (两者宽度必须相同)"""
+        self.table *= decay
+        self.table += other.table
+        self.total = self.total * decay + other.total
+
+    def clear(self):
+        self.table[:] = 0
+        self.total = 0.0
+
+
+class TermCounter:
+    """一个统计范围 (房间 / 单场 / 单日)：Count-Min 计数 + 固定容量的高频候选表"""
+
+    def __init__(self, width, capacity=HEAVY_HITTERS):
+        self.sketch = CountMinSketch(width)
+        self.capacity = capacity
+        self.top = {}               # 候选词 -> 估计次数
+        self.min_term = None
+        self.lines = 0
+
+    def _refresh_min(self):
+        self.min_term = min(self.top, key=self.top.get) if self.top else None
+
+    def add_terms(self, terms):
+        self.lines += 1
+        for term in terms:
+            est = self.sketch.add(term)
+            if term in self.top:
+                self.top[term] = est
+                if term == self.min_term:
+                    self._refresh_min()
+            elif len(self.top) < self.capacity:
+                self.top[term] = est
+                if self.min_term is None or est < self.top[self.min_term]:
+                    self.min_term = term
+            elif est > self.top[self.min_term]:
+                # 挤掉当前最小的候选；只有替换时才重新找最小值，热身之后很少发生
+                del self.top[self.min_term]
+                self.top[term] = est
+                self._refresh_min()
+
+    def most_common(self, k=20):
+        """去掉被更长词覆盖的碎片 ("片飞" 被 "切片飞来" 覆盖) 后的 top-k"""
+        ranked = sorted(self.top.items(), key=lambda kv: (-kv[1], -len(kv[0])))
+        kept = []
+        for term, count in ranked:
+            if any(term in longer and c >= count * SUBSUME_RATIO for longer, c in self.top.items() if len(longer) > len(term)):
+                continue
+            kept.append((term, count))
+            if len(kept) >= k:
+                break
+        return kept
+
+
+class RoomStats:
+    def __init__(self):
+        self.baseline = TermCounter(ROOM_SKETCH_WIDTH)   # 今天以前的累计 (按天衰减)
+        self.today = CountMinSketch(ROOM_SKETCH_WIDTH)   # 今天的计数，跨天时并入基线
+        self.today_lines = 0
+        self.current_day = None
+        self.sessions = OrderedDict()   # 会话 -> TermCounter，超过上限的最旧一场丢弃
+        self.days = OrderedDict()       # 日期 -> TermCounter，超过上限的最旧一天丢弃
+
+    def scope(self, table, key, limit):
+        counter = table.get(key)
+        if counter is None:
+            counter = table[key] = TermCounter(SCOPE_SKETCH_WIDTH)
+            while len(table) > limit:
+                table.popitem(last=False)
+        return counter
+
+    def roll_day(self, day):
+        """新的一天开始：今天的计数衰减并入基线，趋势永远和"今天以前"比较"""
+        if self.current_day is not None and day != self.current_day and self.today_lines:
+            base = self.baseline
+            base.sketch.merge(self.today, BASELINE_DECAY)
+            base.lines = base.lines * BASELINE_DECAY + self.today_lines
+            day_counter = self.days.get(self.current_day)
+            if day_counter is not None:
+                for term, count in day_counter.top.items():
+                    base.top[term] = base.top.get(term, 0) * BASELINE_DECAY + count
+            if len(base.top) > base.capacity:
+                base.top = dict(sorted(base.top.items(), key=lambda kv: -kv[1])[:base.capacity])
+            base._refresh_min()
+            self.today.clear()
+            self.today_lines = 0
+        self.current_day = day
+
+    def add_terms(self, session, day, terms):
+        if day != self.current_day:
+            self.roll_day(day)
+        for term in terms:
+            self.today.add(term)
+        self.today_lines += 1
+        self.scope(self.days, day, MAX_DAYS_PER_ROOM).add_terms(terms)
+        self.scope(self.sessions, session, MAX_SESSIONS_PER_ROOM).add_terms(terms)
+
+
+# ================= 统计入口 =================
+
+class TermAnalytics:
+    """
+    流式词频统计：按房间 / 单场 / 单日三个范围计数，内存与处理过的日志总量无关
+    (每个房间 2 MB 基线 + 最多 MAX_SESSIONS + MAX_DAYS 个 256 KB 的明细)。
+    趋势 = 当前范围内的出现率显著高于房间基线 (今天以前的、按天衰减的累计)。
+    state_dir 不为空时，房间的状态在第一次用到时才从 state_dir/房间.pkl 读入 (创建对象不读盘)，
+    save() 只写本进程改动过的房间。
+    """
+
+    def __init__(self, state_dir=None):
+        self.rooms = {}
+        self.state_dir = state_dir
+        self.lock = threading.Lock()
+        self._loaded = set()        # 已经尝试从磁盘读过的房间
+        self._dirty = set()         # 本进程改动过、需要写回的房间
+        self._legacy = None
+
+    def _room_path(self, room):
+        return os.path.join(self.state_dir, re.sub(r"[^\w-]", "_", room) + ".pkl")
+
+    def _room(self, room, create=False):
+        """取房间状态 (调用方持锁)，第一次访问时从磁盘读入"""
+        if room not in self._loaded and self.state_dir:
+            self._loaded.add(room)
+            path = self._room_path(room)
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    self.rooms[room] = pickle.load(f)
+            else:
+                if self._legacy is None:
+                    self._legacy = {}
+                    if os.path.exists(LEGACY_STATE_FILE):
+                        with open(LEGACY_STATE_FILE, "rb") as f:
+                            self._legacy = pickle.load(f)
+                if room in self._legacy:
+                    self.rooms[room] = self._legacy.pop(room)
+                    self._dirty.add(room)
+        stats = self.rooms.get(room)
+        if stats is None and create:
+            stats = self.rooms[room] = RoomStats()
+        return stats
+
+    def add(self, room, session, text, wall_time=None):
+        terms = extract_terms(text)
+        if not terms:
+            return
+        day = time.strftime("%Y-%m-%d", time.localtime(wall_time or time.time()))
+        room = str(room)
+        with self.lock:
+            self._room(room, create=True).add_terms(session, day, terms)
+            self._dirty.add(room)
+
+    def preload(self, room):
+        """提前把房间状态读进内存 (在后台线程里调用，避免第一句转写时读盘)"""
+        with self.lock:
+            self._room(str(room))
+
+    def _counter(self, room, scope, key):
+        stats = self._room(str(room))
+        if stats is None:
+            return None
+        if scope == "room":
+            return stats.baseline
+        table = stats.sessions if scope == "session" else stats.days
+        if key is None:
+            return next(reversed(table.values()), None)
+        return table.get(key)
+
+    def top(self, room, scope="session", key=None, k=20):
+        """top-k 高频词；scope 为 session / day / room，key 为空时取最近的一场 / 一天"""
+        with self.lock:
+            counter = self._counter(room, scope, key)
+            return counter.most_common(k) if counter else []
+
+    def trending(self, room, scope="session", key=None, k=20, min_count=TREND_MIN_COUNT):
+        """
+        突然变热的词：按基线出现率算期望次数 e，观测次数 c，得分 (c - e) / sqrt(e + 1)。
+        返回 [(词, 次数, 期望次数, 得分), ...]
+        """
+        with self.lock:
+            stats = self._room(str(room))
+            counter = self._counter(room, scope, key)
+            if not stats or not counter or not counter.lines or not stats.baseline.lines:
+                return []
+            base = stats.baseline
+            out = []
+            for term, count in counter.most_common(len(counter.top)):
+                if count < min_count:
+                    continue
+                expected = base.sketch.estimate(term) / max(base.lines, 1.0) * counter.lines
+                score = (count - expected) / math.sqrt(expected + 1.0)
+                if score > 0:
+                    out.append((term, count, expected, score))
+            out.sort(key=lambda t: -t[3])
+            return out[:k]
+
+    def memory_bytes(self):
+        total = 0
+        for stats in self.rooms.values():
+            total += stats.today.table.nbytes
+            for counter in [stats.baseline, *stats.sessions.values(), *stats.days.values()]:
+                total += counter.sketch.table.nbytes
+        return total
+
+    def save(self):
+        """把改动过的房间各自写回 (临时文件名带进程号，写完再原子替换)"""
+        with self.lock:
+            if not self.state_dir or not self._dirty:
+                return
+            os.makedirs(self.state_dir, exist_ok=True)
+            for room in self._dirty:
+                path = self._room_path(room)
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, "wb") as f:
+                    pickle.dump(self.rooms[room], f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, path)
+            self._dirty.clear()
+
+
+def format_trending(items):
+    return "、".join(f"{term}×{int(count)}" for term, count, _, _ in items)
+
+
+# ================= 命令行 =================
+
+def main():
+    parser = argparse.ArgumentParser(description="弹幕外的梗 / 高频词统计 (流式，内存固定)")
+    parser.add_argument("--state", default=STATE_DIR, help="统计状态目录 (多次运行累加)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_ingest = sub.add_parser("ingest", help="导入 .jsonl 记录或 .txt 日志 (按时间顺序传入)")
+    p_ingest.add_argument("paths", nargs="+")
+    p_top = sub.add_parser("top", help="高频词与趋势词")
+    p_top.add_argument("room")
+    p_top.add_argument("--scope", choices=("session", "day", "room"), default="session")
+    p_top.add_argument("--key", default=None, help="会话 id 或日期 YYYY-MM-DD，默认最近一个")
+    p_top.add_argument("-k", type=int, default=20)
+    args = parser.parse_args()
+
+    analytics = TermAnalytics(args.state)
+    if args.cmd == "ingest":
+        t0 = time.time()
+        lines = 0
+        for path in args.paths:
+            records = segment_record.read_jsonl(path) if path.endswith(".jsonl") else segment_record.records_from_log(path)
+            for rec in records:
+                analytics.add(rec.room, rec.session, rec.text, rec.wall_time)
+                lines += 1
+        analytics.save()
+        print(f"✅ 已统计 {lines} 行，用时 {time.time() - t0:.1f}s，占用 {analytics.memory_bytes() / 1024 / 1024:.1f} MB")
+    elif args.cmd == "top":
+        top = analytics.top(args.room, args.scope, args.key, args.k)
+        if not top:
+            print(f"⚠️ 房间 {args.room} 没有统计数据")
+            sys.exit(1)
+        print("📊 高频词: " + "、".join(f"{t}×{int(c)}" for t, c in top))
+        if args.scope != "room":
+            print("📈 趋势词: " + (format_trending(analytics.trending(args.room, args.scope, args.key, args.k)) or "无"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import batch_transcribe
+import speech_archive
+
+SR = batch_transcribe.SAMPLE_RATE
+
+
+def test_archive_resume_trims_span_at_checkpoint(tmp_path, monkeypatch):
+    path = str(tmp_path / "s") + speech_archive.ARCHIVE_SUFFIX
+    with open(speech_archive.index_path(path), "w", encoding="utf-8") as f:
+        f.write(json.dumps({"pos": 0.0, "offset": 10.0, "duration": 6.0}) + "\n")
+        f.write(json.dumps({"pos": 6.0, "offset": 40.0, "duration": 2.0}) + "\n")
+    # 每个采样的值就是它在直播流里的 1/100 秒，方便核对切下来的位置
+    spans = [(10.0, np.arange(1000, 1600).repeat(SR // 100) / 32768.0),
+             (40.0, np.arange(4000, 4200).repeat(SR // 100) / 32768.0)]
+
+    def fake_iter_spans(self, start=None, end=None):
+        for offset, audio in spans:
+            if start is None or offset + len(audio) / SR > start:
+                yield offset, audio.astype(np.float32)
+
+    monkeypatch.setattr(speech_archive.SpeechArchive, "iter_spans", fake_iter_spans)
+    out = list(batch_transcribe.iter_archive_spans(path, start=13.0))
+    first_offset, first_audio = out[0]
+    # 断点落在第一段中间：从 13 秒开始，前 3 秒不再重复送进 Whisper
+    assert first_offset == pytest.approx(13.0)
+    assert int(first_audio[0]) == pytest.approx(1300, abs=1)
+    assert sum(len(a) for _, a in out) == (3 + 2) * SR
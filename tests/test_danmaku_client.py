@@ -0,0 +1,58 @@
+import json
+import queue
+import random
+import threading
+import time
+from collections import Counter
+
+import danmaku_client
+
+
+def _expected_kinds(raw_path):
+    stats = {"messages": 0, "errors": 0}
+    for wall, packet in danmaku_client.read_raw(raw_path):
+        _, header_len, proto, _, _ = danmaku_client.HEADER.unpack_from(packet)
+        danmaku_client.decode_batch([(wall, proto, packet[header_len:])], lambda w: 0.0,
+                                    danmaku_client.KEEP_KINDS, stats)
+    return Counter({k: stats[k] for k in danmaku_client.KEEP_KINDS if stats.get(k)}), stats["messages"]
+
+
+def test_replay_roundtrip(tmp_path):
+    raw = str(tmp_path / "storm.raw")
+    out = str(tmp_path / "storm.danmaku.jsonl")
+    random.seed(0)
+    total = danmaku_client.synth_raw(raw, seconds=1, rate=2000, burst=50)
+    expected, messages = _expected_kinds(raw)
+    assert messages == total and expected
+
+    ports = queue.Queue()
+    server = threading.Thread(target=danmaku_client.serve_replay, args=(raw, 0),
+                              kwargs={"speed": 0, "on_listen": ports.put}, daemon=True)
+    server.start()
+    port = ports.get(timeout=5)
+    assert port != 0
+
+    clock = danmaku_client.StreamClock(time.time())
+    clock.mark(100.0)
+    t0 = time.time()
+    client = danmaku_client.DanmakuClient("1", out, clock=clock, server=("127.0.0.1", port)).start()
+    # 回放服务器发完就断开，客户端随后开始重连
+    while not client.stats["reconnects"] and time.time() - t0 < 10:
+        time.sleep(0.05)
+    elapsed = time.time() - t0
+    client.close()
+    server.join(5)
+
+    with open(out, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert client.stats["messages"] == total
+    assert Counter(r["kind"] for r in records) == expected
+    assert all(100.0 <= r["stream_offset"] <= 100.0 + elapsed for r in records)
+
+
+def test_stream_clock_follows_audio_anchor():
+    clock = danmaku_client.StreamClock(1000.0)
+    assert clock(1005.0) == 5.0
+    # 音频只读到 8 秒 (直播卡顿过)，按墙钟算已经 12 秒：弹幕跟着音频走
+    clock.mark(8.0, wall=1012.0)
+    assert clock(1013.5) == 9.5
@@ -0,0 +1,21 @@
+import os
+
+import hallucination_detector
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "hallucination_labelled.jsonl")
+
+
+def test_labelled_false_positive_rate():
+    stats = hallucination_detector.evaluate_labelled(FIXTURE)
+    assert stats["good"] >= 40 and stats["bad"] >= 20
+    # 正常发言 (笑声、拖长音、单字应答、复读式口头禅) 一句都不能被丢
+    assert stats["false_drop"] == 0
+    assert stats["recall"] >= 0.85
+    # 没丢掉的幻觉至少要被标记出来
+    assert stats["true_drop"] + stats["true_flag"] == stats["bad"]
+
+
+def test_loop_is_collapsed_not_dropped():
+    verdict = hallucination_detector.judge_segment({"text": "谢谢大家谢谢大家谢谢大家", "avg_logprob": -0.2})
+    assert verdict.text == "谢谢大家"
+    assert verdict.action != "keep"
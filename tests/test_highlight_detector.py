@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("numpy")  # term_analytics 依赖 numpy
+
+import highlight_detector as hd
+
+
+def _warm(det, room, chunk=8.0):
+    offset = 0.0
+    while offset < hd.WARMUP_SECONDS + chunk:
+        det.observe(room, offset, chunk, 4.0, "嗯 今天先随便聊聊")
+        offset += chunk
+    return offset
+
+
+def test_length_limit_splits_without_cooldown():
+    det = hd.HighlightDetector()
+    chunk = 8.0
+    offset = _warm(det, "1", chunk)
+    found = []
+    for _ in range(int(3 * hd.MAX_HIGHLIGHT_SECONDS / chunk)):
+        h = det.observe("1", offset, chunk, 8.0, "哈哈哈哈 笑死", keyword_hits=1)
+        if h:
+            found.append(h)
+        offset += chunk
+    assert len(found) >= 2
+    # 持续的高光被按长度切开：下一段从上一段结束处接上，中间没有冷却造成的空档
+    for prev, cur in zip(found, found[1:]):
+        assert cur.start + hd.PRE_ROLL_SECONDS == prev.end - hd.POST_ROLL_SECONDS
+
+
+def test_natural_end_applies_cooldown():
+    det = hd.HighlightDetector()
+    chunk = 8.0
+    offset = _warm(det, "1", chunk)
+    found = None
+    for _ in range(4):
+        det.observe("1", offset, chunk, 8.0, "哈哈哈哈 笑死", keyword_hits=1)
+        offset += chunk
+    while found is None:
+        found = det.observe("1", offset, chunk, 0.0, "")
+        offset += chunk
+    assert det.room("1").cooldown_until == found.end - hd.POST_ROLL_SECONDS + hd.COOLDOWN_SECONDS
@@ -0,0 +1,35 @@
+import threading
+
+import output_sinks
+
+
+def test_bad_config_takes_no_resources(tmp_path):
+    path = tmp_path / "out.jsonl"
+    fanout = output_sinks.SinkFanout.from_config([
+        {"type": "file", "path": str(path), "on_full": "drop_newest"},
+        {"type": "stdout", "on_full": "drop_newest"},
+    ])
+    assert fanout.sinks == []
+    assert not path.exists()
+    # 配置写错时不能已经把进程的 stdout 改走
+    assert output_sinks._stdout_stream is None
+
+
+def test_counters_add_up_under_contention(tmp_path):
+    sink = output_sinks.FileSink(str(tmp_path / "out.jsonl"), queue_size=50, batch_size=5, batch_interval=0.01)
+
+    def pump():
+        for i in range(5000):
+            sink.offer({"i": i})
+
+    threads = [threading.Thread(target=pump) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    sink.close()
+    s = sink.stats
+    assert s["offered"] == 20000
+    assert s["delivered"] + s["dropped"] == s["offered"]
+    with open(tmp_path / "out.jsonl", "r", encoding="utf-8") as f:
+        assert sum(1 for _ in f) == s["delivered"]
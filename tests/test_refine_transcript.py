@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+import refine_transcript
+import segment_record
+
+
+def _live(*items):
+    return [segment_record.SegmentRecord("1", "s1", offset, 0.0, duration, None, text)
+            for offset, duration, text in items]
+
+
+def _seg(start, end, text):
+    return {"start": start, "end": end, "text": text}
+
+
+def test_align_segment_spanning_two_records_is_a_merge():
+    live = _live((0.0, 8.0, "今天打排位"), (8.0, 8.0, "先打两把"), (30.0, 8.0, "谢谢老板"))
+    refined = [_seg(1.0, 12.0, "今天打排位先打两把"), _seg(50.0, 55.0, "下播了")]
+    groups, added, merged = refine_transcript.align(live, refined)
+    assert [len(g) for g in groups] == [1, 0, 0]
+    assert added == [refined[1]]
+    # 第二条的话被合进第一条的精修文本里，不是删除；第三条没有任何重叠才是删除
+    assert merged == [None, 0, None]
+
+
+def test_compare_counts_and_cer():
+    live = _live((0.0, 8.0, "今天打排位"), (8.0, 8.0, "先打两把"), (30.0, 8.0, "谢谢老板"))
+    refined = [_seg(1.0, 12.0, "今天打排位先打两把"), _seg(50.0, 55.0, "下播了")]
+    lines, report, stats = refine_transcript.compare(live, refined)
+    assert [text for _, text, _ in lines] == ["今天打排位先打两把", "下播了"]
+    assert (stats["changed"], stats["added"], stats["removed"], stats["merged"]) == (0, 1, 1, 1)
+    # 合并的两条拼起来和修正文本一致 (0)；删除的幻觉 "谢谢老板" 4 个错字；新增 "下播了" 3 个漏字
+    assert stats["dist"] == 4 + 3
+    assert stats["length"] == 9 + 3
+    assert stats["cer"] == pytest.approx(7 / 12)
+    assert any("删除" in entry for _, entry in report)
+    assert any("合并进 0.0s" in entry for _, entry in report)
+
+
+def test_compare_changed_line():
+    live = _live((0.0, 8.0, "绝命山主来了"))
+    lines, report, stats = refine_transcript.compare(live, [_seg(0.5, 7.0, "绝命山猪来了")])
+    assert stats["changed"] == 1 and stats["dist"] == 1 and stats["length"] == 6
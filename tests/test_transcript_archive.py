@@ -0,0 +1,57 @@
+import pinyin_index
+import segment_record
+import transcript_archive
+
+
+def _records(n=5, session="s1"):
+    return [
+        segment_record.SegmentRecord.from_dict({
+            "session": session, "room": "1", "stream_offset": i * 10.0,
+            "wall_time": 1000 + i * 10.0, "text": f"第{i}句绝命山主",
+        })
+        for i in range(n)
+    ]
+
+
+def _fake_pinyin(monkeypatch):
+    # 不依赖 pypinyin：每个字当一个音节
+    monkeypatch.setattr(pinyin_index, "lazy_pinyin", True)
+    monkeypatch.setattr(pinyin_index, "to_syllables", lambda text: (list(text), list(range(len(text)))))
+
+
+def test_ingest_after_live_archiving_is_reindexed(tmp_path, monkeypatch):
+    _fake_pinyin(monkeypatch)
+    log = tmp_path / "ava_1_log_1000.jsonl"
+    log.write_text("".join(r.to_json() + "\n" for r in _records()), encoding="utf-8")
+
+    conn = transcript_archive.connect(str(tmp_path / "a.db"))
+    with conn:
+        transcript_archive.insert_records(conn, _records())
+    assert pinyin_index.index_new(conn) == 5
+
+    # 导入完整记录会删掉实时入库的行；新行不能复用旧行号，否则拼音索引永远补不上
+    assert transcript_archive.ingest_file(conn, str(log)) == 5
+    assert pinyin_index.index_new(conn) == 5
+    assert conn.execute("SELECT count(*) FROM segments_pinyin").fetchone()[0] == 5
+    assert len(transcript_archive.search(conn, "绝命山主", phonetic=True)) == 5
+    conn.close()
+
+
+def test_two_character_terms_use_bigram_index(tmp_path):
+    conn = transcript_archive.connect(str(tmp_path / "a.db"))
+    with conn:
+        transcript_archive.insert_records(conn, _records(3) + [
+            segment_record.SegmentRecord.from_dict({"session": "s2", "room": "2", "stream_offset": 0.0,
+                                                    "wall_time": 2000.0, "text": "感谢老板的火箭"}),
+        ])
+    transcript_archive.index_side_tables(conn)
+
+    sql = "EXPLAIN QUERY PLAN SELECT rowid FROM segments_bigram WHERE segments_bigram MATCH '\"山主\"'"
+    assert "VIRTUAL TABLE" in str(conn.execute(sql).fetchall())
+    assert len(transcript_archive.search(conn, "山主")) == 3
+    assert len(transcript_archive.search(conn, "山主", room="2")) == 0
+    hits = transcript_archive.search(conn, "火箭 老板")
+    assert [h["snippet"] for h in hits] == ["感谢【老板】的【火箭】"]
+    # 两字词与长词混合
+    assert len(transcript_archive.search(conn, "绝命山主 第1")) == 1
+    conn.close()
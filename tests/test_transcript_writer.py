@@ -0,0 +1,81 @@
+import time
+
+import transcript_writer
+
+
+class _TornFile:
+    """写一半就报磁盘满，模拟一批写到中途失败"""
+
+    def __init__(self, f):
+        self._f = f
+
+    def write(self, data):
+        self._f.write(data[:len(data) // 2])
+        self._f.flush()
+        raise OSError(28, "No space left on device")
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+
+def _wait_for(path, text, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                if f.read() == text:
+                    return True
+        except FileNotFoundError:
+            pass
+        time.sleep(0.02)
+    return False
+
+
+def test_partial_write_is_rewritten_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(transcript_writer, "RETRY_MIN_SECONDS", 0.05)
+    path = str(tmp_path / "x_log_1.txt")
+    errors = []
+    writer = transcript_writer.TranscriptWriter(path, flush_lines=2, flush_interval=0.05, on_error=errors.append)
+    writer.write("第一行")
+    writer.write("第二行")
+    assert _wait_for(path, "第一行\n第二行\n")
+
+    writer._file = _TornFile(writer._file)
+    writer.write("第三行比较长一些")
+    writer.write("第四行")
+    deadline = time.time() + 5
+    while len(errors) < 2 and time.time() < deadline:
+        time.sleep(0.02)
+    writer.close()
+
+    with open(path, "r", encoding="utf-8") as f:
+        assert f.read() == "第一行\n第二行\n第三行比较长一些\n第四行\n"
+    assert writer.paths == [path]
+    assert writer.error is None
+    assert len(errors) == 2     # 出错一次、恢复一次
+
+
+def test_give_up_on_stop_leaves_no_torn_line(tmp_path, monkeypatch):
+    path = str(tmp_path / "x_log_1.txt")
+    writer = transcript_writer.TranscriptWriter(path, flush_lines=1, flush_interval=0.05, on_error=lambda msg: None)
+    writer.write("第一行")
+    assert _wait_for(path, "第一行\n")
+
+    def no_append(file, mode="r", *args, **kwargs):
+        # 磁盘一直是满的：重新打开追加失败 (截断用的 r+b 照常)
+        if "a" in mode:
+            raise OSError(28, "No space left on device")
+        return open(file, mode, *args, **kwargs)
+
+    monkeypatch.setattr(transcript_writer, "open", no_append, raising=False)
+    writer._file = _TornFile(writer._file)
+    writer.write("第二行")
+    deadline = time.time() + 5
+    while writer.error is None and time.time() < deadline:
+        time.sleep(0.02)
+    writer.close()
+
+    with open(path, "r", encoding="utf-8") as f:
+        assert f.read() == "第一行\n"
+    assert writer.dropped == 1
+    assert writer.paths == [path]
@@ -0,0 +1,64 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import segment_record
+import transcript_archive
+import vector_search
+
+LINES = [
+    "今天先打两把排位", "这个英雄我不太会玩", "打野又来抓我了",
+    "感谢老板送的火箭", "谢谢大家的礼物", "我们的排班真的太离谱了",
+    "老板说下周要加班", "周末还要值班", "排班表又改了",
+]
+
+
+def _records(session="s1"):
+    # 每 10 秒一句，30 秒一个窗口 -> 三个窗口
+    return [
+        segment_record.SegmentRecord.from_dict({
+            "session": session, "room": "1", "stream_offset": i * 10.0,
+            "wall_time": 1000 + i * 10.0, "text": text,
+        })
+        for i, text in enumerate(LINES)
+    ]
+
+
+@pytest.fixture
+def archive(tmp_path):
+    conn = transcript_archive.connect(str(tmp_path / "a.db"))
+    yield conn
+    conn.close()
+
+
+def test_windows_and_search(archive, tmp_path):
+    with archive:
+        transcript_archive.insert_records(archive, _records())
+    provider = vector_search.HashEmbeddings()
+    index = vector_search.VectorIndex(str(tmp_path / "vec"))
+    assert index.update(archive, provider) == 3
+    assert index.update(archive, provider) == 0
+
+    hits = vector_search.semantic_search(archive, index, provider, "排班表改了", top_k=1)
+    assert hits[0]["start"] == 60.0
+    assert [line[2] for line in hits[0]["lines"]] == LINES[6:]
+    assert vector_search.semantic_search(archive, index, provider, "排班", room="2") == []
+
+
+def test_reingested_session_replaces_stale_windows(archive, tmp_path):
+    with archive:
+        transcript_archive.insert_records(archive, _records())
+    provider = vector_search.HashEmbeddings()
+    index = vector_search.VectorIndex(str(tmp_path / "vec"))
+    index.update(archive, provider)
+
+    log = tmp_path / "ava_1_log_1000.jsonl"
+    log.write_text("".join(r.to_json() + "\n" for r in _records()), encoding="utf-8")
+    transcript_archive.ingest_file(archive, str(log))
+    assert index.update(archive, provider) == 3
+    assert len(index.state["dead"]) == 3
+
+    hits = vector_search.semantic_search(archive, index, provider, "排班表改了", top_k=10)
+    assert len(hits) == 3
+    # 每个命中都能对回现存的转写行
+    assert all(len(h["lines"]) == 3 for h in hits)
@@ -0,0 +1,558 @@
+import os
+import re
+import glob
+import json
+import time
+import queue
+import sqlite3
+import argparse
+import threading
+import datetime
+
+import segment_record
+import pinyin_index
+
+# ================= 配置区 =================
+# 归档数据库路径，可用环境变量 BILI_ARCHIVE_DB 指定共享位置
+ARCHIVE_DB = os.environ.get("BILI_ARCHIVE_DB", "transcripts.db")
+# 实时入库攒批：到条数或时间就提交一次事务
+LIVE_BATCH_ROWS = 50
+LIVE_BATCH_INTERVAL = 2.0
+# 二字词索引每批处理的行数
+BIGRAM_BATCH_ROWS = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session     TEXT PRIMARY KEY,
+    room        TEXT,
+    streamer    TEXT,
+    started_at  REAL,
+    record_file TEXT,
+    manifest    TEXT
+);
+CREATE TABLE IF NOT EXISTS segments (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,   -- 行号永不复用：拼音 / 向量索引按行号增量推进
+    session       TEXT NOT NULL,
+    room          TEXT,
+    stream_offset REAL,
+    wall_time     REAL,
+    duration      REAL,
+    text          TEXT NOT NULL,
+    source        TEXT            -- 导入来源文件，实时入库的为 NULL
+);
+CREATE INDEX IF NOT EXISTS idx_segments_room_time ON segments(room, wall_time);
+CREATE INDEX IF NOT EXISTS idx_segments_session ON segments(session, stream_offset);
+CREATE INDEX IF NOT EXISTS idx_segments_source ON segments(source);
+CREATE TABLE IF NOT EXISTS ingested_files (
+    path  TEXT PRIMARY KEY,
+    size  INTEGER,
+    mtime REAL
+);
+"""
+
+# 外部内容表 + 触发器：FTS 只存倒排索引，正文只在 segments 里存一份
+FTS_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS segments_ai AFTER INSERT ON segments BEGIN
+    INSERT INTO segments_fts(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS segments_ad AFTER DELETE ON segments BEGIN
+    INSERT INTO segments_fts(segments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+
+# trigram 只能检索 3 字以上的词，而中文检索词大多是 2 个字：另建一份二字词索引，
+# 每条转写存成空格分隔的相邻两字 ("今天 天我 我们 ...")，detail=none 只存倒排不存位置，体积小
+BIGRAM_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS segments_bigram USING fts5(grams, tokenize='unicode61', detail='none');
+CREATE TRIGGER IF NOT EXISTS segments_bigram_ad AFTER DELETE ON segments BEGIN
+    DELETE FROM segments_bigram WHERE rowid = old.id;
+END;
+"""
+
+_WORD_RUN_RE = re.compile(r"[^\W_]+")
+_BIGRAM_TERM_RE = re.compile(r"[^\W_]{2}")
+
+
+# ================= 数据库 =================
+
+def _migrate_autoincrement(conn):
+    """
+    旧库的 segments.id 没有 AUTOINCREMENT：ingest_file 删掉实时入库的行后，新行会复用它们的行号，
+    按行号增量推进的副索引就永远不会补上这些行。这里把表原样重建成 AUTOINCREMENT (行号保留)，
+    并清空拼音 / 二字词索引的进度，让它们从头补齐。
+    """
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'segments'").fetchone()
+    if not row or "AUTOINCREMENT" in row[0].upper():
+        return
+    print("🔧 [归档] 升级 segments 表 (行号不再复用)，拼音 / 二字词索引将重建；语义索引请执行 python vector_search.py rebuild")
+    conn.executescript(
+        "BEGIN;"
+        "DROP TRIGGER IF EXISTS segments_ai; DROP TRIGGER IF EXISTS segments_ad; DROP TRIGGER IF EXISTS segments_pinyin_ad;"
+        "DROP TRIGGER IF EXISTS segments_bigram_ad;"
+        "DROP INDEX IF EXISTS idx_segments_room_time; DROP INDEX IF EXISTS idx_segments_session;"
+        "DROP INDEX IF EXISTS idx_segments_source;"
+        "ALTER TABLE segments RENAME TO segments_old;"
+        + SCHEMA +
+        "INSERT INTO segments(id, session, room, stream_offset, wall_time, duration, text, source) "
+        "SELECT id, session, room, stream_offset, wall_time, duration, text, source FROM segments_old;"
+        "DROP TABLE segments_old;"
+        "DELETE FROM segments_pinyin;"
+        "DELETE FROM segments_bigram;"
+        "DELETE FROM index_state;"
+        "COMMIT;"
+    )
+
+
+def connect(db_path=ARCHIVE_DB):
+    """打开 (必要时初始化) 归档库。中文没有空格分词，FTS5 用 trigram 分词器做子串检索"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")     # 实时写入时不阻塞查询
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    pinyin_index.ensure_schema(conn)
+    conn.executescript(BIGRAM_SCHEMA)
+    _migrate_autoincrement(conn)
+    try:
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5("
+            "text, content='segments', content_rowid='id', tokenize='trigram')"
+        )
+    except sqlite3.OperationalError as e:
+        raise RuntimeError(f"当前 SQLite ({sqlite3.sqlite_version}) 不支持 FTS5 trigram 分词，需要 3.34 以上: {e}")
+    conn.executescript(FTS_TRIGGERS)
+    pinyin_index.ensure_schema(conn)     # 迁移时删掉的触发器在这里补回
+    conn.executescript(BIGRAM_SCHEMA)
+    return conn
+
+
+def bigrams(text):
+    """按连续的字 / 字母数字切开 (标点、空白处断开)，每段取相邻两字"""
+    grams = []
+    for run in _WORD_RUN_RE.findall(text.lower()):
+        grams.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return " ".join(grams)
+
+
+def index_bigrams(conn, batch_rows=BIGRAM_BATCH_ROWS):
+    """把上次之后新增的 segments 写入二字词索引 (与拼音索引一样按行号推进)，返回处理的行数"""
+    row = conn.execute("SELECT last_id FROM index_state WHERE name = 'bigram'").fetchone()
+    last_id = row[0] if row else 0
+    total = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, text FROM segments WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_rows)
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        with conn:
+            conn.executemany("INSERT INTO segments_bigram(rowid, grams) VALUES (?, ?)",
+                             [(seg_id, bigrams(text)) for seg_id, text in rows])
+            conn.execute(
+                "INSERT INTO index_state(name, last_id) VALUES ('bigram', ?) "
+                "ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id",
+                (last_id,),
+            )
+        total += len(rows)
+    return total
+
+
+def index_side_tables(conn):
+    """补齐二字词与拼音副索引"""
+    index_bigrams(conn)
+    return pinyin_index.index_new(conn)
+
+
+def upsert_session(conn, session, room=None, streamer=None, started_at=None, record_file=None, manifest=None):
+    conn.execute(
+        "INSERT INTO sessions(session, room, streamer, started_at, record_file, manifest) "
+        "VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(session) DO UPDATE SET "
+        "room=coalesce(excluded.room, room), streamer=coalesce(excluded.streamer, streamer), "
+        "started_at=coalesce(excluded.started_at, started_at), record_file=coalesce(excluded.record_file, record_file), "
+        "manifest=coalesce(excluded.manifest, manifest)",
+        (session, room, streamer, started_at, record_file, manifest),
+    )
+
+
+def session_from_manifest(conn, manifest_path):
+    """用会话清单登记 / 刷新会话信息，返回会话 id"""
+    data = segment_record.read_manifest(manifest_path)
+    upsert_session(
+        conn, data["session"], room=str(data.get("room")), streamer=data.get("streamer"),
+        started_at=data.get("started_at"), record_file=data.get("record_file"),
+        manifest=os.path.abspath(manifest_path),
+    )
+    return data["session"]
+
+
+def insert_records(conn, records, source=None):
+    rows = [
+        (r.session, str(r.room), r.stream_offset, r.wall_time, r.duration, r.text, source)
+        for r in records if r.text
+    ]
+    conn.executemany(
+        "INSERT INTO segments(session, room, stream_offset, wall_time, duration, text, source) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    return len(rows)
+
+
+# ================= 批量导入 =================
+
+def _expand(paths):
+    """目录展开成其中的日志 / 记录文件；同一会话有 .jsonl 时忽略对应的 .txt"""
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            for pattern in ("*_log_*.txt", "*_log_*.jsonl"):
+                files.extend(glob.glob(os.path.join(p, pattern)))
+        else:
+            files.extend(glob.glob(p) or [p])
+    jsonl = {os.path.splitext(f)[0] for f in files if f.endswith(".jsonl")}
+    return sorted(f for f in files if not (f.endswith(".txt") and os.path.splitext(f)[0] in jsonl))
+
+
+def _manifest_for(path):
+    """找到日志 / 记录文件所属会话的清单 (切分出来的 _partNNN 文件共用一个清单)"""
+    root = os.path.splitext(path)[0]
+    if "_part" in root:
+        root = root[:root.rindex("_part")]
+    manifest = root + ".manifest.json"
+    return manifest if os.path.exists(manifest) else None
+
+
+def ingest_file(conn, path):
+    """导入单个文件，已导入且未变化的文件直接跳过，返回导入条数 (跳过时返回 None)"""
+    st = os.stat(path)
+    key = os.path.abspath(path)
+    row = conn.execute("SELECT size, mtime FROM ingested_files WHERE path = ?", (key,)).fetchone()
+    if row and row[0] == st.st_size and row[1] == st.st_mtime:
+        return None
+
+    with conn:
+        # 文件有追加 (例如直播还没结束时导入过)，整个文件重新导入
+        conn.execute("DELETE FROM segments WHERE source = ?", (key,))
+        manifest = _manifest_for(path)
+        if path.endswith(".jsonl"):
+            records = list(segment_record.read_jsonl(path))
+        else:
+            records = list(segment_record.records_from_log(path))
+        session = records[0].session if records else None
+        if manifest:
+            session = session_from_manifest(conn, manifest)
+        elif session:
+            meta = segment_record.parse_log_name(path)
+            if meta:
+                upsert_session(conn, session, room=meta[1], streamer=meta[0], started_at=meta[2])
+        if session:
+            # 文件是完整记录，替换掉同一会话实时入库的行，避免重复
+            conn.execute("DELETE FROM segments WHERE session = ? AND source IS NULL", (session,))
+        count = insert_records(conn, records, source=key)
+        conn.execute(
+            "INSERT OR REPLACE INTO ingested_files(path, size, mtime) VALUES (?, ?, ?)",
+            (key, st.st_size, st.st_mtime),
+        )
+    return count
+
+
+def ingest(paths, db_path=ARCHIVE_DB):
+    conn = connect(db_path)
+    total = 0
+    for path in _expand(paths):
+        try:
+            count = ingest_file(conn, path)
+        except Exception as e:
+            print(f"❌ [归档] 导入失败 {path}: {e}")
+            continue
+        if count is None:
+            print(f"⏭ [归档] 未变化，跳过: {path}")
+        else:
+            total += count
+            print(f"✅ [归档] {path}: {count} 条")
+    indexed = index_side_tables(conn)
+    if indexed:
+        print(f"🔤 [归档] 拼音索引新增 {indexed} 条")
+    conn.close()
+    return total
+
+
+# ================= 检索 =================
+
+def _fts_query(text):
+    """把用户输入转成 FTS5 短语查询：按空格拆成多个短语 (AND)，双引号转义"""
+    terms = [t for t in text.split() if t]
+    return " ".join('"' + t.replace('"', '""') + '"' for t in terms)
+
+
+def session_record_file(conn, session):
+    """会话对应的录像文件。录像可能在会话结束后才转封装改名，优先读清单里的最新文件名"""
+    row = conn.execute("SELECT record_file, manifest FROM sessions WHERE session = ?", (session,)).fetchone()
+    if not row:
+        return None
+    record_file, manifest = row
+    if manifest and os.path.exists(manifest):
+        try:
+            return segment_record.read_manifest(manifest).get("record_file") or record_file
+        except (OSError, ValueError):
+            pass
+    return record_file
+
+
+def _hit(conn, sessions, room, session, wall_time, offset, text, snippet, distance=0):
+    if session not in sessions:
+        sessions[session] = session_record_file(conn, session)
+    return {
+        "room": room,
+        "session": session,
+        "wall_time": wall_time,
+        "stream_offset": offset,
+        "text": text,
+        "snippet": snippet,
+        "distance": distance,
+        "record_file": sessions[session],
+    }
+
+
+def search(conn, text, room=None, since=None, until=None, limit=50, phonetic=False, max_distance=1):
+    """
+    全文检索，返回按时间倒序的命中列表：
+    每条含 room / session / wall_time / stream_offset / text / snippet / distance / record_file
+    3 字以上的词走 trigram 索引，2 个字的词走二字词索引；只有单字 (或含标点的两字) 才退化为 LIKE 扫描
+    phonetic=True 时走拼音副索引，同音 / 近音错字也能命中，按读音距离排序
+    """
+    if phonetic:
+        sessions = {}
+        return [
+            _hit(conn, sessions, *row)
+            for row in pinyin_index.search(conn, text, max_distance, room=room, since=since, until=until, limit=limit)
+        ]
+
+    terms = [t for t in text.split() if t]
+    if not terms:
+        return []
+    where, params = [], []
+    if room:
+        where.append("s.room = ?")
+        params.append(str(room))
+    if since:
+        where.append("s.wall_time >= ?")
+        params.append(since)
+    if until:
+        where.append("s.wall_time < ?")
+        params.append(until)
+
+    if all(len(t) >= 3 for t in terms):
+        sql = (
+            "SELECT s.room, s.session, s.wall_time, s.stream_offset, s.text, "
+            "snippet(segments_fts, 0, '【', '】', '…', 16) "
+            "FROM segments_fts JOIN segments s ON s.id = segments_fts.rowid "
+            "WHERE segments_fts MATCH ?"
+        )
+        params.insert(0, _fts_query(text))
+    else:
+        # 长词和二字词各用自己的索引取出行号集合，按行号回表；单字最后才做 LIKE
+        sql = "SELECT s.room, s.session, s.wall_time, s.stream_offset, s.text, s.text FROM segments s WHERE 1"
+        head, head_params = [], []
+        long_terms = [t for t in terms if len(t) >= 3]
+        pair_terms = [t.lower() for t in terms if len(t) == 2 and _BIGRAM_TERM_RE.fullmatch(t)]
+        if long_terms:
+            head.append("s.id IN (SELECT rowid FROM segments_fts WHERE segments_fts MATCH ?)")
+            head_params.append(_fts_query(" ".join(long_terms)))
+        if pair_terms:
+            head.append("s.id IN (SELECT rowid FROM segments_bigram WHERE segments_bigram MATCH ?)")
+            head_params.append(" AND ".join(f'"{t}"' for t in pair_terms))
+        for t in terms:
+            if len(t) < 3 and t.lower() not in pair_terms:
+                head.append("s.text LIKE ? ESCAPE '\\'")
+                head_params.append("%" + t.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if long_terms or pair_terms:
+            # 房间 / 时间条件加一元 +，不让优化器改走 (room, wall_time) 索引去扫整个房间
+            where = [clause.replace("s.room", "+s.room").replace("s.wall_time", "+s.wall_time") for clause in where]
+        where = head + where
+        params = head_params + params
+    for clause in where:
+        sql += " AND " + clause
+    sql += " ORDER BY s.wall_time DESC LIMIT ?"
+    params.append(limit)
+
+    sessions = {}
+    hits = [_hit(conn, sessions, *row) for row in conn.execute(sql, params)]
+    if not all(len(t) >= 3 for t in terms):
+        for h in hits:
+            h["snippet"] = _mark(h["text"], terms)
+    return hits
+
+
+def _mark(text, terms):
+    """在原文里标出每个词第一次出现的位置 (不区分大小写)"""
+    lower = text.lower()
+    spans = []
+    for t in terms:
+        i = lower.find(t.lower())
+        if i >= 0:
+            spans.append((i, i + len(t)))
+    out, pos = [], 0
+    for start, end in sorted(spans):
+        if start < pos:
+            continue
+        out.append(text[pos:start] + "【" + text[start:end] + "】")
+        pos = end
+    return "".join(out) + text[pos:]
+
+
+def optimize(db_path=ARCHIVE_DB):
+    """合并 FTS 段 (大量导入后执行一次，查询更快)"""
+    conn = connect(db_path)
+    with conn:
+        conn.execute("INSERT INTO segments_fts(segments_fts) VALUES ('optimize')")
+        conn.execute("INSERT INTO segments_pinyin(segments_pinyin) VALUES ('optimize')")
+        conn.execute("INSERT INTO segments_bigram(segments_bigram) VALUES ('optimize')")
+    conn.execute("VACUUM")
+    conn.close()
+
+
+# ================= 实时入库 =================
+
+class LiveArchiver:
+    """
+    转写线程实时追加：只往队列里丢记录，后台线程独占一个连接攒批提交，
+    不阻塞推理，也不和查询抢锁 (WAL 模式下读写互不阻塞)。
+    """
+
+    def __init__(self, db_path=ARCHIVE_DB, batch_rows=LIVE_BATCH_ROWS, batch_interval=LIVE_BATCH_INTERVAL):
+        self.db_path = db_path
+        self.batch_rows = batch_rows
+        self.batch_interval = batch_interval
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add_session(self, manifest_path):
+        self._queue.put(("session", manifest_path))
+
+    def add(self, record):
+        self._queue.put(("record", record))
+
+    def close(self, timeout=10):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _commit(self, conn, batch):
+        if not batch:
+            return
+        with conn:
+            records = []
+            for kind, item in batch:
+                if kind == "session":
+                    session_from_manifest(conn, item)
+                else:
+                    records.append(item)
+            insert_records(conn, records)
+        index_side_tables(conn)
+
+    def _run(self):
+        try:
+            conn = connect(self.db_path)
+        except Exception as e:
+            print(f"❌ [归档] 无法打开数据库 {self.db_path}: {e}")
+            return
+        batch = []
+        deadline = time.time() + self.batch_interval
+        while True:
+            try:
+                batch.append(self._queue.get(timeout=max(0.0, deadline - time.time())))
+            except queue.Empty:
+                pass
+            stopping = self._stop.is_set()
+            if stopping:
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+            if stopping or len(batch) >= self.batch_rows or time.time() >= deadline:
+                try:
+                    self._commit(conn, batch)
+                except Exception as e:
+                    print(f"❌ [归档] 写入失败 ({len(batch)} 条): {e}")
+                batch = []
+                deadline = time.time() + self.batch_interval
+            if stopping:
+                break
+        conn.close()
+
+
+# ================= 命令行 =================
+
+def _parse_date(s):
+    return datetime.datetime.strptime(s, "%Y-%m-%d").timestamp() if s else None
+
+
+def format_offset(seconds):
+    seconds = int(seconds or 0)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="转写归档：SQLite FTS5 全文检索")
+    parser.add_argument("--db", default=ARCHIVE_DB, help="归档数据库路径")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_ingest = sub.add_parser("ingest", help="导入日志 / 记录文件 (可传目录，已导入的文件自动跳过)")
+    p_ingest.add_argument("paths", nargs="+")
+    p_search = sub.add_parser("search", help="检索")
+    p_search.add_argument("query")
+    p_search.add_argument("--room", default=None)
+    p_search.add_argument("--since", default=None, help="起始日期 YYYY-MM-DD")
+    p_search.add_argument("--until", default=None, help="结束日期 YYYY-MM-DD (不含)")
+    p_search.add_argument("--limit", type=int, default=50)
+    p_search.add_argument("--json", action="store_true", help="以 JSON 行输出")
+    p_search.add_argument("--pinyin", action="store_true", help="按读音检索 (同音 / 近音错字也能命中)")
+    p_search.add_argument("--distance", type=int, default=1, help="拼音检索允许的音节编辑距离")
+    sub.add_parser("optimize", help="合并索引段并整理数据库")
+    sub.add_parser("reindex-pinyin", help="重建拼音索引")
+    sub.add_parser("stats", help="统计")
+    args = parser.parse_args()
+
+    if args.cmd == "ingest":
+        t0 = time.time()
+        total = ingest(args.paths, args.db)
+        print(f"📦 [归档] 共导入 {total} 条，用时 {time.time() - t0:.1f}s")
+    elif args.cmd == "search":
+        conn = connect(args.db)
+        t0 = time.time()
+        hits = search(conn, args.query, room=args.room, since=_parse_date(args.since),
+                      until=_parse_date(args.until), limit=args.limit,
+                      phonetic=args.pinyin, max_distance=args.distance)
+        cost = time.time() - t0
+        for h in hits:
+            if args.json:
+                print(json.dumps(h, ensure_ascii=False))
+                continue
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(h["wall_time"] or 0))
+            print(f"[{when}] 房间 {h['room']} | {h['record_file'] or '-'} @ {format_offset(h['stream_offset'])} | {h['snippet']}"
+                  + (f" (拼音距离 {h['distance']})" if args.pinyin else ""))
+        if not args.json:
+            print(f"🔎 {len(hits)} 条命中，用时 {cost * 1000:.0f}ms")
+        conn.close()
+    elif args.cmd == "optimize":
+        optimize(args.db)
+        print("✅ [归档] 索引已优化")
+    elif args.cmd == "reindex-pinyin":
+        conn = connect(args.db)
+        print(f"✅ [归档] 拼音索引已重建 ({pinyin_index.rebuild(conn)} 条)")
+        conn.close()
+    elif args.cmd == "stats":
+        conn = connect(args.db)
+        n_seg = conn.execute("SELECT count(*) FROM segments").fetchone()[0]
+        n_ses = conn.execute("SELECT count(*) FROM sessions").fetchone()[0]
+        n_room = conn.execute("SELECT count(DISTINCT room) FROM segments").fetchone()[0]
+        size = os.path.getsize(args.db) / 1024 / 1024
+        print(f"📊 {n_room} 个房间 | {n_ses} 场 | {n_seg} 条 | 数据库 {size:.1f} MB")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
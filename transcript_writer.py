@@ -0,0 +1,183 @@
+import os
+import time
+import queue
+import threading
+
+# ================= 配置区 =================
+RETRY_MIN_SECONDS = 1.0       # 写盘失败 (磁盘满、没权限) 后的重试间隔，指数退避
+RETRY_MAX_SECONDS = 30.0
+MAX_PENDING_LINES = 200000    # 一直写不进去时最多在内存里攒这么多行，超出丢最旧的并计数
+
+
+class TranscriptWriter:
+    """
+    后台日志写入线程：文件常开、攒批写入，按行数或时间到点刷盘，转写线程只管往队列里丢。
+    - 每批先 write + flush (可选 fsync) 再处理下一批，崩溃最多丢失最后一个刷盘周期的内容
+    - 支持按大小 / 时长切分文件，长直播不会产生一个巨大的日志
+    - 写盘失败时不丢批、不退出线程：通过 on_error 报告，按退避间隔重试，恢复后再报告一次
+    """
+
+    def __init__(self, path, flush_lines=20, flush_interval=1.0, fsync=False,
+                 rotate_bytes=0, rotate_seconds=0, on_rotate=None, on_error=None):
+        self.base_path = path
+        self.flush_lines = flush_lines
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.on_rotate = on_rotate          # 切分后回调新文件路径 (例如通知 UI)
+        self.on_error = on_error            # 写盘出错 / 恢复时回调一条提示 (例如 ui_queue.put)
+        self.error = None                   # 当前未恢复的写盘错误
+        self.dropped = 0                    # 因长时间写不进去而丢弃的行数
+
+        self.paths = []
+        self.current_path = None
+        self._file = None
+        self._opened_at = 0.0
+        self._part = 0
+        self._torn_at = None                # 上一批写到一半失败时，这批开始前的文件位置
+
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # ---------- 调用方接口 ----------
+
+    def write(self, line):
+        """非阻塞，只入队"""
+        self._queue.put(line if line.endswith("\n") else line + "\n")
+
+    def close(self, timeout=10):
+        """把队列里剩余的行全部落盘后关闭文件 (仍然写不进去时放弃剩余的行并报告)"""
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _notify(self, msg):
+        print(msg)
+        if self.on_error:
+            self.on_error(msg)
+
+    # ---------- 写入线程 ----------
+
+    def _part_path(self):
+        if self._part == 0:
+            return self.base_path
+        root, ext = os.path.splitext(self.base_path)
+        return f"{root}_part{self._part + 1:03d}{ext}"
+
+    def _open(self):
+        self.current_path = self._part_path()
+        self._file = open(self.current_path, "a", encoding="utf-8")
+        # 出错后重新打开同一个文件：仍算同一个分片，不重新计时、不重复登记
+        if self.current_path not in self.paths:
+            self._opened_at = time.time()
+            self.paths.append(self.current_path)
+
+    def _maybe_rotate(self):
+        size_hit = self.rotate_bytes and self._file.tell() >= self.rotate_bytes
+        time_hit = self.rotate_seconds and time.time() - self._opened_at >= self.rotate_seconds
+        if not (size_hit or time_hit):
+            return
+        self._file.close()
+        self._part += 1
+        self._open()
+        if self.on_rotate:
+            self.on_rotate(self.current_path)
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        # 写之前检查是否该切分，避免停止时多出一个空文件
+        if self._file is None:
+            self._open()
+            if self._torn_at is not None:
+                # 上次这一批写到一半失败 (例如磁盘满)：先截掉写了一半的内容，再整批重写，不重复、不留半行
+                self._file.truncate(self._torn_at)
+                self._torn_at = None
+        else:
+            self._maybe_rotate()
+        pos = self._file.tell()     # 每批都写完并 flush，缓冲区是空的，tell() 就是文件长度
+        try:
+            self._file.write("".join(batch))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        except (OSError, ValueError):
+            self._torn_at = pos
+            raise
+
+    def _try_flush(self, batch):
+        """
+        写一批，成功返回 True；失败时关掉文件句柄 (下次重新打开、截回这批开始前的位置)、报告一次并返回 False。
+        出错的文件仍留在 paths 里：之前写进去的内容还在。
+        """
+        try:
+            self._flush(batch)
+        except (OSError, ValueError) as e:
+            if self._file is not None:
+                try:
+                    self._file.close()
+                except (OSError, ValueError):
+                    pass
+                self._file = None
+            if self.error is None:
+                self._notify(f"⚠️ [日志] 写入 {self.current_path or self.base_path} 失败，稍后重试 (积压 {len(batch)} 行): {e}")
+            self.error = e
+            return False
+        if self.error is not None:
+            self.error = None
+            lost = f"，期间丢弃最旧的 {self.dropped} 行" if self.dropped else ""
+            self._notify(f"✅ [日志] 已恢复写入: {self.current_path}{lost}")
+        return True
+
+    def _discard_torn(self):
+        """放弃重写时，尽量把写了一半的内容截掉，日志里不留半行"""
+        if self._torn_at is None:
+            return
+        try:
+            with open(self.current_path, "r+b") as f:
+                f.truncate(self._torn_at)
+            self._torn_at = None
+        except OSError:
+            pass
+
+    def _run(self):
+        batch = []
+        deadline = time.time() + self.flush_interval
+        retry = RETRY_MIN_SECONDS
+        while True:
+            try:
+                batch.append(self._queue.get(timeout=max(0.0, deadline - time.time())))
+            except queue.Empty:
+                pass
+
+            if self._stop.is_set():
+                # 停止时把队列清空再退出
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not self._try_flush(batch):
+                    self._discard_torn()
+                    self.dropped += len(batch)
+                    self._notify(f"❌ [日志] 停止时仍无法写入，共丢弃 {self.dropped} 行: {self.base_path}")
+                break
+
+            if len(batch) > MAX_PENDING_LINES:
+                over = len(batch) - MAX_PENDING_LINES
+                del batch[:over]
+                self.dropped += over
+            # 出错期间只在重试时间到了才再试，不每来一行就撞一次
+            if (self.error is None and len(batch) >= self.flush_lines) or time.time() >= deadline:
+                if self._try_flush(batch):
+                    batch = []
+                    retry = RETRY_MIN_SECONDS
+                    deadline = time.time() + self.flush_interval
+                else:
+                    deadline = time.time() + retry
+                    retry = min(retry * 2, RETRY_MAX_SECONDS)
+
+        if self._file is not None:
+            self._file.close()
@@ -0,0 +1,362 @@
+import os
+import json
+import time
+import zlib
+import argparse
+import urllib.request
+
+import numpy as np
+
+import transcript_archive
+
+# ================= 配置区 =================
+# 向量索引目录，可用环境变量 BILI_VECTOR_DIR 指定
+VECTOR_DIR = os.environ.get("BILI_VECTOR_DIR", "vector_index")
+# 每个检索窗口覆盖的时长 (秒)：单句太短没有语义，整场太长定位不准
+WINDOW_SECONDS = 30
+# 本地 OpenAI 兼容的 embeddings 接口 (llama.cpp / vLLM / Ollama 等)
+EMBED_URL = os.environ.get("BILI_EMBED_URL", "http://127.0.0.1:8080/v1/embeddings")
+EMBED_MODEL = os.environ.get("BILI_EMBED_MODEL", "bge-m3")
+EMBED_BATCH = 32
+# 暴力检索时每次读入内存的行数，内存占用 = SCAN_ROWS * 维度 * 4 字节
+SCAN_ROWS = 65536
+
+
+# ================= 向量提供方 =================
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class OpenAIEmbeddings:
+    """调用 OpenAI 兼容的 /v1/embeddings 接口"""
+
+    def __init__(self, url=EMBED_URL, model=EMBED_MODEL, api_key=None, batch_size=EMBED_BATCH, timeout=60):
+        self.url = url
+        self.model = model
+        self.api_key = api_key or os.environ.get("BILI_EMBED_API_KEY")
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.name = f"openai:{model}"
+
+    def _request(self, texts):
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        body = json.dumps({"model": self.model, "input": texts}).encode("utf-8")
+        req = urllib.request.Request(self.url, data=body, headers=headers)
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            data = json.loads(resp.read().decode("utf-8"))["data"]
+        return [d["embedding"] for d in sorted(data, key=lambda d: d["index"])]
+
+    def embed(self, texts):
+        out = []
+        for i in range(0, len(texts), self.batch_size):
+            out.extend(self._request(texts[i:i + self.batch_size]))
+        return _normalize(out)
+
+
+class HashEmbeddings:
+    """
+    确定性的替身：字符 1-gram / 2-gram 哈希到固定维度 (带符号)，不需要模型和网络。
+    只能检索字面相近的内容，用于测试和没有 embeddings 服务的环境。
+    """
+
+    def __init__(self, dim=256):
+        self.dim = dim
+        self.name = f"hash:{dim}"
+
+    def embed(self, texts):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            text = "".join(text.split())
+            for n in (1, 2):
+                for i in range(len(text) - n + 1):
+                    h = zlib.crc32(text[i:i + n].encode("utf-8"))
+                    out[row, h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        return _normalize(out)
+
+
+def get_provider(name):
+    """hash / hash:512 / openai / openai:模型名"""
+    kind, _, arg = name.partition(":")
+    if kind == "hash":
+        return HashEmbeddings(int(arg) if arg else 256)
+    if kind == "openai":
+        return OpenAIEmbeddings(model=arg or EMBED_MODEL)
+    raise ValueError(f"未知的向量提供方: {name}")
+
+
+# ================= 切窗 =================
+
+def _windows(rows, window_seconds):
+    """
+    把同一会话按 stream_offset 排好序的行切成时间窗。
+    rows: [(id, room, stream_offset, wall_time, text), ...]，返回 (已封口的窗口列表, 最后一个未封口窗口的行)
+    """
+    windows, current = [], []
+    for row in rows:
+        if current and row[2] - current[0][2] >= window_seconds:
+            windows.append(current)
+            current = []
+        current.append(row)
+    return windows, current
+
+
+# ================= 索引 =================
+
+class VectorIndex:
+    """
+    磁盘上的向量索引：
+    - vectors.f32：float32 行向量顺序追加，查询时 np.memmap 分块读，不整体载入内存
+    - meta.jsonl：与向量逐行对应的窗口信息 (会话、录像内偏移、原文、对应的 segments 行号区间)
+    - state.json：维度、提供方、增量进度 (已处理到的 segments 行号、各会话未封口的尾窗)、作废窗口的行号
+    会话被重新导入时 (ingest_file 删掉实时入库的行再整份插入) 旧窗口指向的行已不存在，标记作废，检索时跳过；
+    新插入的行号一定更大 (segments.id 为 AUTOINCREMENT)，会按正常增量重新切窗。
+    """
+
+    def __init__(self, directory=VECTOR_DIR):
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.meta_path = os.path.join(directory, "meta.jsonl")
+        self.state_path = os.path.join(directory, "state.json")
+        os.makedirs(directory, exist_ok=True)
+        self.state = {"dim": None, "provider": None, "last_id": 0, "open": {}, "dead": []}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                self.state.update(json.load(f))
+        self._meta = None
+
+    def _save_state(self):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp, self.state_path)
+
+    def count(self):
+        if not self.state["dim"] or not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (4 * self.state["dim"])
+
+    def meta(self):
+        if self._meta is None:
+            self._meta = []
+            if os.path.exists(self.meta_path):
+                with open(self.meta_path, "r", encoding="utf-8") as f:
+                    self._meta = [json.loads(line) for line in f if line.strip()]
+        return self._meta
+
+    def append(self, vectors, metas):
+        """追加一批向量与元数据；先写元数据再写向量，行数以两者较小值为准，崩溃不会错位"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.state["dim"] is None:
+            self.state["dim"] = int(vectors.shape[1])
+        elif vectors.shape[1] != self.state["dim"]:
+            raise RuntimeError(f"向量维度 {vectors.shape[1]} 与索引 {self.state['dim']} 不一致，请 rebuild")
+        with open(self.meta_path, "a", encoding="utf-8") as f:
+            for m in metas:
+                f.write(json.dumps(m, ensure_ascii=False) + "\n")
+        with open(self.vectors_path, "ab") as f:
+            f.write(vectors.tobytes())
+        self._meta = None
+
+    def _drop_deleted(self, conn, sessions):
+        """这些会话有新行进来：检查它们已有的窗口和尾窗里的行是否还在，不在的窗口作废"""
+        meta = self.meta()
+        dead = set(self.state["dead"])
+        by_session = {}
+        for i, m in enumerate(meta):
+            if m["session"] in sessions and i not in dead:
+                by_session.setdefault(m["session"], []).append(i)
+        for session in sessions:
+            rows = by_session.get(session, [])
+            tail = self.state["open"].get(session)
+            if not rows and not tail:
+                continue
+            alive = {r[0] for r in conn.execute("SELECT id FROM segments WHERE session = ?", (session,))}
+            dead.update(i for i in rows if not alive.issuperset(meta[i]["ids"]))
+            if tail:
+                tail = [r for r in tail if r[0] in alive]
+                if tail:
+                    self.state["open"][session] = tail
+                else:
+                    del self.state["open"][session]
+        self.state["dead"] = sorted(dead)
+
+    def update(self, conn, provider, window_seconds=WINDOW_SECONDS, batch_rows=20000):
+        """
+        增量索引归档库里新增的转写：按会话切成时间窗，封口的窗口才写入；
+        每个会话最后一个窗口先挂起，等后续行到来或会话安静超过一个窗口时长再封口。
+        返回新写入的窗口数。
+        """
+        if self.state["provider"] not in (None, provider.name):
+            raise RuntimeError(f"索引由 {self.state['provider']} 生成，与当前 {provider.name} 不一致，请 rebuild")
+        self.state["provider"] = provider.name
+        added = 0
+        while True:
+            rows = conn.execute(
+                "SELECT id, session, room, stream_offset, wall_time, text FROM segments WHERE id > ? ORDER BY id LIMIT ?",
+                (self.state["last_id"], batch_rows),
+            ).fetchall()
+            by_session = {}
+            for sid, session, room, offset, wall, text in rows:
+                by_session.setdefault(session, []).append((sid, room, offset or 0.0, wall or 0.0, text))
+            if by_session:
+                self._drop_deleted(conn, set(by_session))
+            # 没有新行时也要检查挂起的尾窗是否已经安静够久
+            for session in self.state["open"]:
+                by_session.setdefault(session, [])
+
+            closed, still_open = [], {}
+            now = time.time()
+            for session, new_rows in by_session.items():
+                merged = [tuple(r) for r in self.state["open"].get(session, [])] + new_rows
+                merged.sort(key=lambda r: r[2])
+                windows, tail = _windows(merged, window_seconds)
+                if tail and now - tail[-1][3] > window_seconds * 2:
+                    windows.append(tail)
+                    tail = []
+                closed.extend((session, w) for w in windows)
+                if tail:
+                    still_open[session] = tail
+
+            if closed:
+                texts = [" ".join(r[4] for r in w) for _, w in closed]
+                vectors = provider.embed(texts)
+                metas = [
+                    {
+                        "session": session,
+                        "room": w[0][1],
+                        "start": w[0][2],
+                        "end": w[-1][2],
+                        "wall_time": w[0][3],
+                        "ids": [r[0] for r in w],
+                        "text": text,
+                    }
+                    for (session, w), text in zip(closed, texts)
+                ]
+                self.append(vectors, metas)
+                added += len(closed)
+
+            self.state["open"] = still_open
+            if rows:
+                self.state["last_id"] = rows[-1][0]
+            self._save_state()
+            if len(rows) < batch_rows:
+                break
+        return added
+
+    def search(self, query_vector, top_k=10, room=None):
+        """暴力内积检索 (向量已归一化即余弦相似度)，memmap 分块扫描，返回 [(分数, 元数据), ...]"""
+        meta = self.meta()
+        n = min(self.count(), len(meta))
+        if n == 0:
+            return []
+        dim = self.state["dim"]
+        mm = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n, dim))
+        q = np.asarray(query_vector, dtype=np.float32).reshape(dim)
+        mask = None
+        dead = set(self.state["dead"])
+        if room or dead:
+            mask = np.array([(not room or str(m["room"]) == str(room)) and i not in dead for i, m in enumerate(meta[:n])])
+
+        best_scores = np.empty(0, dtype=np.float32)
+        best_rows = np.empty(0, dtype=np.int64)
+        for start in range(0, n, SCAN_ROWS):
+            scores = np.asarray(mm[start:start + SCAN_ROWS] @ q)
+            if mask is not None:
+                scores = np.where(mask[start:start + SCAN_ROWS], scores, -np.inf)
+            best_scores = np.concatenate([best_scores, scores])
+            best_rows = np.concatenate([best_rows, np.arange(start, start + len(scores))])
+            if len(best_scores) > top_k:
+                keep = np.argpartition(-best_scores, top_k)[:top_k]
+                best_scores, best_rows = best_scores[keep], best_rows[keep]
+        order = np.argsort(-best_scores)
+        return [
+            (float(best_scores[i]), meta[int(best_rows[i])])
+            for i in order if np.isfinite(best_scores[i])
+        ]
+
+    def clear(self):
+        for path in (self.vectors_path, self.meta_path, self.state_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.state = {"dim": None, "provider": None, "last_id": 0, "open": {}, "dead": []}
+        self._meta = None
+
+
+def semantic_search(conn, index, provider, query, top_k=10, room=None):
+    """
+    语义检索，返回命中列表：每条含分数、会话、录像文件与录像内起止偏移，
+    以及窗口内的原始转写行 (可以对回日志)
+    """
+    hits = []
+    sessions = {}
+    for score, m in index.search(provider.embed([query])[0], top_k=top_k, room=room):
+        session = m["session"]
+        if session not in sessions:
+            sessions[session] = transcript_archive.session_record_file(conn, session)
+        marks = ",".join("?" * len(m["ids"]))
+        lines = conn.execute(
+            f"SELECT wall_time, stream_offset, text FROM segments WHERE id IN ({marks}) ORDER BY stream_offset",
+            m["ids"],
+        ).fetchall()
+        hits.append({
+            "score": score,
+            "room": m["room"],
+            "session": session,
+            "start": m["start"],
+            "end": m["end"],
+            "wall_time": m["wall_time"],
+            "record_file": sessions[session],
+            "lines": lines,
+        })
+    return hits
+
+
+# ================= 命令行 =================
+
+def main():
+    parser = argparse.ArgumentParser(description="转写归档的语义向量检索")
+    parser.add_argument("--db", default=transcript_archive.ARCHIVE_DB, help="归档数据库路径")
+    parser.add_argument("--dir", default=VECTOR_DIR, help="向量索引目录")
+    parser.add_argument("--provider", default="openai", help="openai[:模型] 或 hash[:维度] (离线替身)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_update = sub.add_parser("update", help="增量索引归档库里新增的转写")
+    p_update.add_argument("--window", type=float, default=WINDOW_SECONDS, help="窗口时长 (秒)")
+    p_rebuild = sub.add_parser("rebuild", help="清空后全量重建 (更换提供方 / 窗口时长时使用)")
+    p_rebuild.add_argument("--window", type=float, default=WINDOW_SECONDS, help="窗口时长 (秒)")
+    p_search = sub.add_parser("search", help="语义检索")
+    p_search.add_argument("query")
+    p_search.add_argument("--room", default=None)
+    p_search.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    provider = get_provider(args.provider)
+    index = VectorIndex(args.dir)
+    conn = transcript_archive.connect(args.db)
+
+    if args.cmd in ("update", "rebuild"):
+        if args.cmd == "rebuild":
+            index.clear()
+        t0 = time.time()
+        added = index.update(conn, provider, window_seconds=args.window)
+        print(f"✅ [向量] 新增 {added} 个窗口，共 {index.count()} 个，用时 {time.time() - t0:.1f}s")
+    elif args.cmd == "search":
+        t0 = time.time()
+        hits = semantic_search(conn, index, provider, args.query, top_k=args.top_k, room=args.room)
+        for h in hits:
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(h["wall_time"] or 0))
+            print(f"[{h['score']:.3f}] {when} 房间 {h['room']} | {h['record_file'] or '-'} "
+                  f"@ {transcript_archive.format_offset(h['start'])}-{transcript_archive.format_offset(h['end'])}")
+            for wall, _, text in h["lines"]:
+                print(f"    [{time.strftime('%H:%M:%S', time.localtime(wall or 0))}] {text}")
+        print(f"🔎 {len(hits)} 条命中，用时 {(time.time() - t0) * 1000:.0f}ms")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()